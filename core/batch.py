@@ -0,0 +1,187 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+import pandas as pd
+
+import core.schedule_parser as schedule_parser
+from core.headless import AutoAcceptRules, init_worker, load_state, plan_schedule
+from core.raptor import DEFAULT_MAX_RIDES
+from core.route_planner import DEFAULT_MAX_WALKING_DISTANCE, PLANNER_MODES
+
+SCHEDULE_EXTENSIONS = (".csv", ".txt")
+# Schedules submitted per worker ahead of the results, so a huge input is never held in memory at once
+JOBS_PER_WORKER = 4
+
+# Job = (schedule id, schedule rows or DataFrame or None, home or None, error message or None)
+Job = Tuple[str, Optional[Union[list, pd.DataFrame]], Optional[Dict[str, float]], Optional[str]]
+
+
+def iter_schedules(source: str) -> Iterator[Job]:
+    """
+    Reads schedules one at a time from a directory of schedule CSVs or from a JSONL file.
+    Each JSONL line is an object with a schedule list and optional id and home keys.
+    Unreadable inputs are yielded with an error instead of stopping the batch.
+    :param source: directory path or JSONL file path
+    :return: iterator of (schedule id, schedule DataFrame or rows, home, error)
+    """
+    if os.path.isdir(source):
+        for file_name in sorted(os.listdir(source)):
+            if not file_name.lower().endswith(SCHEDULE_EXTENSIONS):
+                continue
+            schedule_id = os.path.splitext(file_name)[0]
+            try:
+                yield schedule_id, schedule_parser.load_schedule_frame(os.path.join(source, file_name)), None, None
+            except Exception as e:
+                yield schedule_id, None, None, f"Could not load schedule: {e}"
+        return
+
+    with open(source, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield str(line_number), None, None, f"Invalid JSON on line {line_number}: {e}"
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get("schedule"), list):
+                yield str(line_number), None, None, f"Line {line_number} has no schedule list."
+                continue
+            yield str(record.get("id", line_number)), record["schedule"], record.get("home"), None
+
+
+def _plan_job(job: Job, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Plans one schedule inside a worker process; exceptions become errors on the result.
+    :param job: (schedule id, schedule rows, home, error) from iter_schedules
+    :param options: planner settings shared by the whole batch
+    :return: dict with id, status, plan, building_mapping and errors
+    """
+    schedule_id, schedule, home, error = job
+    if error is not None:
+        return {"id": schedule_id, "status": "failed", "plan": {}, "building_mapping": {}, "errors": [error]}
+
+    state = load_state()
+    try:
+        result = plan_schedule(schedule, state["gtfs_data"], state["building_index"],
+                               max_walking_distance=options["max_walking_distance"],
+                               max_rides=options["max_rides"],
+                               home=home or options["home"],
+                               mode=options["mode"],
+                               plan_cache=state["plan_cache"],
+                               rules=options["rules"],
+                               walking_times=state["walking_times"],
+                               travel_matrix=state["travel_matrix"])
+    except Exception as e:
+        result = {"plan": {}, "building_mapping": {}, "errors": [f"Planning failed: {e}"]}
+    status = "ok" if not result["errors"] else ("partial" if result["plan"] else "failed")
+    return {"id": schedule_id, "status": status, **result}
+
+
+def run_batch(source: str, output_path: str, workers: Optional[int] = None, rules: Optional[AutoAcceptRules] = None,
+              max_walking_distance: float = DEFAULT_MAX_WALKING_DISTANCE, max_rides: int = DEFAULT_MAX_RIDES,
+              home: Optional[Dict[str, float]] = None, mode: str = "raptor", gtfs_folder: str = "data/gtfs/",
+              cache_dir: Optional[str] = "data/cache/gtfs/",
+              buildings_path: str = "data/buildings.geojson") -> Dict[str, Any]:
+    """
+    Plans every schedule in a directory or JSONL file on a process pool and streams one JSON
+    line per schedule to the output file as soon as it is planned, so results are in completion order.
+    The timetable is loaded once before the pool forks and shared by every worker.
+    :param source: directory of schedule CSVs or JSONL file of schedules, see iter_schedules
+    :param output_path: JSONL file the results are written to
+    :param workers: planning processes, defaults to the CPU count
+    :param rules: AutoAcceptRules for fuzzy building matches
+    :param max_walking_distance: max walk to or from a stop in meters
+    :param max_rides: cap on the number of buses per journey
+    :param home: default origin of each day's first class, overridden by a schedule's own home
+    :param mode: "raptor" or "csa", see route_planner.plan_journeys
+    :param gtfs_folder: path to folder containing GTFS txt files
+    :param cache_dir: folder for the parsed feed snapshot
+    :param buildings_path: path to buildings JSON file
+    :return: dict with schedules, ok, partial and failed counts and elapsed seconds
+    """
+    if mode not in PLANNER_MODES:
+        raise ValueError(f"Unknown planner mode '{mode}'. Expected one of {PLANNER_MODES}.")
+
+    started = time.perf_counter()
+    load_state(gtfs_folder, cache_dir, buildings_path)
+    workers = workers or os.cpu_count() or 1
+    options = {
+        "max_walking_distance": max_walking_distance,
+        "max_rides": max_rides,
+        "home": home,
+        "mode": mode,
+        "rules": rules or AutoAcceptRules()
+    }
+    counts = {"schedules": 0, "ok": 0, "partial": 0, "failed": 0}
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+
+    with open(output_path, "w", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                initargs=(gtfs_folder, cache_dir, buildings_path)) as pool:
+
+        def write(done) -> None:
+            for future in done:
+                result = future.result()
+                counts["schedules"] += 1
+                counts[result["status"]] += 1
+                out.write(json.dumps(result, default=str) + "\n")
+            out.flush()
+
+        pending = set()
+        for job in iter_schedules(source):
+            pending.add(pool.submit(_plan_job, job, options))
+            if len(pending) >= workers * JOBS_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write(done)
+
+    counts["seconds"] = time.perf_counter() - started
+    return counts
+
+
+def _parse_home(value: Optional[str]) -> Optional[Dict[str, float]]:
+    if not value:
+        return None
+    lat, long = (float(part) for part in value.split(","))
+    return {"lat": lat, "long": long}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Plan many class schedules without prompts.")
+    parser.add_argument("source", help="directory of schedule CSVs or JSONL file of schedules")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file for per-schedule results")
+    parser.add_argument("--workers", type=int, default=None, help="planning processes (default: CPU count)")
+    parser.add_argument("--min-score", type=float, default=80.0, help="lowest fuzzy score accepted for a building")
+    parser.add_argument("--exact-only", action="store_true", help="reject fuzzy building matches")
+    parser.add_argument("--aliases", default=None, help="JSON file mapping user building names to official ones")
+    parser.add_argument("--max-walk", type=float, default=DEFAULT_MAX_WALKING_DISTANCE, help="meters")
+    parser.add_argument("--max-rides", type=int, default=DEFAULT_MAX_RIDES)
+    parser.add_argument("--home", default=None, help="default origin as 'lat,long'")
+    parser.add_argument("--mode", choices=PLANNER_MODES, default="raptor")
+    parser.add_argument("--gtfs", default="data/gtfs/", help="GTFS folder")
+    parser.add_argument("--cache-dir", default="data/cache/gtfs/", help="feed snapshot folder")
+    parser.add_argument("--buildings", default="data/buildings.geojson", help="buildings JSON file")
+    args = parser.parse_args(argv)
+
+    aliases = None
+    if args.aliases:
+        with open(args.aliases, "r", encoding="utf-8") as f:
+            aliases = json.load(f)
+    rules = AutoAcceptRules(args.min_score, not args.exact_only, aliases)
+
+    result = run_batch(args.source, args.output, args.workers, rules, args.max_walk, args.max_rides,
+                       _parse_home(args.home), args.mode, args.gtfs, args.cache_dir, args.buildings)
+    print(f"Planned {result['schedules']} schedules in {result['seconds']:.1f}s: "
+          f"{result['ok']} ok, {result['partial']} partial, {result['failed']} failed. Results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,133 @@
 import json
-from typing import List, Dict, Any
-from rapidfuzz import process
-def load_buildings(json_path: str = "data/buildings.geojson") -> list[Dict[str, Any]]:
+import os
+from collections.abc import Mapping
+from typing import Iterator, List, Dict, Any, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process, utils
+
+from utils.memo import cached_on
+
+BUILDING_FIELDS = ("name", "street_address", "lat", "long")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# (absolute path, mtime_ns) -> buildings loaded from that file in this process
+_loaded_buildings: Dict[Tuple[str, int], "BuildingList"] = {}
+
+
+class Building(Mapping):
+    """
+    Compact read-only building record. Uses __slots__ instead of a per-building dict but still
+    supports building["name"] and building.get("lat") like the dicts it replaces.
+    """
+    __slots__ = BUILDING_FIELDS
+
+    def __init__(self, name: Optional[str], street_address: Optional[str], lat: Optional[float], long: Optional[float]):
+        self.name = name
+        self.street_address = street_address
+        self.lat = lat
+        self.long = long
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in BUILDING_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(BUILDING_FIELDS)
+
+    def __len__(self) -> int:
+        return len(BUILDING_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"Building(name={self.name!r}, lat={self.lat!r}, long={self.long!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: plain dict of the building's fields, e.g. for json.dumps
+        """
+        return {field: getattr(self, field) for field in BUILDING_FIELDS}
+
+
+class BuildingList(list):
+    """
+    List of Building records returned by load_buildings. A list subclass so derived lookups
+    such as the BuildingIndex can be cached against it.
+    """
+
+
+def load_buildings(json_path: str = "data/buildings.geojson") -> "BuildingList":
     """
     Load campus buildings data from JSON/GeoJSON.
+    The file is parsed one building at a time and only name, address and coordinates are kept.
+    Results are cached per process, so repeated calls return the same object until the file changes.
     :param json_path: path to buildings JSON file
-    :return: list of building info dicts with name, address, and coordinates
+    :return: list of building records with name, address, and coordinates
     """
     try:
-        with open(json_path, "r") as f:
-            data = json.load(f)
+        key = (os.path.abspath(json_path), os.stat(json_path).st_mtime_ns)
     except FileNotFoundError:
         raise FileNotFoundError(f"Building data file not found: {json_path}")
-    updated_building_info = get_building_info(data)
-    return updated_building_info
 
-def get_building_info(buildings_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    buildings = _loaded_buildings.get(key)
+    if buildings is None:
+        with open(json_path, "r") as f:
+            buildings = BuildingList(get_building_info(iter_json_array(f)))
+        _loaded_buildings.clear()
+        _loaded_buildings[key] = buildings
+    return buildings
+
+def iter_json_array(f, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Incrementally decodes a top-level JSON array, yielding one element at a time so only the
+    current element and a read buffer are held in memory.
+    :param f: text file object positioned at the start of the array
+    :param chunk_size: characters read per refill of the buffer
+    :return: generator of decoded array elements
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skip whitespace and the separators between elements
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+            if buffer[pos] == "[":
+                started = True
+            elif buffer[pos] == "]":
+                return
+            pos += 1
+
+        if pos < len(buffer) and started:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                yield element
+                pos = end
+                continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif pos < len(buffer):
+            raise ValueError("Building data must be a JSON array")
+        elif eof:
+            if not started:
+                raise ValueError("Building data must be a JSON array")
+            raise ValueError("Building data ended before the closing ']'")
+
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def get_building_info(buildings_data) -> List[Building]:
     """
     Extracts a list of a buildings geo info, such as name, street address and coordinates
-    :param buildings_data: list of all buildings from loaded buildings.geojson
-    :return: list of dicts with keys: name, street_address, lat, lon
+    :param buildings_data: iterable of all buildings from loaded buildings.geojson
+    :return: list of Building records with keys: name, street_address, lat, long
     """
     results = []
     for building in buildings_data:
@@ -30,76 +138,149 @@ def get_building_info(buildings_data: List[Dict[str, Any]]) -> List[Dict[str, An
             lat, lon = latlng[0], latlng[1]
         else:
             lat, lon = None, None
-        results.append({
-            "name": name,
-            "street_address": street_address,
-            "lat": lat,
-            "long": lon
-        })
+        results.append(Building(name, street_address, lat, lon))
     return results
 
-def get_building_coordinates(building_name: str, buildings_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+class BuildingIndex:
     """
-    Retrieve lat/lng coordinates for a given building using fuzzy name matching.
-    :param building_name: user-input building name
-    :param buildings_data: list of building dictionaries
-    :return: dict with name, lat, lon or None if not found
+    Lookup structure built once from load_buildings() output.
+
+    Holds a normalized-name hash map for exact lookups and the rapidfuzz choice list, so fuzzy
+    matching a batch of user names is a single cdist call over all pairs.
     """
-    query = building_name.lower().strip()
 
-    for building in buildings_data:
-        if building.get("name") and building["name"].lower() == query:
-            if building.get("lat") and building.get("long"):
-                return {"lat": building["lat"], "long": building["long"]}
+    def __init__(self, buildings_data: List[Dict[str, Any]]):
+        """
+        :param buildings_data: list of building dicts with name, lat and long keys
+        """
+        self.buildings = buildings_data
+        self.names = [building["name"] for building in buildings_data if building.get("name")]
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        for building in buildings_data:
+            if building.get("name"):
+                self.by_name.setdefault(normalize_building_name(building["name"]), building)
+        # Names are preprocessed once here rather than by cdist on every match call
+        self.choices = [utils.default_process(name) for name in self.names]
+        self._frame: Optional[pd.DataFrame] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get(self, building_name: str) -> Optional[Dict[str, Any]]:
+        """
+        :param building_name: building name in any case, surrounding whitespace ignored
+        :return: the building dict with that exact name, or None
+        """
+        return self.by_name.get(normalize_building_name(building_name))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        :return: DataFrame of lat and long indexed by official building name, one row per name,
+        built on first use and used to join coordinates onto whole schedules at once
+        """
+        if self._frame is None:
+            rows = {}
+            for building in self.buildings:
+                if building.get("name"):
+                    rows.setdefault(building["name"], (building.get("lat"), building.get("long")))
+            self._frame = pd.DataFrame(list(rows.values()), index=pd.Index(list(rows), name="name"),
+                                       columns=["lat", "long"], dtype="float64")
+        return self._frame
+
+    def coordinates(self, building_name: str) -> Dict[str, Any]:
+        """
+        :param building_name: official building name
+        :return: dict with lat and long, or with an error message, like get_building_coordinates
+        """
+        building = self.get(building_name)
+        if building is None:
+            return {"error": "No matching building found."}
+        if building.get("lat") and building.get("long"):
+            return {"lat": building["lat"], "long": building["long"]}
+        return {"error": "Coordinates not available for this building."}
+
+    def match(self, user_buildings: List[str], limit: int = 5, score_cutoff: float = 80) -> Dict[str, Any]:
+        """
+        Matches user names against every building at once: exact hits come from the hash map,
+        and all remaining names are scored against all buildings in one cdist call. Names on both
+        sides go through rapidfuzz's default_process, so case and punctuation do not lower the score.
+        :param user_buildings: list of raw user-entered building names
+        :param limit: number of fuzzy candidates kept per name
+        :param score_cutoff: minimum score for the best candidate to count as a match
+        :return: dict with 'exact_matches', 'best_matches', 'suggestions', and 'unmatched'
+        """
+        exact_matches = {}
+        best_matches = {}
+        suggestions = {}
+        unmatched = []
+
+        fuzzy_queries = []
+        for user_building in user_buildings:
+            building = self.get(user_building)
+            if building is not None:
+                exact_matches[user_building] = building["name"]
             else:
-                return {"error": "Coordinates not available for this building."}
+                fuzzy_queries.append(user_building)
+
+        if fuzzy_queries and self.choices:
+            queries = [utils.default_process(user_building) for user_building in fuzzy_queries]
+            scores = process.cdist(queries, self.choices, scorer=fuzz.WRatio, processor=None,
+                                   dtype=np.float64, workers=-1)
+            top = np.argsort(-scores, axis=1, kind="stable")[:, :limit]
+            for row, user_building in enumerate(fuzzy_queries):
+                best = top[row]
+                if scores[row, best[0]] >= score_cutoff:
+                    best_matches[user_building] = self.names[best[0]]
+                    suggestions[user_building] = [self.names[i] for i in best[1:]]
+                else:
+                    unmatched.append(user_building)
+        else:
+            unmatched.extend(fuzzy_queries)
+
+        return {
+            "exact_matches": exact_matches,
+            "best_matches": best_matches,
+            "suggestions": suggestions,
+            "unmatched": unmatched
+        }
 
-    return {"error": "No matching building found."}
 
-def match_building_names(user_buildings: List[str], buildings_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+def normalize_building_name(building_name: str) -> str:
+    """
+    :param building_name: building name as typed or as listed in buildings.geojson
+    :return: lowercase name without surrounding whitespace, used as the exact-match key
+    """
+    return building_name.strip().lower()
+
+def get_building_index(buildings_data: Union[List[Dict[str, Any]], BuildingIndex]) -> BuildingIndex:
+    """
+    :param buildings_data: list of building dictionaries or an existing BuildingIndex
+    :return: a BuildingIndex over the buildings, shared per process for lists from load_buildings
+    """
+    if isinstance(buildings_data, BuildingIndex):
+        return buildings_data
+    if isinstance(buildings_data, BuildingList):
+        return cached_on(buildings_data, "building_index", BuildingIndex)
+    return BuildingIndex(buildings_data)
+
+def get_building_coordinates(building_name: str,
+                             buildings_data: Union[List[Dict[str, Any]], BuildingIndex]) -> Dict[str, Any]:
+    """
+    Retrieve lat/lng coordinates for a given building using fuzzy name matching.
+    Pass a BuildingIndex when looking up many buildings so the name map is only built once.
+    :param building_name: user-input building name
+    :param buildings_data: list of building dictionaries or a BuildingIndex
+    :return: dict with name, lat, lon or None if not found
+    """
+    return get_building_index(buildings_data).coordinates(building_name)
+
+def match_building_names(user_buildings: List[str],
+                         buildings_data: Union[List[Dict[str, Any]], BuildingIndex]) -> Dict[str, Any]:
     """
     Matches user input building names to valid campus building names pulled from map.wisc.edu.
 
     :param user_buildings: list of raw user-entered building names
-    :param buildings_data: list of building objects with "name" field from buildings.geojson
+    :param buildings_data: list of building objects with "name" field from buildings.geojson, or a BuildingIndex
     :return: dict with 'exact_matches', 'best_matches', 'suggestions', and 'unmatched' to be used by cli.py
     """
-    building_names = []
-    for building in buildings_data:
-        if "name" in building and building["name"]:
-            building_names.append(building["name"])
-
-    exact_matches = {}
-    best_matches = {}
-    suggestions = {}
-    unmatched = []
-
-    for user_building in user_buildings:
-        match_found = False
-
-        for official_name in building_names:
-            if user_building.strip().lower() == official_name.strip().lower():
-                exact_matches[user_building] = official_name
-                match_found = True
-                break
-
-        if not match_found:
-            fuzzy_matches = process.extract(user_building, building_names, limit=5)
-
-            if len(fuzzy_matches) > 0 and fuzzy_matches[0][1] >= 80:
-                best_match = fuzzy_matches[0][0]
-                best_matches[user_building] = best_match
-
-                suggestion_list = []
-                for match in fuzzy_matches[1:]:
-                        suggestion_list.append(match[0])
-                suggestions[user_building] = suggestion_list
-            else:
-                unmatched.append(user_building)
-
-    return {
-        "exact_matches": exact_matches,
-        "best_matches": best_matches,
-        "suggestions": suggestions,
-        "unmatched": unmatched
-    }
+    return get_building_index(buildings_data).match(user_buildings)
@@ -0,0 +1,57 @@
+import http.client
+import json
+from typing import Any, Dict, List, Optional
+
+from core.server import DEFAULT_HOST, DEFAULT_PORT
+
+
+class PlannerClient:
+    """
+    Small client for the planning service in core.server, reusing one keep-alive connection.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 60.0):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        result = json.loads(response.read() or b"{}")
+        if response.status != 200:
+            raise RuntimeError(f"{method} {path} failed with {response.status}: {result.get('error')}")
+        return result
+
+    def health(self) -> Dict[str, Any]:
+        return self._request("GET", "/health")
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request("GET", "/stats")
+
+    def plan(self, schedule: List[Dict[str, Any]], home: Optional[Dict[str, float]] = None,
+             max_walking_distance: float = 800.0, max_rides: int = 3, mode: str = "raptor") -> Dict[str, Any]:
+        """
+        :param schedule: list of class dicts with course_code, day, start_time, end_time and building
+        :param home: optional dict with lat/long keys used as the origin of each day's first class
+        :param max_walking_distance: max walk to or from a stop in meters
+        :param max_rides: cap on the number of buses per journey
+        :param mode: "raptor" or "csa"
+        :return: dict with plan, building_mapping and errors
+        """
+        return self._request("POST", "/plan", {
+            "schedule": schedule,
+            "home": home,
+            "max_walking_distance": max_walking_distance,
+            "max_rides": max_rides,
+            "mode": mode
+        })
+
+    def reload(self) -> Dict[str, Any]:
+        """
+        :return: summary of the feed diff applied by the service
+        """
+        return self._request("POST", "/reload")
+
+    def close(self) -> None:
+        self.connection.close()
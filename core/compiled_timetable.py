@@ -0,0 +1,374 @@
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.footpaths import DEFAULT_TRANSFER_RADIUS_M, Footpaths, get_footpaths, precompute_footpaths
+from core.gtfs_parser import RoutePattern, RoutePatternList, get_active_service_ids, get_route_patterns
+from core.service_calendar import WEEKDAYS
+from core.timetable import TimetableIndex, get_timetable_index
+from utils.memo import cached_on, peek_cached
+
+MAGIC = b"CTTB"
+# Bump whenever the array set, dtypes or header layout change
+COMPILED_VERSION = 2
+# Arrays start on cache-line boundaries so every view is aligned for its dtype
+ALIGNMENT = 64
+# magic, format version, header length
+PREAMBLE = struct.Struct("<4sIQ")
+
+
+# Columns of the zero-row stop_times table routing-only loads carry instead of the real one
+STOP_TIMES_COLUMNS = ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"]
+
+
+class SortedPositions(Mapping):
+    """
+    Read-only key -> position mapping over a sorted string array and the positions of its entries,
+    both views into the mapped file. Each lookup is a binary search, so a process opening the file
+    does not build a dict with one entry per trip.
+    """
+
+    def __init__(self, sorted_keys: np.ndarray, positions: np.ndarray):
+        """
+        :param sorted_keys: keys in ascending order
+        :param positions: position of each sorted key in the original order
+        """
+        self.sorted_keys = sorted_keys
+        self.positions = positions
+
+    def __getitem__(self, key: str) -> int:
+        i = int(np.searchsorted(self.sorted_keys, key))
+        if i < len(self.sorted_keys) and self.sorted_keys[i] == key:
+            return int(self.positions[i])
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (str(key) for key in self.sorted_keys)
+
+    def __len__(self) -> int:
+        return len(self.sorted_keys)
+
+
+def compiled_timetable_path(cache_dir: str, transfer_radius: float = DEFAULT_TRANSFER_RADIUS_M) -> str:
+    """
+    :param cache_dir: feed snapshot folder
+    :param transfer_radius: max transfer walk in meters of the footpaths compiled in
+    :return: path of the compiled timetable for that radius
+    """
+    return os.path.join(cache_dir, f"timetable-{transfer_radius:g}m.bin")
+
+
+def _string_array(values) -> np.ndarray:
+    # Fixed-width unicode so the column can live in the file; object arrays cannot be memory-mapped
+    array = np.asarray([str(value) for value in values], dtype=str)
+    return array if array.dtype.itemsize else array.astype("U1")
+
+
+def _pattern_arrays(patterns: RoutePatternList, timetable: TimetableIndex,
+                    route_code: Dict[str, int]) -> Dict[str, np.ndarray]:
+    """
+    Flattens one day's patterns into CSR arrays: stops and trip rows per pattern, and the
+    (trips x stops) time matrices laid end to end.
+    :return: dict of array name -> array
+    """
+    stop_offsets = np.zeros(len(patterns) + 1, dtype=np.int64)
+    trip_offsets = np.zeros(len(patterns) + 1, dtype=np.int64)
+    time_offsets = np.zeros(len(patterns) + 1, dtype=np.int64)
+    for p, pattern in enumerate(patterns):
+        stop_offsets[p + 1] = stop_offsets[p] + len(pattern.stops)
+        trip_offsets[p + 1] = trip_offsets[p] + len(pattern)
+        time_offsets[p + 1] = time_offsets[p] + pattern.arrivals.size
+
+    def concat(arrays: List[np.ndarray], dtype) -> np.ndarray:
+        return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+    return {
+        "pattern_routes": np.array([route_code[pattern.route_id] for pattern in patterns], dtype=np.int32),
+        "stop_offsets": stop_offsets,
+        "stops": concat([pattern.stops for pattern in patterns], np.int32),
+        "trip_offsets": trip_offsets,
+        "trip_rows": np.array([timetable.trip_position[str(trip_id)] for pattern in patterns
+                               for trip_id in pattern.trip_ids], dtype=np.int32),
+        "time_offsets": time_offsets,
+        "arrivals": concat([pattern.arrivals.ravel() for pattern in patterns], np.int64),
+        "departures": concat([pattern.departures.ravel() for pattern in patterns], np.int64)
+    }
+
+
+def compile_timetable(gtfs_data: Dict[str, pd.DataFrame], path: str, fingerprint: str,
+                      transfer_radius: float = DEFAULT_TRANSFER_RADIUS_M, days: List[str] = WEEKDAYS) -> None:
+    """
+    Writes everything the planners derive from the feed into one file of flat arrays behind a
+    small JSON header: stops, trips, stop_times seconds in CSR order, footpaths, per-service
+    weekday bitsets and each day's route patterns. Days running the same set of services share
+    one copy of the patterns.
+    :param gtfs_data: loaded GTFS dataset
+    :param path: file to write, replaced atomically
+    :param fingerprint: fingerprint of the feed the arrays are built from
+    :param transfer_radius: max transfer walk in meters of the compiled footpaths
+    :param days: service days whose patterns are compiled
+    """
+    timetable = get_timetable_index(gtfs_data["stop_times"])
+    foot_offsets, foot_targets, foot_secs = get_footpaths(gtfs_data, transfer_radius)
+
+    trips_df = gtfs_data["trips"]
+    trip_keys = trips_df["trip_id"].astype(str)
+    empty = pd.Series("", index=trips_df.index)
+    headsigns = dict(zip(trip_keys, trips_df.get("trip_headsign", empty).fillna("").astype(str)))
+    direction_names = dict(zip(trip_keys, trips_df.get("trip_direction_name", empty).fillna("").astype(str)))
+    trip_ids = [str(trip_id) for trip_id in timetable.trip_ids]
+    trip_order = np.argsort(_string_array(trip_ids), kind="stable")
+
+    service_ids = sorted(trips_df["service_id"].astype(str).unique())
+    service_code = {service_id: i for i, service_id in enumerate(service_ids)}
+    service_days = np.zeros(len(service_ids), dtype=np.uint8)
+
+    arrays = {
+        "stop_ids": _string_array(timetable.stop_id_values),
+        "trip_ids": _string_array(trip_ids),
+        "sorted_trip_ids": _string_array(trip_ids[i] for i in trip_order),
+        "sorted_trip_positions": trip_order.astype(np.int32),
+        "trip_headsigns": _string_array(headsigns.get(trip_id, "") for trip_id in trip_ids),
+        "trip_direction_names": _string_array(direction_names.get(trip_id, "") for trip_id in trip_ids),
+        "trip_offsets": np.asarray(timetable.trip_offsets, dtype=np.int64),
+        "stop_codes": np.asarray(timetable.stop_codes, dtype=np.int32),
+        "stop_sequences": np.asarray(timetable.stop_sequences, dtype=np.int32),
+        "arrival_secs": np.asarray(timetable.arrival_secs, dtype=np.int32),
+        "departure_secs": np.asarray(timetable.departure_secs, dtype=np.int32),
+        "foot_offsets": np.asarray(foot_offsets, dtype=np.int64),
+        "foot_targets": np.asarray(foot_targets, dtype=np.int32),
+        "foot_secs": np.asarray(foot_secs, dtype=np.int32),
+        "service_ids": _string_array(service_ids),
+        "service_days": service_days
+    }
+
+    day_sources = {}
+    layer_of_services = {}
+    day_patterns = {}
+    for bit, day in enumerate(WEEKDAYS):
+        active = tuple(sorted(str(s) for s in get_active_service_ids(day, gtfs_data["calendar"])))
+        for service_id in active:
+            if service_id in service_code:
+                service_days[service_code[service_id]] |= 1 << bit
+        if day not in days:
+            continue
+        if active not in layer_of_services:
+            layer_of_services[active] = day
+            day_patterns[day] = get_route_patterns(gtfs_data, day)
+        day_sources[day] = layer_of_services[active]
+
+    route_ids = sorted({pattern.route_id for patterns in day_patterns.values() for pattern in patterns})
+    route_code = {route_id: i for i, route_id in enumerate(route_ids)}
+    arrays["route_ids"] = _string_array(route_ids)
+    for day, patterns in day_patterns.items():
+        for name, array in _pattern_arrays(patterns, timetable, route_code).items():
+            arrays[f"{day}/{name}"] = array
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = json.dumps({
+        "version": COMPILED_VERSION,
+        "fingerprint": fingerprint,
+        "transfer_radius": float(transfer_radius),
+        "days": day_sources,
+        "arrays": layout
+    }).encode()
+    # Array offsets are relative to the first aligned byte after the header
+    data_start = -(-(PREAMBLE.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, COMPILED_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+class CompiledTimetable:
+    """
+    Read-only view of a file written by compile_timetable.
+
+    The file is memory-mapped once and every array is a view into the mapping, so any number of
+    processes opening the same file share its physical pages, and opening it costs a header read.
+    Trip and stop ids stay fixed-width strings inside the mapping, and trip lookups binary-search a
+    sorted copy, so no per-process object arrays or dicts are built. The feed tables still come from
+    the snapshot, see gtfs_parser.load_gtfs_files for loading without stop_times.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: compiled timetable file
+        """
+        with open(path, "rb") as f:
+            magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != COMPILED_VERSION:
+                raise ValueError(f"{path} is not a version {COMPILED_VERSION} compiled timetable")
+            header = json.loads(f.read(header_length))
+
+        self.path = path
+        self.fingerprint = header["fingerprint"]
+        self.transfer_radius = header["transfer_radius"]
+        self.days: Dict[str, str] = header["days"]
+        self.layout = header["arrays"]
+        self._data_start = -(-(PREAMBLE.size + header_length) // ALIGNMENT) * ALIGNMENT
+        self._mmap = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def array(self, name: str) -> np.ndarray:
+        """
+        :param name: array name, e.g. "stop_codes" or "monday/arrivals"
+        :return: read-only view of the array inside the mapped file
+        """
+        spec = self.layout[name]
+        return np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=self._mmap,
+                          offset=self._data_start + spec["offset"])
+
+    def timetable_index(self) -> TimetableIndex:
+        """
+        :return: TimetableIndex whose row arrays are views into the file
+        """
+        return TimetableIndex.from_arrays(
+            self.array("trip_ids"), self.array("trip_offsets"), self.array("stop_ids"),
+            self.array("stop_codes"), self.array("stop_sequences"),
+            self.array("arrival_secs"), self.array("departure_secs"),
+            trip_position=SortedPositions(self.array("sorted_trip_ids"), self.array("sorted_trip_positions")))
+
+    def stop_times_stub(self) -> pd.DataFrame:
+        """
+        :return: zero-row stop_times table standing in for the real one in routing-only loads; the
+        derived structures are cached on it, and its attrs name the file they come from
+        """
+        stub = pd.DataFrame({column: pd.Series(dtype=object) for column in STOP_TIMES_COLUMNS})
+        stub.attrs["compiled_timetable"] = self.path
+        return stub
+
+    def footpaths(self) -> Footpaths:
+        """
+        :return: CSR tuple of (offsets per stop code, neighbour stop codes, walk seconds)
+        """
+        return self.array("foot_offsets"), self.array("foot_targets"), self.array("foot_secs")
+
+    def services_on_weekday(self, day_of_week: str) -> np.ndarray:
+        """
+        :param day_of_week: "monday", "tuesday", etc.
+        :return: service_ids whose weekday bit is set
+        """
+        bit = 1 << WEEKDAYS.index(day_of_week.lower())
+        return self.array("service_ids")[(self.array("service_days") & bit) != 0]
+
+    def route_patterns(self, day_of_week: str) -> Optional[RoutePatternList]:
+        """
+        :param day_of_week: "monday", "tuesday", etc.
+        :return: RoutePatternList whose stops and time matrices are views into the file,
+        or None if the day was not compiled
+        """
+        source = self.days.get(day_of_week.lower())
+        if source is None:
+            return None
+        trip_ids = self.array("trip_ids")
+        headsigns = self.array("trip_headsigns")
+        direction_names = self.array("trip_direction_names")
+        route_ids = self.array("route_ids")
+        routes = self.array(f"{source}/pattern_routes")
+        stop_offsets = self.array(f"{source}/stop_offsets")
+        stops = self.array(f"{source}/stops")
+        trip_offsets = self.array(f"{source}/trip_offsets")
+        trip_rows = self.array(f"{source}/trip_rows")
+        time_offsets = self.array(f"{source}/time_offsets")
+        arrivals = self.array(f"{source}/arrivals")
+        departures = self.array(f"{source}/departures")
+
+        patterns = []
+        for p in range(len(routes)):
+            pattern_stops = stops[stop_offsets[p]:stop_offsets[p + 1]]
+            rows = trip_rows[trip_offsets[p]:trip_offsets[p + 1]]
+            shape = (len(rows), len(pattern_stops))
+            patterns.append(RoutePattern(
+                route_id=str(route_ids[routes[p]]),
+                stops=pattern_stops,
+                trip_ids=trip_ids[rows],
+                headsigns=headsigns[rows],
+                direction_names=direction_names[rows],
+                arrivals=arrivals[time_offsets[p]:time_offsets[p + 1]].reshape(shape),
+                departures=departures[time_offsets[p]:time_offsets[p + 1]].reshape(shape)
+            ))
+        return RoutePatternList(patterns)
+
+
+def load_compiled_timetable(path: str, fingerprint: str) -> Optional[CompiledTimetable]:
+    """
+    :param path: compiled timetable file
+    :param fingerprint: fingerprint of the feed currently on disk
+    :return: CompiledTimetable, or None if missing, unreadable or built from another feed
+    """
+    try:
+        compiled = CompiledTimetable(path)
+    except (FileNotFoundError, ValueError, KeyError, struct.error):
+        return None
+    return compiled if compiled.fingerprint == fingerprint else None
+
+
+def attach_compiled_timetable(gtfs_data: Dict[str, pd.DataFrame], compiled: CompiledTimetable) -> None:
+    """
+    Registers the compiled arrays as the timetable index, footpaths and route patterns of a loaded
+    feed, so the planners use the shared mapping instead of building private copies.
+    :param gtfs_data: loaded GTFS dataset the file was compiled from
+    :param compiled: CompiledTimetable for the same feed
+    :raises ValueError: if any of those structures was already built for this feed, since the
+    planners would keep using the private copy
+    """
+    stop_times_df = gtfs_data["stop_times"]
+    names = ["timetable_index", f"footpaths:{compiled.transfer_radius:g}"]
+    names += [f"route_patterns:{day}" for day in compiled.days]
+    built = [name for name in names if peek_cached(stop_times_df, name) is not None]
+    if built:
+        raise ValueError(f"Cannot attach {compiled.path}: {', '.join(built)} already built for this feed")
+    cached_on(stop_times_df, "timetable_index", lambda _: compiled.timetable_index())
+    cached_on(stop_times_df, f"footpaths:{compiled.transfer_radius:g}", lambda _: compiled.footpaths())
+    by_source = {}
+    for day, source in compiled.days.items():
+        if source not in by_source:
+            by_source[source] = compiled.route_patterns(source)
+        # Days sharing a layer share the mapped arrays but each gets its own list, so a delay overlay
+        # or RAPTOR index changing one day's slots leaves the other days alone
+        cached_on(stop_times_df, f"route_patterns:{day}",
+                  lambda _, source=source: RoutePatternList(list(by_source[source])))
+
+
+def precompute_compiled_timetable(gtfs_data: Dict[str, pd.DataFrame], cache_dir: str, fingerprint: str,
+                                  transfer_radius: float = DEFAULT_TRANSFER_RADIUS_M) -> Optional[CompiledTimetable]:
+    """
+    Build step run at feed load: maps the compiled timetable saved with the feed snapshot, or
+    compiles it from the loaded tables first.
+    :param gtfs_data: loaded GTFS dataset
+    :param cache_dir: feed snapshot folder
+    :param fingerprint: fingerprint of the feed currently on disk
+    :param transfer_radius: max transfer walk in meters
+    :return: the attached CompiledTimetable, or None if it could not be written
+    """
+    path = compiled_timetable_path(cache_dir, transfer_radius)
+    compiled = load_compiled_timetable(path, fingerprint)
+    if compiled is None:
+        precompute_footpaths(gtfs_data, cache_dir, fingerprint, transfer_radius)
+        try:
+            compile_timetable(gtfs_data, path, fingerprint, transfer_radius)
+        except OSError as e:
+            print(f"Could not write compiled timetable to {cache_dir}: {e}")
+            return None
+        # This process already holds the structures it compiled from; later processes map the file
+        return CompiledTimetable(path)
+    if peek_cached(gtfs_data["stop_times"], "timetable_index") is None:
+        # A reload back to a compiled feed keeps the structures it already patched from the old one
+        attach_compiled_timetable(gtfs_data, compiled)
+    return compiled
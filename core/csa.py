@@ -0,0 +1,385 @@
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.gtfs_parser import get_active_service_ids, filter_trips_by_service
+from core.footpaths import get_footpaths
+from core.raptor import summarize_legs
+from core.timetable import NO_TIME, get_timetable_index
+from utils.memo import cached_on
+
+UNREACHABLE = np.iinfo(np.int64).min
+UNREACHED = np.iinfo(np.int64).max
+# Larger than any GTFS time of day, so adding trip * offset keeps every trip's times in its own band
+_TRIP_TIME_BAND = 10 ** 6
+
+
+class ConnectionTable:
+    """
+    Connection Scan Algorithm (CSA) over the elementary connections of one service day.
+
+    Every pair of consecutive stops on an active trip is one connection. Connections are
+    stored once as flat arrays sorted by departure time, latest first, so an arrive-by query
+    is a single backward scan: for each stop, track the latest time one can be there and
+    still reach the destination in time.
+    """
+
+    def __init__(self, gtfs_data: Dict[str, pd.DataFrame], day_of_week: str,
+                 transfer_radius: Optional[float] = None):
+        """
+        :param gtfs_data: loaded GTFS dataset
+        :param day_of_week: "monday", "tuesday", etc.
+        :param transfer_radius: max walking transfer between stops in meters, by default the radius the
+        feed was loaded with, see footpaths.get_transfer_radius
+        """
+        timetable = get_timetable_index(gtfs_data["stop_times"])
+        self.stop_id_values = timetable.stop_id_values
+        self.stop_code = {str(stop_id): code for code, stop_id in enumerate(self.stop_id_values)}
+        self.n_stops = len(self.stop_id_values)
+
+        trips_df = gtfs_data["trips"]
+        self.trip_ids = timetable.trip_ids
+        trip_routes = dict(zip(trips_df["trip_id"].astype(str), trips_df["route_id"].astype(str)))
+        self.trip_route_ids = np.array([trip_routes.get(str(trip_id)) for trip_id in self.trip_ids], dtype=object)
+
+        active_services = get_active_service_ids(day_of_week, gtfs_data["calendar"])
+        active_mask = np.zeros(len(timetable), dtype=bool)
+        for trip_id in filter_trips_by_service(trips_df, active_services):
+            pos = timetable.trip_position.get(str(trip_id))
+            if pos is not None:
+                active_mask[pos] = True
+
+        row_trip = np.repeat(np.arange(len(timetable), dtype=np.int64), np.diff(timetable.trip_offsets))
+        arrivals = self._fill_missing_times(timetable.arrival_secs, row_trip)
+        departures = self._fill_missing_times(timetable.departure_secs, row_trip)
+
+        rows = np.flatnonzero((row_trip[:-1] == row_trip[1:]) & active_mask[row_trip[:-1]])
+        rows = rows[(departures[rows] != NO_TIME) & (arrivals[rows + 1] != NO_TIME)]
+        # Ties on departure go latest arrival first, then later stops first, so a zero-minute hop is
+        # always scanned after the connection it feeds into
+        order = np.lexsort((-rows, -arrivals[rows + 1], -departures[rows]))
+        rows = rows[order]
+
+        self.timetable = timetable
+        self.active_mask = active_mask
+        self.rows = rows
+        self.dep_stop = timetable.stop_codes[rows]
+        self.arr_stop = timetable.stop_codes[rows + 1]
+        self.dep_secs = departures[rows].astype(np.int32)
+        self.arr_secs = arrivals[rows + 1].astype(np.int32)
+        self.trip = row_trip[rows].astype(np.int32)
+
+        self.foot_offsets, self.foot_targets, self.foot_secs = get_footpaths(gtfs_data, transfer_radius)
+
+    @staticmethod
+    def _fill_missing_times(times: np.ndarray, row_trip: np.ndarray) -> np.ndarray:
+        # Carry the previous stop's time into non-timepoint rows without leaking across trips
+        banded = np.where(times != NO_TIME, times.astype(np.int64) + row_trip * _TRIP_TIME_BAND,
+                          row_trip * _TRIP_TIME_BAND - 1)
+        return np.maximum.accumulate(banded) - row_trip * _TRIP_TIME_BAND
+
+    def __len__(self) -> int:
+        return len(self.dep_secs)
+
+    @staticmethod
+    def _scan_key(dep_secs: np.ndarray, arr_secs: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        # One int64 per connection that increases along the scan order (see the lexsort in __init__)
+        return -((dep_secs.astype(np.int64) << 45) | (arr_secs.astype(np.int64) << 27) | rows.astype(np.int64))
+
+    def replace_trip_times(self, trip_times: Dict[int, Tuple[np.ndarray, np.ndarray]]) -> None:
+        """
+        Swaps in new stop times for a few trips, e.g. from a delay overlay, without rebuilding the table:
+        their connections are dropped and the new ones merged back in at their place in the scan order.
+        :param trip_times: dict of trip position -> (arrival seconds, departure seconds) for every stop
+        of the trip, NO_TIME where the stop has no time; trips not active on this day are ignored
+        """
+        trips = np.array([trip for trip in trip_times if self.active_mask[trip]], dtype=np.int64)
+        if not len(trips):
+            return
+        keep = ~np.isin(self.trip, trips)
+        new_rows, new_dep, new_arr = [], [], []
+        for trip in trips.tolist():
+            start, end = int(self.timetable.trip_offsets[trip]), int(self.timetable.trip_offsets[trip + 1])
+            row_trip = np.zeros(end - start, dtype=np.int64)
+            arrivals = self._fill_missing_times(np.asarray(trip_times[trip][0]), row_trip)
+            departures = self._fill_missing_times(np.asarray(trip_times[trip][1]), row_trip)
+            hops = np.flatnonzero((departures[:-1] != NO_TIME) & (arrivals[1:] != NO_TIME))
+            new_rows.append(hops + start)
+            new_dep.append(departures[hops])
+            new_arr.append(arrivals[hops + 1])
+
+        rows = np.concatenate(new_rows)
+        dep_secs = np.concatenate(new_dep).astype(np.int32)
+        arr_secs = np.concatenate(new_arr).astype(np.int32)
+        order = np.argsort(self._scan_key(dep_secs, arr_secs, rows), kind="stable")
+        rows, dep_secs, arr_secs = rows[order], dep_secs[order], arr_secs[order]
+
+        kept_rows = self.rows[keep]
+        at = np.searchsorted(self._scan_key(self.dep_secs[keep], self.arr_secs[keep], kept_rows),
+                             self._scan_key(dep_secs, arr_secs, rows))
+        self.rows = np.insert(kept_rows, at, rows)
+        self.dep_stop = np.insert(self.dep_stop[keep], at, self.timetable.stop_codes[rows])
+        self.arr_stop = np.insert(self.arr_stop[keep], at, self.timetable.stop_codes[rows + 1])
+        self.dep_secs = np.insert(self.dep_secs[keep], at, dep_secs)
+        self.arr_secs = np.insert(self.arr_secs[keep], at, arr_secs)
+        trip_of_rows = np.searchsorted(self.timetable.trip_offsets, rows, side="right") - 1
+        self.trip = np.insert(self.trip[keep], at, trip_of_rows.astype(np.int32))
+
+    def latest_departure(self, access: Dict[int, int], egress: Dict[int, int],
+                         arrive_by_secs: int) -> Optional[Dict[str, Any]]:
+        """
+        Finds the latest time to leave the origin and still reach the destination by arrive_by_secs.
+        :param access: dict of stop code -> walking seconds from the origin to that stop
+        :param egress: dict of stop code -> walking seconds from that stop to the destination
+        :param arrive_by_secs: latest acceptable arrival at the destination, in seconds
+        :return: journey dict like RaptorData.query returns, or None if nothing arrives in time
+        """
+        # latest[stop]: latest departure from stop that still reaches the destination, on foot or by bus.
+        # latest_board[stop]: the same restricted to boarding a bus there, which is what the origin is
+        # credited with, so an access stop already reachable on foot from the destination side still counts.
+        latest = np.full(self.n_stops, UNREACHABLE, dtype=np.int64)
+        latest_board = np.full(self.n_stops, UNREACHABLE, dtype=np.int64)
+        # Parents are ("egress", walk), ("board", connection) or ("walk", to_stop, walk, parent at to_stop);
+        # a walk carries the parent it continues with, so walks are never chained through a stop
+        stop_parent: Dict[int, tuple] = {}
+        for code, walk_secs in egress.items():
+            if arrive_by_secs - walk_secs > latest[code]:
+                latest[code] = arrive_by_secs - walk_secs
+                stop_parent[code] = ("egress", walk_secs)
+        for code in list(stop_parent):
+            start_nb, end_nb = self.foot_offsets[code], self.foot_offsets[code + 1]
+            for neighbour, walk_secs in zip(self.foot_targets[start_nb:end_nb].tolist(),
+                                            self.foot_secs[start_nb:end_nb].tolist()):
+                if arrive_by_secs - egress[code] - walk_secs > latest[neighbour]:
+                    latest[neighbour] = arrive_by_secs - egress[code] - walk_secs
+                    stop_parent[neighbour] = ("walk", code, walk_secs, ("egress", egress[code]))
+
+        trip_exit = np.full(int(self.trip.max()) + 1 if len(self) else 0, -1, dtype=np.int64)
+        best_departure = UNREACHABLE
+        best_stop = -1
+        best_parent = None
+
+        # Connections are sorted latest first; skip those leaving after the deadline
+        start = int(np.searchsorted(-self.dep_secs, -arrive_by_secs, side="left"))
+        dep_stops = self.dep_stop.tolist()
+        arr_stops = self.arr_stop.tolist()
+        dep_secs = self.dep_secs.tolist()
+        arr_secs = self.arr_secs.tolist()
+        trips = self.trip.tolist()
+
+        for c in range(start, len(dep_secs)):
+            departure = dep_secs[c]
+            if departure <= best_departure:
+                # Every remaining connection leaves earlier than the answer already found
+                break
+            trip = trips[c]
+            if trip_exit[trip] < 0:
+                if arr_secs[c] > latest[arr_stops[c]]:
+                    continue
+                trip_exit[trip] = c
+
+            stop = dep_stops[c]
+            if departure <= latest_board[stop]:
+                continue
+            latest_board[stop] = departure
+            board = ("board", c)
+            if departure > latest[stop]:
+                latest[stop] = departure
+                stop_parent[stop] = board
+            if stop in access and departure - access[stop] > best_departure:
+                best_departure = departure - access[stop]
+                best_stop, best_parent = stop, board
+
+            start_nb, end_nb = self.foot_offsets[stop], self.foot_offsets[stop + 1]
+            for neighbour, walk_secs in zip(self.foot_targets[start_nb:end_nb].tolist(),
+                                            self.foot_secs[start_nb:end_nb].tolist()):
+                walk = ("walk", stop, walk_secs, board)
+                if departure - walk_secs > latest[neighbour]:
+                    latest[neighbour] = departure - walk_secs
+                    stop_parent[neighbour] = walk
+                if neighbour in access and departure - walk_secs - access[neighbour] > best_departure:
+                    best_departure = departure - walk_secs - access[neighbour]
+                    best_stop, best_parent = neighbour, walk
+
+        if best_stop < 0:
+            return None
+        return self._build_journey(best_stop, access[best_stop], best_parent, stop_parent, trip_exit)
+
+    def earliest_arrivals(self, access: Dict[int, int], departure_secs: int,
+                          max_arrival_secs: Optional[int] = None) -> np.ndarray:
+        """
+        One-to-all forward scan: the earliest arrival at every stop when leaving the origin at departure_secs.
+        Connections are visited in reverse storage order, i.e. earliest departure first.
+        :param access: dict of stop code -> walking seconds from the origin to that stop
+        :param departure_secs: time the traveller leaves the origin, in seconds
+        :param max_arrival_secs: optional horizon; the scan stops once connections leave after it
+        :return: int64 array of arrival seconds per stop code, UNREACHED where no journey gets there
+        """
+        arrival = np.full(self.n_stops, UNREACHED, dtype=np.int64)
+        for code, walk_secs in access.items():
+            arrival[code] = min(arrival[code], departure_secs + walk_secs)
+        for code in list(access):
+            start_nb, end_nb = self.foot_offsets[code], self.foot_offsets[code + 1]
+            for neighbour, walk_secs in zip(self.foot_targets[start_nb:end_nb].tolist(),
+                                            self.foot_secs[start_nb:end_nb].tolist()):
+                arrival[neighbour] = min(arrival[neighbour], arrival[code] + walk_secs)
+        horizon = UNREACHED if max_arrival_secs is None else max_arrival_secs
+
+        # Connections leaving at or after departure_secs are a prefix of the latest-first storage order;
+        # reversed, it is ordered by departure, then arrival, then stop order, ascending
+        end = int(np.searchsorted(-self.dep_secs, -departure_secs, side="right"))
+        dep_stops = self.dep_stop[:end][::-1].tolist()
+        arr_stops = self.arr_stop[:end][::-1].tolist()
+        dep_secs = self.dep_secs[:end][::-1].tolist()
+        arr_secs = self.arr_secs[:end][::-1].tolist()
+        trips = self.trip[:end][::-1].tolist()
+        best = arrival.tolist()
+        by_bus = [UNREACHED] * self.n_stops
+        on_trip = np.zeros(int(self.trip.max()) + 1 if len(self) else 0, dtype=bool)
+
+        for c in range(len(dep_secs)):
+            departure = dep_secs[c]
+            if departure > horizon:
+                break
+            trip = trips[c]
+            if not on_trip[trip]:
+                if best[dep_stops[c]] > departure:
+                    continue
+                on_trip[trip] = True
+            stop = arr_stops[c]
+            arrival_here = arr_secs[c]
+            # Footpaths are not transitive, so walk on from any stop reached sooner by bus than before,
+            # even if it was already reached sooner on foot
+            if arrival_here < by_bus[stop]:
+                by_bus[stop] = arrival_here
+                best[stop] = min(best[stop], arrival_here)
+                start_nb, end_nb = self.foot_offsets[stop], self.foot_offsets[stop + 1]
+                for neighbour, walk_secs in zip(self.foot_targets[start_nb:end_nb].tolist(),
+                                                self.foot_secs[start_nb:end_nb].tolist()):
+                    if arrival_here + walk_secs < best[neighbour]:
+                        best[neighbour] = arrival_here + walk_secs
+
+        return np.array(best, dtype=np.int64)
+
+    def profiles(self, egress: Dict[int, int], arrive_by_secs: int) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Profile scan towards one destination: for every stop, the Pareto set of (departure from the
+        stop, arrival at the destination) pairs, so the latest departure for any deadline up to
+        arrive_by_secs is a binary search instead of another scan.
+        :param egress: dict of stop code -> walking seconds from that stop to the destination
+        :param arrive_by_secs: latest deadline the profiles need to answer
+        :return: dict of stop code -> (departures, arrivals), both sorted latest first
+        """
+        never = np.iinfo(np.int64).max
+        # Like latest_departure, a stop one transfer walk away from an egress stop also counts as egress
+        egress = dict(egress)
+        for code, walk_secs in list(egress.items()):
+            start_nb, end_nb = self.foot_offsets[code], self.foot_offsets[code + 1]
+            for neighbour, foot_secs in zip(self.foot_targets[start_nb:end_nb].tolist(),
+                                            self.foot_secs[start_nb:end_nb].tolist()):
+                if walk_secs + foot_secs < egress.get(neighbour, never):
+                    egress[neighbour] = walk_secs + foot_secs
+        trip_arrival = [never] * (int(self.trip.max()) + 1 if len(self) else 0)
+        neg_deps: Dict[int, List[int]] = {}
+        arrs: Dict[int, List[int]] = {}
+        neighbours: Dict[int, List[Tuple[int, int]]] = {}
+
+        def add(stop: int, departure: int, arrival: int) -> None:
+            stop_deps = neg_deps.setdefault(stop, [])
+            stop_arrs = arrs.setdefault(stop, [])
+            i = bisect_right(stop_deps, -departure)
+            if i and stop_arrs[i - 1] <= arrival:
+                return
+            stop_deps.insert(i, -departure)
+            stop_arrs.insert(i, arrival)
+            # Drop pairs that leave earlier without arriving any sooner
+            end = i + 1
+            while end < len(stop_arrs) and stop_arrs[end] >= arrival:
+                end += 1
+            del stop_deps[i + 1:end], stop_arrs[i + 1:end]
+
+        start = int(np.searchsorted(-self.dep_secs, -arrive_by_secs, side="left"))
+        dep_stops = self.dep_stop.tolist()
+        arr_stops = self.arr_stop.tolist()
+        dep_secs = self.dep_secs.tolist()
+        arr_secs = self.arr_secs.tolist()
+        trips = self.trip.tolist()
+
+        for c in range(start, len(dep_secs)):
+            arrival_here = arr_secs[c]
+            if arrival_here > arrive_by_secs:
+                continue
+            trip = trips[c]
+            stop = arr_stops[c]
+            best = trip_arrival[trip]
+            if stop in egress and arrival_here + egress[stop] < best:
+                best = arrival_here + egress[stop]
+            if stop in neg_deps:
+                i = bisect_right(neg_deps[stop], -arrival_here)
+                if i and arrs[stop][i - 1] < best:
+                    best = arrs[stop][i - 1]
+            if best == never:
+                continue
+            trip_arrival[trip] = best
+
+            departure = dep_secs[c]
+            stop = dep_stops[c]
+            add(stop, departure, best)
+            if stop not in neighbours:
+                start_nb, end_nb = self.foot_offsets[stop], self.foot_offsets[stop + 1]
+                neighbours[stop] = list(zip(self.foot_targets[start_nb:end_nb].tolist(),
+                                            self.foot_secs[start_nb:end_nb].tolist()))
+            for neighbour, walk_secs in neighbours[stop]:
+                add(neighbour, departure - walk_secs, best)
+
+        return {stop: (-np.array(neg_deps[stop], dtype=np.int64), np.array(arrs[stop], dtype=np.int64))
+                for stop in neg_deps}
+
+    def _build_journey(self, code: int, access_secs: int, parent: tuple, stop_parent: Dict[int, tuple],
+                       trip_exit: np.ndarray) -> Dict[str, Any]:
+        """
+        Follows parents forward from the first stop to rebuild the legs of a journey.
+        :param code: stop the traveller walks to from the origin
+        :param parent: how the journey continues from that stop, see latest_departure
+        :return: dict with departure_secs, arrival_secs, rides, walking_secs and legs
+        """
+        legs: List[Dict[str, Any]] = [{"type": "walk", "from_stop": None, "to_stop": self.stop_id_values[code],
+                                       "duration": access_secs}]
+        while True:
+            if parent[0] == "egress":
+                legs.append({"type": "walk", "from_stop": self.stop_id_values[code], "to_stop": None,
+                             "duration": parent[1]})
+                break
+            if parent[0] == "walk":
+                legs.append({"type": "walk", "from_stop": self.stop_id_values[code],
+                             "to_stop": self.stop_id_values[parent[1]], "duration": parent[2]})
+                code, parent = parent[1], parent[3]
+                continue
+            board = parent[1]
+            trip = int(self.trip[board])
+            exit_connection = int(trip_exit[trip])
+            legs.append({
+                "type": "ride",
+                "trip_id": self.trip_ids[trip],
+                "route_id": self.trip_route_ids[trip],
+                "from_stop": self.stop_id_values[self.dep_stop[board]],
+                "to_stop": self.stop_id_values[self.arr_stop[exit_connection]],
+                "board_secs": int(self.dep_secs[board]),
+                "alight_secs": int(self.arr_secs[exit_connection])
+            })
+            code = int(self.arr_stop[exit_connection])
+            parent = stop_parent[code]
+        return summarize_legs(legs)
+
+
+def get_connection_table(gtfs_data: Dict[str, pd.DataFrame], day_of_week: str) -> ConnectionTable:
+    """
+    Returns the process-wide ConnectionTable for a feed and service day, building it on first use.
+    :param gtfs_data: loaded GTFS dataset
+    :param day_of_week: "monday", "tuesday", etc.
+    :return: ConnectionTable shared by every planning call on the same feed and day
+    """
+    return cached_on(gtfs_data["stop_times"], f"csa:{day_of_week.lower()}",
+                     lambda _: ConnectionTable(gtfs_data, day_of_week.lower()))
@@ -0,0 +1,358 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.csa import get_connection_table
+from core.gtfs_parser import RoutePattern, RoutePatternList, get_route_patterns, split_fifo
+from core.plan_cache import PlanCache
+from core.service_calendar import WEEKDAYS
+from core.timetable import NO_TIME, get_timetable_index
+from utils.memo import cached_on, clear_cached, peek_cached
+
+# How often refresh re-stats the trip updates file
+DEFAULT_CHECK_INTERVAL_SECONDS = 5.0
+
+# Per trip: list of (stop_sequence or None, stop_id or None, arrival delay or None, departure delay or None)
+StopTimeUpdates = List[Tuple[Optional[int], Optional[str], Optional[int], Optional[int]]]
+# Per trip: (trip-level delay or None, stop time updates)
+TripUpdates = Dict[str, Tuple[Optional[int], StopTimeUpdates]]
+
+
+def _field(message: Dict[str, Any], name: str) -> Any:
+    # GTFS-Realtime JSON comes both as proto field names (trip_update) and camelCase (tripUpdate)
+    if name in message:
+        return message[name]
+    head, *rest = name.split("_")
+    return message.get(head + "".join(part.title() for part in rest))
+
+
+def parse_trip_updates(feed: Dict[str, Any]) -> TripUpdates:
+    """
+    Reads the TripUpdate entities of a GTFS-Realtime FeedMessage in its JSON form.
+    Only delays are used; absolute times and other entity types are ignored.
+    :param feed: FeedMessage dict with an entity list
+    :return: dict of trip_id -> (trip-level delay, stop time updates)
+    """
+    updates: TripUpdates = {}
+    for entity in feed.get("entity") or []:
+        trip_update = _field(entity, "trip_update")
+        if not trip_update or _field(entity, "is_deleted"):
+            continue
+        trip_id = _field(_field(trip_update, "trip") or {}, "trip_id")
+        if trip_id is None:
+            continue
+        stop_updates = []
+        for stop_update in _field(trip_update, "stop_time_update") or []:
+            sequence = _field(stop_update, "stop_sequence")
+            arrival = _field(stop_update, "arrival") or {}
+            departure = _field(stop_update, "departure") or {}
+            stop_updates.append((
+                int(sequence) if sequence is not None else None,
+                _field(stop_update, "stop_id"),
+                int(arrival["delay"]) if arrival.get("delay") is not None else None,
+                int(departure["delay"]) if departure.get("delay") is not None else None
+            ))
+        delay = _field(trip_update, "delay")
+        updates[str(trip_id)] = (int(delay) if delay is not None else None, stop_updates)
+    return updates
+
+
+def load_trip_updates(path: str) -> TripUpdates:
+    """
+    :param path: JSON file holding a GTFS-Realtime FeedMessage
+    :return: dict of trip_id -> (trip-level delay, stop time updates), see parse_trip_updates
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_trip_updates(json.load(f))
+
+
+def stub_trip_updates(gtfs_data: Dict[str, pd.DataFrame], day_of_week: str, n_trips: int = 50,
+                      max_delay_secs: int = 600, seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Builds a fake FeedMessage delaying random trips of a service day, for testing without a live feed.
+    :param gtfs_data: loaded GTFS dataset
+    :param day_of_week: "monday", "tuesday", etc.
+    :param n_trips: number of trips to delay
+    :param max_delay_secs: largest delay given to a trip
+    :param seed: optional random seed
+    :return: FeedMessage dict accepted by parse_trip_updates
+    """
+    rng = random.Random(seed)
+    timetable = get_timetable_index(gtfs_data["stop_times"])
+    trip_ids = sorted(get_route_patterns(gtfs_data, day_of_week).trip_rows)
+    entities = []
+    for trip_id in rng.sample(trip_ids, min(n_trips, len(trip_ids))):
+        sequences = timetable.stop_sequences[timetable.trip_slice(trip_id)]
+        sequence = int(sequences[rng.randrange(len(sequences))])
+        delay = rng.randint(60, max_delay_secs)
+        entities.append({"id": trip_id, "trip_update": {
+            "trip": {"trip_id": trip_id},
+            "stop_time_update": [{"stop_sequence": sequence, "arrival": {"delay": delay},
+                                  "departure": {"delay": delay}}]
+        }})
+    return {"header": {"gtfs_realtime_version": "2.0", "timestamp": int(time.time())}, "entity": entities}
+
+
+def trip_delays(stop_sequences: np.ndarray, stop_ids: np.ndarray, trip_delay: Optional[int],
+                stop_updates: StopTimeUpdates) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Expands a trip's updates to one arrival and one departure delay per stop, following
+    GTFS-Realtime propagation: a stop's delay carries on to the following stops until the next update,
+    and stops before the first update keep the trip-level delay (0 if none).
+    :param stop_sequences: stop_sequence of every stop of the trip, in order
+    :param stop_ids: stop_id of every stop of the trip, in order
+    :param trip_delay: trip-level delay in seconds, or None
+    :param stop_updates: stop time updates of the trip
+    :return: (arrival delays, departure delays) in seconds
+    """
+    n_stops = len(stop_sequences)
+    positions = []
+    for sequence, stop_id, arrival, departure in stop_updates:
+        if sequence is not None:
+            found = np.flatnonzero(stop_sequences == sequence)
+        else:
+            found = np.flatnonzero(stop_ids == str(stop_id))
+        if len(found):
+            positions.append((int(found[0]), arrival, departure))
+    positions.sort()
+
+    arrival_delays = np.zeros(n_stops, dtype=np.int64)
+    departure_delays = np.zeros(n_stops, dtype=np.int64)
+    current = trip_delay or 0
+    start = 0
+    for pos, arrival, departure in positions:
+        arrival_delays[start:pos] = current
+        departure_delays[start:pos] = current
+        arrival = arrival if arrival is not None else departure if departure is not None else current
+        departure = departure if departure is not None else arrival
+        arrival_delays[pos] = arrival
+        departure_delays[pos] = departure
+        current = departure
+        start = pos + 1
+    arrival_delays[start:] = current
+    departure_delays[start:] = current
+    return arrival_delays, departure_delays
+
+
+class DelayOverlay:
+    """
+    Real-time delays layered over the static timetable of one service day.
+
+    The static TimetableIndex and route patterns are never modified. Instead each update is applied
+    incrementally to what the planners search: the overlay keeps its own copy of the day's patterns
+    (see gtfs_parser.get_current_route_patterns) in which only the patterns containing a changed
+    trip are rebuilt from their static times plus the current delays (split again wherever a late
+    bus is overtaken), only that trip's connections are re-merged into the CSA table, and only the
+    plan cache entries riding a changed trip are dropped.
+    """
+
+    def __init__(self, gtfs_data: Dict[str, pd.DataFrame], day_of_week: Optional[str] = None,
+                 path: Optional[str] = None, plan_cache: Optional[PlanCache] = None,
+                 check_interval_secs: float = DEFAULT_CHECK_INTERVAL_SECONDS):
+        """
+        :param gtfs_data: loaded GTFS dataset
+        :param day_of_week: service day the delays apply to, defaults to today
+        :param path: optional GTFS-Realtime JSON file re-read by refresh when it changes
+        :param plan_cache: optional PlanCache whose entries riding delayed trips are dropped
+        :param check_interval_secs: min seconds between two checks of the file
+        """
+        self.gtfs_data = gtfs_data
+        self.day_of_week = (day_of_week or WEEKDAYS[date.today().weekday()]).lower()
+        self.path = path
+        self.plan_cache = plan_cache
+        self.check_interval_secs = check_interval_secs
+        self.updates: TripUpdates = {}
+        self.delays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.updates_applied = 0
+        # Unreadable trip update files, counted like the server counts failed requests
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._file_mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        # The delayed copy of the day's patterns and the extra slots each static slot's splits use
+        self._stop_times = self.gtfs_data["stop_times"]
+        self._patterns: Optional[RoutePatternList] = None
+        self._spill: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.delays)
+
+    def refresh(self, force: bool = False) -> Set[str]:
+        """
+        Re-reads the trip updates file if it changed since the last read (checked at most once per
+        interval), and re-applies every delay if the feed itself was reloaded.
+        :param force: check the file now regardless of the interval
+        :return: trip_ids whose times changed
+        """
+        changed = set()
+        if self.gtfs_data["stop_times"] is not self._stop_times:
+            # The reloaded feed starts from fresh static patterns, so every delay is laid over it again
+            with self._lock:
+                self._reset()
+                self.delays = {}
+                changed = self._apply_delays(self._expand(self.updates))
+        if self.path is None or (not force and time.monotonic() - self._checked_at < self.check_interval_secs):
+            return changed
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return changed
+        if mtime == self._file_mtime:
+            return changed
+        # Recorded before reading, so an unreadable file is reported once rather than on every check
+        self._file_mtime = mtime
+        try:
+            updates = load_trip_updates(self.path)
+        except (ValueError, KeyError, TypeError) as e:
+            self.errors += 1
+            self.last_error = f"Ignoring unreadable trip updates in {self.path}: {e}"
+            print(self.last_error)
+            return changed
+        return changed | self.apply(updates)
+
+    def apply(self, updates: TripUpdates, full_dataset: bool = True) -> Set[str]:
+        """
+        Applies a batch of trip updates.
+        :param updates: dict of trip_id -> (trip-level delay, stop time updates), see parse_trip_updates
+        :param full_dataset: True if the batch replaces all current delays, so delayed trips missing
+        from it are back on schedule; False to only change the trips it mentions
+        :return: trip_ids whose times changed
+        """
+        with self._lock:
+            self.updates = dict(updates) if full_dataset else {**self.updates, **updates}
+            self.updates_applied += 1
+            return self._apply_delays(self._expand(self.updates))
+
+    def _expand(self, updates: TripUpdates) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        :return: dict of trip_id -> (arrival delays, departure delays) for the trips of updates
+        that are in the feed and actually delayed
+        """
+        timetable = get_timetable_index(self.gtfs_data["stop_times"])
+        delays = {}
+        for trip_id, (trip_delay, stop_updates) in updates.items():
+            trip_slice = timetable.trip_slice(trip_id)
+            if trip_slice.stop == trip_slice.start:
+                continue
+            arrival_delays, departure_delays = trip_delays(
+                timetable.stop_sequences[trip_slice], timetable.stops_for_trip(trip_id).astype(str),
+                trip_delay, stop_updates)
+            if arrival_delays.any() or departure_delays.any():
+                delays[trip_id] = (arrival_delays, departure_delays)
+        return delays
+
+    def _apply_delays(self, delays: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> Set[str]:
+        """
+        Makes delays the current set, touching only the trips whose delays differ from before.
+        :return: trip_ids whose times changed
+        """
+        changed = set()
+        for trip_id in set(delays) | set(self.delays):
+            old, new = self.delays.get(trip_id), delays.get(trip_id)
+            if old is None or new is None or not (np.array_equal(old[0], new[0]) and np.array_equal(old[1], new[1])):
+                changed.add(trip_id)
+        self.delays = delays
+        if not changed:
+            return changed
+
+        static = get_route_patterns(self.gtfs_data, self.day_of_week)
+        slots = {static.trip_rows[trip_id][0] for trip_id in changed if trip_id in static.trip_rows}
+        if slots:
+            patterns = self._delayed_patterns(static)
+            for slot in slots:
+                self._rebuild_slot(static, patterns, slot)
+
+        timetable = get_timetable_index(self.gtfs_data["stop_times"])
+        trip_times = {}
+        for trip_id in changed:
+            pos = timetable.trip_position.get(trip_id)
+            if pos is None:
+                continue
+            trip_slice = timetable.trip_slice(trip_id)
+            arrivals = timetable.arrival_secs[trip_slice].astype(np.int64)
+            departures = timetable.departure_secs[trip_slice].astype(np.int64)
+            if trip_id in delays:
+                arrival_delays, departure_delays = delays[trip_id]
+                arrivals = np.where(arrivals != NO_TIME, arrivals + arrival_delays, NO_TIME)
+                departures = np.where(departures != NO_TIME, departures + departure_delays, NO_TIME)
+            trip_times[pos] = (arrivals, departures)
+        get_connection_table(self.gtfs_data, self.day_of_week).replace_trip_times(trip_times)
+        # The departure board is a plain sort of the patterns, rebuilt with the delays on next use
+        clear_cached(self.gtfs_data["stop_times"], f"departure_board:{self.day_of_week}")
+
+        if self.plan_cache is not None:
+            self.plan_cache.invalidate_trips(changed)
+        return changed
+
+    def _delayed_patterns(self, static: RoutePatternList) -> RoutePatternList:
+        """
+        :return: this overlay's copy of the day's patterns, created on the first delay and handed to the
+        routers; the static patterns are never modified, so feed reloads and the compiled timetable
+        only ever see scheduled times
+        """
+        if self._patterns is None:
+            stop_times = self.gtfs_data["stop_times"]
+            self._patterns = cached_on(stop_times, f"delayed_route_patterns:{self.day_of_week}",
+                                       lambda _: RoutePatternList(list(static)))
+            raptor_data = peek_cached(stop_times, f"raptor:{self.day_of_week}")
+            if raptor_data is not None:
+                # Same slots as the static list, so the stop -> pattern index still holds
+                raptor_data.patterns = self._patterns
+        return self._patterns
+
+    def _rebuild_slot(self, static_patterns: RoutePatternList, patterns: RoutePatternList, slot: int) -> None:
+        """
+        Rebuilds one static pattern with the current delays of its trips, writing the FIFO groups
+        into its slot and its spill slots of the delayed patterns, and registers new slots with the
+        RAPTOR index.
+        """
+        static = static_patterns[slot]
+        arrivals = static.arrivals.astype(np.int64)
+        departures = static.departures.astype(np.int64)
+        for row, trip_id in enumerate(static.trip_ids):
+            delay = self.delays.get(str(trip_id))
+            if delay is not None:
+                arrivals[row] += delay[0]
+                departures[row] += delay[1]
+
+        order = np.argsort(departures[:, 0], kind="stable")
+        groups = [order[rows] for rows in split_fifo(arrivals[order], departures[order])]
+        spill = self._spill.setdefault(slot, [])
+        while len(spill) < len(groups) - 1:
+            spill.append(len(patterns))
+            patterns.append(self._pattern(static, np.zeros(0, dtype=np.int64), arrivals, departures))
+            raptor_data = peek_cached(self.gtfs_data["stop_times"], f"raptor:{self.day_of_week}")
+            if raptor_data is not None and raptor_data.patterns is patterns:
+                for pos, code in enumerate(static.stops.tolist()):
+                    raptor_data.stop_patterns[code].append((spill[-1], pos))
+
+        empty = np.zeros(0, dtype=np.int64)
+        for target, rows in zip([slot] + spill, groups + [empty] * (len(spill) + 1 - len(groups))):
+            pattern = self._pattern(static, rows, arrivals, departures)
+            patterns[target] = pattern
+            for row, trip_id in enumerate(pattern.trip_ids):
+                patterns.trip_rows[str(trip_id)] = (target, row)
+
+    @staticmethod
+    def _pattern(static: RoutePattern, rows: np.ndarray, arrivals: np.ndarray, departures: np.ndarray) -> RoutePattern:
+        return RoutePattern(static.route_id, static.stops, static.trip_ids[rows], static.headsigns[rows],
+                            static.direction_names[rows], arrivals[rows], departures[rows])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        :return: dict with the service day, delayed trip count and number of update batches applied
+        """
+        return {"day_of_week": self.day_of_week, "delayed_trips": len(self.delays),
+                "updates_applied": self.updates_applied}
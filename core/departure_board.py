@@ -0,0 +1,135 @@
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from core.gtfs_parser import get_route_for_trip, get_current_route_patterns
+from core.stop_index import get_stop_index
+from core.timetable import get_timetable_index
+from utils.memo import cached_on
+from utils.time_utils import seconds_to_time, to_seconds
+
+DEFAULT_BOARD_SIZE = 5
+
+
+class DepartureBoard:
+    """
+    Every departure of one service day, grouped by stop and sorted by time.
+
+    Departures of all stops share flat arrays with offsets per stop code, so the departures of a
+    stop are one slice and "next N buses after T" is a binary search into it. Each departure points
+    to its trip, and each trip to a shared route label formatted by get_route_for_trip.
+    The last stop of a trip is only an arrival and is left out.
+    """
+
+    def __init__(self, gtfs_data: Dict[str, pd.DataFrame], day_of_week: str):
+        """
+        :param gtfs_data: loaded GTFS dataset
+        :param day_of_week: "monday", "tuesday", etc.
+        """
+        timetable = get_timetable_index(gtfs_data["stop_times"])
+        self.day_of_week = day_of_week.lower()
+        self.stop_id_values = timetable.stop_id_values
+        self.stop_code = {str(stop_id): code for code, stop_id in enumerate(self.stop_id_values)}
+        self.trip_ids: List[str] = []
+        # One label per distinct (route, headsign, direction); trips point to theirs through trip_labels
+        self.labels: List[str] = []
+        self.label_routes: List[str] = []
+        self.label_headsigns: List[str] = []
+
+        label_codes: Dict[tuple, int] = {}
+        trip_labels = []
+        stops, times, trips = [], [], []
+        for pattern in get_current_route_patterns(gtfs_data, self.day_of_week):
+            n_trips, n_stops = pattern.departures.shape
+            if not n_trips or n_stops < 2:
+                continue
+            first = len(self.trip_ids)
+            for row, trip_id in enumerate(pattern.trip_ids.tolist()):
+                key = (pattern.route_id, pattern.headsigns[row], pattern.direction_names[row])
+                label = label_codes.get(key)
+                if label is None:
+                    label = label_codes[key] = len(self.labels)
+                    self.labels.append(get_route_for_trip(trip_id, gtfs_data["trips"], gtfs_data["routes"], pattern))
+                    self.label_routes.append(str(pattern.route_id))
+                    self.label_headsigns.append(str(pattern.headsigns[row] or ""))
+                self.trip_ids.append(str(trip_id))
+                trip_labels.append(label)
+            stops.append(np.broadcast_to(pattern.stops[:-1], (n_trips, n_stops - 1)).ravel())
+            times.append(pattern.departures[:, :-1].ravel())
+            trips.append(np.repeat(np.arange(first, first + n_trips), n_stops - 1))
+
+        stops = np.concatenate(stops).astype(np.int64) if stops else np.zeros(0, dtype=np.int64)
+        times = np.concatenate(times) if times else np.zeros(0, dtype=np.int64)
+        trips = np.concatenate(trips) if trips else np.zeros(0, dtype=np.int64)
+        order = np.lexsort((trips, times, stops))
+
+        self.stop_offsets = np.zeros(len(self.stop_id_values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(stops, minlength=len(self.stop_id_values)), out=self.stop_offsets[1:])
+        self.departure_secs = times[order].astype(np.int32)
+        self.departure_trips = trips[order].astype(np.int32)
+        self.trip_labels = np.array(trip_labels, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.departure_secs)
+
+    def _departure(self, i: int, stop_id: str) -> Dict[str, Any]:
+        trip = int(self.departure_trips[i])
+        label = int(self.trip_labels[trip])
+        departure_secs = int(self.departure_secs[i])
+        return {
+            "stop_id": stop_id,
+            "trip_id": self.trip_ids[trip],
+            "route_id": self.label_routes[label],
+            "route": self.labels[label],
+            "headsign": self.label_headsigns[label],
+            "departure_secs": departure_secs,
+            "departure_time": seconds_to_time(departure_secs)
+        }
+
+    def next_departures(self, stop_id: str, after: Union[str, int], n: int = DEFAULT_BOARD_SIZE) -> List[Dict[str, Any]]:
+        """
+        :param stop_id: GTFS stop_id
+        :param after: HH:MM:SS time or seconds; departures at exactly this time are included
+        :param n: max number of departures
+        :return: list of dicts with stop_id, trip_id, route_id, route, headsign, departure_secs and
+        departure_time, earliest first
+        """
+        code = self.stop_code.get(str(stop_id))
+        if code is None:
+            return []
+        start, end = int(self.stop_offsets[code]), int(self.stop_offsets[code + 1])
+        first = start + int(np.searchsorted(self.departure_secs[start:end], to_seconds(after), side="left"))
+        return [self._departure(i, str(stop_id)) for i in range(first, min(first + n, end))]
+
+    def next_departures_near(self, stops_df: pd.DataFrame, lat: float, lng: float, radius: float,
+                             after: Union[str, int], n: int = DEFAULT_BOARD_SIZE) -> List[Dict[str, Any]]:
+        """
+        Merged board of every stop within radius, e.g. the stops around a building.
+        :param stops_df: stops.txt DataFrame
+        :param lat: latitude of reference point
+        :param lng: longitude of reference point
+        :param radius: search radius in meters
+        :param after: HH:MM:SS time or seconds
+        :param n: max number of departures
+        :return: departures as in next_departures with the stop's distance added, earliest first
+        """
+        after_secs = to_seconds(after)
+        departures = []
+        for stop in get_stop_index(stops_df).nearby_stops(lat, lng, radius):
+            for departure in self.next_departures(stop["stop_id"], after_secs, n):
+                departure["distance"] = stop["distance"]
+                departures.append(departure)
+        departures.sort(key=lambda departure: (departure["departure_secs"], departure["distance"]))
+        return departures[:n]
+
+
+def get_departure_board(gtfs_data: Dict[str, pd.DataFrame], day_of_week: str) -> DepartureBoard:
+    """
+    Returns the process-wide DepartureBoard for a feed and service day, building it on first use.
+    :param gtfs_data: loaded GTFS dataset
+    :param day_of_week: "monday", "tuesday", etc.
+    :return: shared DepartureBoard
+    """
+    day = day_of_week.lower()
+    return cached_on(gtfs_data["stop_times"], f"departure_board:{day}", lambda _: DepartureBoard(gtfs_data, day))
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import pickle
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+# Bump whenever the on-disk snapshot layout or the parsed dtypes change
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def compute_feed_fingerprint(gtfs_folder: str) -> str:
+    """
+    Builds a cheap fingerprint of a GTFS folder from its resolved path and the name, size and
+    modification time of every .txt file, so any edited, added or removed file produces a different
+    value, and so does an identical-looking copy of the feed in another folder sharing the cache dir.
+    :param gtfs_folder: path to folder containing GTFS txt files
+    :return: hex digest identifying the current state of the feed
+    """
+    digest = hashlib.sha1()
+    digest.update(f"v{SNAPSHOT_VERSION}:{os.path.realpath(gtfs_folder)};".encode())
+
+    for filename in sorted(os.listdir(gtfs_folder)):
+        if not filename.endswith(".txt"):
+            continue
+        stat = os.stat(os.path.join(gtfs_folder, filename))
+        digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+
+    return digest.hexdigest()
+
+
+def load_snapshot(cache_dir: str, fingerprint: str, skip: Iterable[str] = ()) -> Optional[Dict[str, pd.DataFrame]]:
+    """
+    Loads a previously saved snapshot of the parsed feed if it matches the given fingerprint.
+    :param cache_dir: folder the snapshot was written to
+    :param fingerprint: fingerprint of the feed currently on disk
+    :param skip: tables not to read, e.g. stop_times when its arrays come from the compiled timetable
+    :return: dict of DataFrames keyed like load_gtfs_files, or None if missing or stale
+    """
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("fingerprint") != fingerprint:
+        return None
+
+    gtfs_data = {}
+    try:
+        for key in manifest["tables"]:
+            if key in skip:
+                continue
+            gtfs_data[key] = pd.read_pickle(os.path.join(cache_dir, f"{key}.pkl"))
+    except (FileNotFoundError, KeyError, EOFError, ValueError, pickle.UnpicklingError,
+            AttributeError, ImportError) as e:
+        # A corrupt pickle, or one referring to classes that have since moved, is treated as stale
+        print(f"Ignoring unreadable GTFS snapshot in {cache_dir}: {e}")
+        return None
+
+    return gtfs_data
+
+
+def save_snapshot(cache_dir: str, fingerprint: str, gtfs_data: Dict[str, pd.DataFrame]) -> None:
+    """
+    Writes every parsed table as a typed binary file plus a manifest recording the feed fingerprint.
+    The manifest is written last so a partially written snapshot is never treated as valid.
+    :param cache_dir: folder to write the snapshot to
+    :param fingerprint: fingerprint of the feed the tables were parsed from
+    :param gtfs_data: dict of DataFrames returned by load_gtfs_files
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for key, df in gtfs_data.items():
+        table_path = os.path.join(cache_dir, f"{key}.pkl")
+        tmp_path = table_path + ".tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, table_path)
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fingerprint,
+        "tables": sorted(gtfs_data.keys())
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
@@ -0,0 +1,231 @@
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from core.compiled_timetable import precompute_compiled_timetable
+from core.csa import get_connection_table
+from core.feed_cache import compute_feed_fingerprint, save_snapshot
+from core.footpaths import get_transfer_radius, set_transfer_radius
+from core.gtfs_parser import (RoutePatternList, build_route_patterns, filter_trips_by_service,
+                              get_active_service_ids, read_gtfs_folder, snapshot_dir)
+from core.raptor import get_raptor_data
+from core.route_index import get_route_index
+from core.service_calendar import WEEKDAYS
+from core.timetable import get_timetable_index
+from utils.memo import cached_on, peek_cached
+
+STOP_TIME_COLUMNS = ["stop_id", "stop_sequence", "arrival_time", "departure_time"]
+STOP_COLUMNS = ["stop_id", "stop_lat", "stop_lon"]
+
+
+class FeedDiff:
+    """
+    Differences between a loaded feed and a newly published one, at trip and service granularity.
+    """
+
+    def __init__(self, added_trips: Set[str], removed_trips: Set[str], changed_trips: Set[str],
+                 changed_services: Set[str], affected_routes: Set[str], stops_changed: bool):
+        """
+        :param added_trips: trip_ids only in the new feed
+        :param removed_trips: trip_ids only in the old feed
+        :param changed_trips: trip_ids in both whose trips.txt row or stop times differ
+        :param changed_services: service_ids added, removed or edited in calendar/calendar_dates
+        :param affected_routes: route_ids whose patterns have to be rebuilt
+        :param stops_changed: True if any stop was added, removed or moved
+        """
+        self.added_trips = added_trips
+        self.removed_trips = removed_trips
+        self.changed_trips = changed_trips
+        self.changed_services = changed_services
+        self.affected_routes = affected_routes
+        self.stops_changed = stops_changed
+        # Set by apply_feed_diff when nothing derived from the old feed could be reused
+        self.full_rebuild = False
+
+    def is_empty(self) -> bool:
+        return not (self.added_trips or self.removed_trips or self.changed_trips or
+                    self.changed_services or self.stops_changed)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        :return: dict of counts, for logs and the service's reload response
+        """
+        return {
+            "added_trips": len(self.added_trips),
+            "removed_trips": len(self.removed_trips),
+            "changed_trips": len(self.changed_trips),
+            "changed_services": len(self.changed_services),
+            "affected_routes": len(self.affected_routes),
+            "stops_changed": self.stops_changed,
+            "full_rebuild": self.full_rebuild
+        }
+
+
+def _row_hashes(df: Optional[pd.DataFrame], key: str, columns: List[str]) -> pd.Series:
+    """
+    :return: hash of each row's columns as int64, indexed by the key column as strings
+    """
+    if df is None or key not in df:
+        return pd.Series(dtype=np.int64)
+    hashes = pd.util.hash_pandas_object(df[[col for col in columns if col in df]], index=False)
+    return pd.Series(hashes.to_numpy().view(np.int64), index=df[key].astype(str).to_numpy())
+
+
+def _trip_stop_time_hashes(stop_times_df: pd.DataFrame) -> pd.Series:
+    """
+    :return: one hash per trip over all of its stop_times rows, indexed by trip_id
+    """
+    row_hashes = pd.util.hash_pandas_object(stop_times_df[STOP_TIME_COLUMNS], index=False).to_numpy()
+    # Rows are summed with wrap-around; the stop_sequence in every row hash makes the sum order-aware
+    trips = stop_times_df["trip_id"].astype(str).to_numpy()
+    return pd.Series(row_hashes.view(np.int64)).groupby(trips).sum()
+
+
+def _changed_keys(old: pd.Series, new: pd.Series) -> Set[str]:
+    common = old.index.intersection(new.index)
+    return set(common[old.loc[common].to_numpy() != new.loc[common].to_numpy()])
+
+
+def diff_feeds(old_data: Dict[str, pd.DataFrame], new_data: Dict[str, pd.DataFrame]) -> FeedDiff:
+    """
+    Compares trips, stop_times, calendar and stops of two feeds with per-row hashes.
+    :param old_data: currently loaded GTFS dataset
+    :param new_data: newly parsed GTFS dataset
+    :return: FeedDiff
+    """
+    old_trips, new_trips = old_data["trips"], new_data["trips"]
+    old_trip_rows = _row_hashes(old_trips, "trip_id", list(old_trips.columns))
+    new_trip_rows = _row_hashes(new_trips, "trip_id", list(new_trips.columns))
+    old_stop_times = _trip_stop_time_hashes(old_data["stop_times"])
+    new_stop_times = _trip_stop_time_hashes(new_data["stop_times"])
+
+    old_ids, new_ids = set(old_trip_rows.index), set(new_trip_rows.index)
+    changed_trips = _changed_keys(old_trip_rows, new_trip_rows) | _changed_keys(old_stop_times, new_stop_times)
+    # Trips that gained or lost all of their stop times also count as changed
+    changed_trips |= (set(old_stop_times.index) ^ set(new_stop_times.index)) & old_ids & new_ids
+
+    changed_services = set()
+    for table in ("calendar", "calendar_dates"):
+        old_df, new_df = old_data.get(table), new_data.get(table)
+        frames = [df for df in (old_df, new_df) if df is not None]
+        if not frames:
+            continue
+        columns = list(frames[-1].columns)
+        # calendar_dates holds several rows per service, so rows are combined into one sum per service
+        old_rows = _row_hashes(old_df, "service_id", columns).groupby(level=0).sum()
+        new_rows = _row_hashes(new_df, "service_id", columns).groupby(level=0).sum()
+        changed_services |= _changed_keys(old_rows, new_rows) | (set(old_rows.index) ^ set(new_rows.index))
+
+    old_stops = _row_hashes(old_data.get("stops"), "stop_id", STOP_COLUMNS)
+    new_stops = _row_hashes(new_data.get("stops"), "stop_id", STOP_COLUMNS)
+    stops_changed = bool(set(old_stops.index) ^ set(new_stops.index) or _changed_keys(old_stops, new_stops))
+
+    affected_trips = (new_ids - old_ids) | (old_ids - new_ids) | changed_trips
+    affected_routes = set()
+    for trips_df in (old_trips, new_trips):
+        trip_keys = trips_df["trip_id"].astype(str)
+        hit = trip_keys.isin(affected_trips) | trips_df["service_id"].astype(str).isin(changed_services)
+        affected_routes.update(trips_df.loc[hit.to_numpy(), "route_id"].astype(str))
+
+    return FeedDiff(new_ids - old_ids, old_ids - new_ids, changed_trips, changed_services,
+                    affected_routes, stops_changed)
+
+
+def apply_feed_diff(old_data: Dict[str, pd.DataFrame], new_data: Dict[str, pd.DataFrame], diff: FeedDiff,
+                    transfer_radius: Optional[float] = None) -> None:
+    """
+    Carries everything the diff leaves untouched from the old feed's caches over to the new one:
+    footpaths when no stop moved, and for every day whose patterns were built, all patterns of
+    unaffected routes. Only patterns of affected routes are rebuilt. Stop codes are kept
+    identical by giving the new stop_times the old stop categories.
+    RAPTOR, CSA and route indexes are then built from the patched parts, by warm_like or on first use.
+    :param old_data: currently loaded GTFS dataset
+    :param new_data: newly parsed GTFS dataset, whose caches are seeded
+    :param diff: FeedDiff from diff_feeds
+    :param transfer_radius: radius of the footpaths to carry over, by default the old feed's
+    """
+    if transfer_radius is None:
+        transfer_radius = get_transfer_radius(old_data)
+    old_stop_times, new_stop_times = old_data["stop_times"], new_data["stop_times"]
+    old_timetable = peek_cached(old_stop_times, "timetable_index")
+    stop_col = new_stop_times["stop_id"]
+    if not isinstance(stop_col.dtype, pd.CategoricalDtype):
+        stop_col = stop_col.astype(str).astype("category")
+    if old_timetable is None or not set(stop_col.cat.categories.astype(str)) <= set(old_timetable.stop_id_values):
+        diff.full_rebuild = True
+        return
+    new_stop_times["stop_id"] = stop_col.cat.set_categories(pd.Index(old_timetable.stop_id_values))
+    timetable = get_timetable_index(new_stop_times)
+
+    footpaths_key = f"footpaths:{float(transfer_radius):g}"
+    footpaths = peek_cached(old_stop_times, footpaths_key)
+    if footpaths is not None and not diff.stops_changed:
+        cached_on(new_stop_times, footpaths_key, lambda _: footpaths)
+
+    trips_df = new_data["trips"]
+    trip_routes = dict(zip(trips_df["trip_id"].astype(str), trips_df["route_id"].astype(str)))
+    for day in WEEKDAYS:
+        old_patterns = peek_cached(old_stop_times, f"route_patterns:{day}")
+        if old_patterns is None:
+            continue
+        kept = [pattern for pattern in old_patterns if pattern.route_id not in diff.affected_routes]
+        active_services = get_active_service_ids(day, new_data["calendar"])
+        active_trips = filter_trips_by_service(trips_df, active_services)
+        rebuild = [trip_id for trip_id in active_trips if trip_routes.get(str(trip_id)) in diff.affected_routes]
+        patterns = RoutePatternList(kept + list(build_route_patterns(trips_df, rebuild, timetable)))
+        cached_on(new_stop_times, f"route_patterns:{day}", lambda _, patterns=patterns: patterns)
+
+
+def warm_like(old_data: Dict[str, pd.DataFrame], new_data: Dict[str, pd.DataFrame]) -> None:
+    """
+    Builds the RAPTOR, CSA and route indexes of the new feed for every day the old feed had them built.
+    :param old_data: currently loaded GTFS dataset
+    :param new_data: newly parsed GTFS dataset, patched by apply_feed_diff
+    """
+    old_stop_times = old_data["stop_times"]
+    for day in WEEKDAYS:
+        if peek_cached(old_stop_times, f"raptor:{day}") is not None:
+            get_raptor_data(new_data, day)
+        if peek_cached(old_stop_times, f"csa:{day}") is not None:
+            get_connection_table(new_data, day)
+    if peek_cached(old_stop_times, "route_index") is not None:
+        get_route_index(new_data)
+
+
+def reload_feed(gtfs_data: Dict[str, pd.DataFrame], gtfs_folder: str = "data/gtfs/",
+                cache_dir: Optional[str] = "data/cache/gtfs/", service_days: Optional[List[str]] = None,
+                transfer_radius: Optional[float] = None) -> FeedDiff:
+    """
+    Switches a loaded feed to the one now in gtfs_folder: parses it, diffs it against the loaded
+    tables, patches the derived structures with apply_feed_diff, rebuilds the routing indexes the old
+    feed had with warm_like and only then replaces the tables of gtfs_data in place, so no plan after
+    the swap pays for an index build. The snapshot is rewritten so other processes load the new feed directly.
+    :param gtfs_data: loaded GTFS dataset, updated in place
+    :param gtfs_folder: path to folder containing the new GTFS txt files
+    :param cache_dir: folder for the parsed snapshot, or None to skip writing it
+    :param service_days: same restriction as passed to load_gtfs_files, if any
+    :param transfer_radius: radius of the footpaths to carry over, by default the one the feed was loaded with
+    :return: FeedDiff describing what changed
+    """
+    if transfer_radius is None:
+        transfer_radius = get_transfer_radius(gtfs_data)
+    fingerprint = compute_feed_fingerprint(gtfs_folder)
+    new_data = read_gtfs_folder(gtfs_folder, service_days)
+    set_transfer_radius(new_data, transfer_radius)
+    diff = diff_feeds(gtfs_data, new_data)
+    apply_feed_diff(gtfs_data, new_data, diff, transfer_radius)
+    warm_like(gtfs_data, new_data)
+
+    if cache_dir is not None:
+        cache_dir = snapshot_dir(cache_dir, service_days)
+        try:
+            save_snapshot(cache_dir, fingerprint, new_data)
+        except OSError as e:
+            print(f"Could not write GTFS snapshot to {cache_dir}: {e}")
+        precompute_compiled_timetable(new_data, cache_dir, fingerprint, transfer_radius)
+
+    for key in set(gtfs_data) - set(new_data):
+        del gtfs_data[key]
+    gtfs_data.update(new_data)
+    return diff
@@ -0,0 +1,157 @@
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.stop_index import get_stop_index
+from core.timetable import TimetableIndex, get_timetable_index
+from utils.distance import estimate_walking_seconds_array
+from utils.memo import cached_on, clear_cached, peek_cached
+
+DEFAULT_TRANSFER_RADIUS_M = 250.0
+
+# CSR adjacency: (offsets per stop code, neighbour stop codes, walk seconds)
+Footpaths = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def build_footpaths(timetable: TimetableIndex, stops_df: pd.DataFrame,
+                    transfer_radius: float = DEFAULT_TRANSFER_RADIUS_M) -> Footpaths:
+    """
+    Finds walking transfers between every pair of served stops within transfer_radius meters.
+    :param timetable: TimetableIndex whose stop codes the footpaths refer to
+    :param stops_df: stops.txt DataFrame with coordinates
+    :param transfer_radius: max transfer walk in meters
+    :return: CSR tuple of (offsets per stop code, neighbour stop codes, walk seconds)
+    """
+    stop_index = get_stop_index(stops_df)
+    n_codes = len(timetable.stop_id_values)
+
+    # StopIndex position -> timetable stop code, -1 for stops no trip serves
+    code_of_position = np.full(len(stop_index), -1, dtype=np.int64)
+    for code, stop_id in enumerate(timetable.stop_id_values):
+        pos = stop_index.position_of(stop_id)
+        if pos >= 0:
+            code_of_position[pos] = code
+
+    offsets = np.zeros(n_codes + 1, dtype=np.int64)
+    targets = []
+    walk_secs = []
+    for code, stop_id in enumerate(timetable.stop_id_values):
+        pos = stop_index.position_of(stop_id)
+        if pos >= 0:
+            positions, distances = stop_index.query_radius(stop_index.lats[pos], stop_index.lngs[pos], transfer_radius)
+            neighbour_codes = code_of_position[positions]
+            keep = (neighbour_codes >= 0) & (neighbour_codes != code)
+            targets.extend(neighbour_codes[keep].tolist())
+            walk_secs.extend(estimate_walking_seconds_array(distances[keep]).tolist())
+        offsets[code + 1] = len(targets)
+
+    return offsets, np.array(targets, dtype=np.int32), np.array(walk_secs, dtype=np.int32)
+
+
+def footpaths_path(cache_dir: str, transfer_radius: float) -> str:
+    """
+    :param cache_dir: feed snapshot folder
+    :param transfer_radius: max transfer walk in meters
+    :return: path of the persisted footpath graph for that radius
+    """
+    return os.path.join(cache_dir, f"footpaths-{transfer_radius:g}m.npz")
+
+
+def save_footpaths(cache_dir: str, fingerprint: str, transfer_radius: float,
+                   stop_ids: np.ndarray, footpaths: Footpaths) -> None:
+    """
+    Writes a footpath graph next to the feed snapshot, tagged with the feed fingerprint and the
+    stop_ids its codes refer to.
+    :param cache_dir: feed snapshot folder
+    :param fingerprint: fingerprint of the feed the graph was built from
+    :param transfer_radius: max transfer walk in meters
+    :param stop_ids: stop_ids in stop code order
+    :param footpaths: CSR tuple from build_footpaths
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = footpaths_path(cache_dir, transfer_radius)
+    tmp_path = path + ".tmp"
+    offsets, targets, walk_secs = footpaths
+    with open(tmp_path, "wb") as f:
+        np.savez(f, fingerprint=np.array(fingerprint), stop_ids=np.array(stop_ids, dtype=str),
+                 offsets=offsets, targets=targets, walk_secs=walk_secs)
+    os.replace(tmp_path, path)
+
+
+def load_footpaths(cache_dir: str, fingerprint: str, transfer_radius: float,
+                   stop_ids: np.ndarray) -> Optional[Footpaths]:
+    """
+    Loads a persisted footpath graph if it was built from the same feed and stop codes.
+    :param cache_dir: feed snapshot folder
+    :param fingerprint: fingerprint of the feed currently on disk
+    :param transfer_radius: max transfer walk in meters
+    :param stop_ids: stop_ids in stop code order
+    :return: CSR tuple, or None if missing or stale
+    """
+    try:
+        with np.load(footpaths_path(cache_dir, transfer_radius)) as saved:
+            if str(saved["fingerprint"]) != fingerprint or \
+                    not np.array_equal(saved["stop_ids"], np.array(stop_ids, dtype=str)):
+                return None
+            return saved["offsets"], saved["targets"], saved["walk_secs"]
+    except (FileNotFoundError, KeyError, ValueError, EOFError):
+        return None
+
+
+def set_transfer_radius(gtfs_data: Dict[str, pd.DataFrame], transfer_radius: float) -> None:
+    """
+    Records the transfer radius a feed was loaded with, so the routers use footpaths of that radius.
+    :param gtfs_data: loaded GTFS dataset
+    :param transfer_radius: max transfer walk in meters
+    """
+    clear_cached(gtfs_data["stop_times"], "transfer_radius")
+    cached_on(gtfs_data["stop_times"], "transfer_radius", lambda _: float(transfer_radius))
+
+
+def get_transfer_radius(gtfs_data: Dict[str, pd.DataFrame]) -> float:
+    """
+    :param gtfs_data: loaded GTFS dataset
+    :return: transfer radius in meters recorded by set_transfer_radius, DEFAULT_TRANSFER_RADIUS_M if none was
+    """
+    transfer_radius = peek_cached(gtfs_data["stop_times"], "transfer_radius")
+    return DEFAULT_TRANSFER_RADIUS_M if transfer_radius is None else transfer_radius
+
+
+def get_footpaths(gtfs_data: Dict[str, pd.DataFrame], transfer_radius: Optional[float] = None) -> Footpaths:
+    """
+    Returns the process-wide footpaths for a feed, building them on first use unless
+    precompute_footpaths already loaded them from the feed cache.
+    :param gtfs_data: loaded GTFS dataset
+    :param transfer_radius: max transfer walk in meters, by default the radius the feed was loaded with
+    :return: CSR tuple of (offsets per stop code, neighbour stop codes, walk seconds)
+    """
+    if transfer_radius is None:
+        transfer_radius = get_transfer_radius(gtfs_data)
+    return cached_on(gtfs_data["stop_times"], f"footpaths:{float(transfer_radius):g}",
+                     lambda stop_times_df: build_footpaths(get_timetable_index(stop_times_df),
+                                                           gtfs_data["stops"], transfer_radius))
+
+
+def precompute_footpaths(gtfs_data: Dict[str, pd.DataFrame], cache_dir: str, fingerprint: str,
+                         transfer_radius: float = DEFAULT_TRANSFER_RADIUS_M) -> Footpaths:
+    """
+    Build step run at feed load: reuses the footpath graph persisted with the feed snapshot, or
+    builds and persists it, then registers it so get_footpaths never computes it during a search.
+    :param gtfs_data: loaded GTFS dataset
+    :param cache_dir: feed snapshot folder
+    :param fingerprint: fingerprint of the feed currently on disk
+    :param transfer_radius: max transfer walk in meters
+    :return: CSR tuple of (offsets per stop code, neighbour stop codes, walk seconds)
+    """
+    stop_ids = get_timetable_index(gtfs_data["stop_times"]).stop_id_values
+    footpaths = load_footpaths(cache_dir, fingerprint, transfer_radius, stop_ids)
+    if footpaths is None:
+        footpaths = get_footpaths(gtfs_data, transfer_radius)
+        try:
+            save_footpaths(cache_dir, fingerprint, transfer_radius, stop_ids, footpaths)
+        except OSError as e:
+            print(f"Could not write footpaths to {cache_dir}: {e}")
+        return footpaths
+    return cached_on(gtfs_data["stop_times"], f"footpaths:{float(transfer_radius):g}", lambda _: footpaths)
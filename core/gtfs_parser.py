@@ -1,12 +1,40 @@
+import numpy as np
 import pandas as pd
 import os
-from typing import Dict, List
+from pandas.api.types import union_categoricals
+from typing import Dict, List, Optional, Tuple
+from core.footpaths import DEFAULT_TRANSFER_RADIUS_M, precompute_footpaths, set_transfer_radius
+from core.feed_cache import compute_feed_fingerprint, load_snapshot, save_snapshot
+from core.service_calendar import get_service_calendar, get_service_trip_index
+from core.timetable import TimetableIndex, get_timetable_index
+from utils.memo import cached_on, peek_cached
 
+STOP_TIMES_CHUNK_SIZE = 250_000
+# Compact dtypes for the stop_times.txt columns we know; ids and times become categoricals after filtering
+STOP_TIMES_DTYPES = {
+    "trip_id": str,
+    "arrival_time": str,
+    "departure_time": str,
+    "stop_id": str,
+    "stop_sequence": "int32",
+    "stop_headsign": str,
+    "pickup_type": "Int8",
+    "drop_off_type": "Int8",
+    "timepoint": "Int8",
+    "shape_dist_traveled": "float32"
+}
 
-def load_gtfs_files(gtfs_folder: str = "data/gtfs/") -> Dict[str, pd.DataFrame]:
+
+def read_gtfs_folder(gtfs_folder: str = "data/gtfs/", service_days: Optional[List[str]] = None,
+                     chunk_size: int = STOP_TIMES_CHUNK_SIZE) -> Dict[str, pd.DataFrame]:
     """
-    Load all GTFS CSV files from folder into a dict of dataframes.
+    Parse all GTFS CSV files from folder into a dict of dataframes, bypassing the snapshot cache.
+    Columns ending in _id are stored as categoricals so repeated ids share one string object.
+    When service_days is given, stop_times.txt is streamed with load_stop_times_for_trips and
+    only rows for trips running on those days are kept.
     :param gtfs_folder: path to folder containing GTFS txt files
+    :param service_days: optional list of day names ("monday", ...) to restrict stop_times to
+    :param chunk_size: stop_times rows read per chunk when streaming
     :return: dict with keys: stops, routes, trips, stop_times, calendar
     """
     gtfs_data = {}
@@ -15,29 +43,181 @@ def load_gtfs_files(gtfs_folder: str = "data/gtfs/") -> Dict[str, pd.DataFrame]:
         if filename.endswith(".txt"):
             # Replace .txt for the key in gtfs_data
             key = filename.replace(".txt", "")
+            if key == "stop_times" and service_days is not None:
+                continue
             full_path = os.path.join(gtfs_folder, filename)
-            df = pd.read_csv(full_path)
-            for col in df.columns:
-                if col.endswith("_id"):
-                    # Ensure ids such as trip_id, service_id, stop_id are treated as strings
-                    df[col] = df[col].astype(str)
-            gtfs_data[key] = df
+            header = pd.read_csv(full_path, nrows=0).columns
+            # Ensure ids such as trip_id, service_id, stop_id are treated as strings
+            id_dtypes = {col: "category" for col in header if col.endswith("_id")}
+            gtfs_data[key] = pd.read_csv(full_path, dtype=id_dtypes)
+
+    stop_times_path = os.path.join(gtfs_folder, "stop_times.txt")
+    if service_days is not None and os.path.exists(stop_times_path):
+        active_trips = set()
+        for day in service_days:
+            active_services = get_active_service_ids(day, gtfs_data["calendar"])
+            active_trips.update(filter_trips_by_service(gtfs_data["trips"], active_services))
+        stop_ids = gtfs_data["stops"]["stop_id"].astype(str).unique() if "stops" in gtfs_data else None
+        gtfs_data["stop_times"] = load_stop_times_for_trips(stop_times_path, active_trips, stop_ids, chunk_size)
+
+    return gtfs_data
+
+
+def load_stop_times_for_trips(stop_times_path: str, trip_ids, stop_ids=None,
+                              chunk_size: int = STOP_TIMES_CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Streams stop_times.txt in chunks with compact dtypes, keeping only rows whose trip is in trip_ids.
+    Peak memory is one chunk plus the rows kept so far rather than the whole file.
+    :param stop_times_path: path to stop_times.txt
+    :param trip_ids: trip_ids to keep
+    :param stop_ids: optional full list of stop_ids, so stop_id shares one category set with stops.txt
+    :param chunk_size: rows read per chunk
+    :return: stop_times DataFrame with categorical ids and times, int32 stop_sequence
+    """
+    header = pd.read_csv(stop_times_path, nrows=0).columns
+    dtypes = {col: dtype for col, dtype in STOP_TIMES_DTYPES.items() if col in header}
+    trip_dtype = pd.CategoricalDtype(sorted(str(trip_id) for trip_id in trip_ids))
+    stop_dtype = pd.CategoricalDtype(sorted(stop_ids)) if stop_ids is not None else None
+
+    kept = []
+    unknown_stops = 0
+    for chunk in pd.read_csv(stop_times_path, dtype=dtypes, chunksize=chunk_size):
+        trip_col = chunk["trip_id"].astype(trip_dtype)
+        chunk = chunk[trip_col.notna()]
+        if chunk.empty:
+            continue
+        chunk = chunk.assign(trip_id=trip_col[trip_col.notna()])
+        if stop_dtype is not None:
+            stop_col = chunk["stop_id"].astype(stop_dtype)
+            # Stops missing from stops.txt become NaN here and could never be routed through
+            known = stop_col.notna()
+            unknown_stops += int((~known).sum())
+            chunk = chunk[known].assign(stop_id=stop_col[known])
+            if chunk.empty:
+                continue
+        for col in ("arrival_time", "departure_time"):
+            if col in chunk:
+                # Few distinct times per chunk, so categoricals are far smaller than strings
+                chunk[col] = chunk[col].astype("category")
+        kept.append(chunk)
+
+    if unknown_stops:
+        print(f"Dropped {unknown_stops} stop_times rows whose stop_id is not in stops.txt")
+    if not kept:
+        empty = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+        empty["trip_id"] = empty["trip_id"].astype(trip_dtype)
+        return empty
+
+    stop_times = pd.concat(kept, ignore_index=True)
+    for col in ("arrival_time", "departure_time"):
+        # Chunks have different time categories, which concat turns back into strings
+        if col in stop_times and not isinstance(stop_times[col].dtype, pd.CategoricalDtype):
+            stop_times[col] = union_categoricals([chunk[col] for chunk in kept])
+    if stop_dtype is None:
+        stop_times["stop_id"] = stop_times["stop_id"].astype("category")
+    return stop_times
+
+
+def snapshot_dir(cache_dir: str, service_days: Optional[List[str]] = None) -> str:
+    """
+    :param cache_dir: base folder for parsed snapshots
+    :param service_days: optional list of day names the feed is restricted to
+    :return: folder of the snapshot; filtered feeds get their own next to the full one
+    """
+    if service_days is None:
+        return cache_dir
+    days = sorted(set(day.lower() for day in service_days))
+    return os.path.join(cache_dir, "days-" + "-".join(days))
+
+
+def load_gtfs_files(gtfs_folder: str = "data/gtfs/",
+                    cache_dir: Optional[str] = "data/cache/gtfs/",
+                    service_days: Optional[List[str]] = None,
+                    transfer_radius: Optional[float] = DEFAULT_TRANSFER_RADIUS_M,
+                    routing_only: bool = False, precompile: bool = False) -> Dict[str, pd.DataFrame]:
+    """
+    Load all GTFS CSV files from folder into a dict of dataframes.
+    A binary snapshot of the parsed tables is kept in cache_dir and reused on later starts
+    until any file in the feed changes, at which point the CSVs are parsed again. With precompile,
+    the timetable index, footpaths and route patterns are compiled next to it; any load finding a
+    current compiled file memory-maps it, so processes loading the same feed share them. The snapshot DataFrames themselves (stops, trips,
+    stop_times, ...) are unpickled into every process that calls this; with routing_only, stop_times
+    is skipped when the compiled timetable is current, which is all a planning worker needs.
+    :param gtfs_folder: path to folder containing GTFS txt files
+    :param cache_dir: folder for the parsed snapshot, or None to always parse the CSVs
+    :param service_days: optional list of day names; stop_times then only holds trips running on those days
+    :param transfer_radius: radius in meters of the stop-to-stop footpath graph persisted with the
+    snapshot and used by the routers for this feed (see footpaths.get_transfer_radius), or None to leave
+    footpaths and patterns to be built on first use with the default radius
+    :param routing_only: True to map the compiled timetable and leave stop_times as a zero-row stand-in
+    (see CompiledTimetable.stop_times_stub) when the compiled file matches the feed; only for processes
+    that plan but never diff or reload the feed
+    :param precompile: True to compile the timetable and footpaths into cache_dir now if they are not
+    current, for services that start planning workers; otherwise, without a current compiled file,
+    they are built in memory on first use
+    :return: dict with keys: stops, routes, trips, stop_times, calendar
+    """
+    if cache_dir is None:
+        gtfs_data = read_gtfs_folder(gtfs_folder, service_days)
+        if transfer_radius is not None and "stop_times" in gtfs_data:
+            set_transfer_radius(gtfs_data, transfer_radius)
+        return gtfs_data
+
+    cache_dir = snapshot_dir(cache_dir, service_days)
+    fingerprint = compute_feed_fingerprint(gtfs_folder)
+    if routing_only and transfer_radius is not None:
+        from core.compiled_timetable import (attach_compiled_timetable, compiled_timetable_path,
+                                             load_compiled_timetable)
+        compiled = load_compiled_timetable(compiled_timetable_path(cache_dir, transfer_radius), fingerprint)
+        gtfs_data = load_snapshot(cache_dir, fingerprint, skip=("stop_times",)) if compiled is not None else None
+        if gtfs_data is not None:
+            gtfs_data["stop_times"] = compiled.stop_times_stub()
+            set_transfer_radius(gtfs_data, transfer_radius)
+            attach_compiled_timetable(gtfs_data, compiled)
+            return gtfs_data
+
+    gtfs_data = load_snapshot(cache_dir, fingerprint)
+    if gtfs_data is None:
+        gtfs_data = read_gtfs_folder(gtfs_folder, service_days)
+        try:
+            save_snapshot(cache_dir, fingerprint, gtfs_data)
+        except OSError as e:
+            print(f"Could not write GTFS snapshot to {cache_dir}: {e}")
+
+    if transfer_radius is not None and "stop_times" in gtfs_data:
+        set_transfer_radius(gtfs_data, transfer_radius)
+    if transfer_radius is not None and "stop_times" in gtfs_data and "stops" in gtfs_data:
+        # Imported here because the compiled timetable is built from this module's route patterns
+        from core.compiled_timetable import (attach_compiled_timetable, compiled_timetable_path,
+                                             load_compiled_timetable, precompute_compiled_timetable)
+        if precompile:
+            if precompute_compiled_timetable(gtfs_data, cache_dir, fingerprint, transfer_radius) is None:
+                precompute_footpaths(gtfs_data, cache_dir, fingerprint, transfer_radius)
+        else:
+            compiled = load_compiled_timetable(compiled_timetable_path(cache_dir, transfer_radius), fingerprint)
+            if compiled is not None:
+                attach_compiled_timetable(gtfs_data, compiled)
 
     return gtfs_data
 
 
-def get_active_service_ids(day_of_week: str, calendar_df: pd.DataFrame) -> List[str]:
+def get_active_service_ids(day_of_week: str, calendar_df: pd.DataFrame,
+                           service_date=None, calendar_dates_df: Optional[pd.DataFrame] = None) -> List[str]:
     """
     Filters calendar to return list of service_ids running on a given day of the week.
+    When service_date is given, start_date/end_date and calendar_dates exceptions are honoured too.
     :param day_of_week: "monday", "tuesday", etc.
     :param calendar_df: calendar.txt DataFrame
+    :param service_date: optional date (datetime.date or "YYYYMMDD") to restrict to services running that day
+    :param calendar_dates_df: optional calendar_dates.txt DataFrame
     :return: list of active service_ids
     """
-    day_of_week = day_of_week.lower()
-    filtered = calendar_df[calendar_df[day_of_week] == 1]
-
-    active_ids = filtered["service_id"].tolist()
-    return active_ids
+    service_calendar = get_service_calendar(calendar_df, calendar_dates_df)
+    if service_date is not None:
+        active_ids = service_calendar.services_on_date(service_date)
+    else:
+        active_ids = service_calendar.services_on_weekday(day_of_week)
+    return active_ids.tolist()
 
 
 def filter_trips_by_service(trips_df: pd.DataFrame, active_services: List[str]) -> List[str]:
@@ -48,41 +228,229 @@ def filter_trips_by_service(trips_df: pd.DataFrame, active_services: List[str])
     :param active_services: list of active service_ids
     :return: list of active trips via trip_ids
     """
-    filtered = trips_df[trips_df["service_id"].isin(active_services)]
-    active_trips = filtered["trip_id"].tolist()
-    return active_trips
+    active_trips = get_service_trip_index(trips_df).trips_for_services(active_services)
+    return active_trips.tolist()
+
+
+def get_active_trips(gtfs_data: Dict[str, pd.DataFrame], service_date) -> np.ndarray:
+    """
+    Returns every trip running on a date as a shared read-only array, without filtering any DataFrame.
+    :param gtfs_data: loaded GTFS dataset
+    :param service_date: datetime.date or "YYYYMMDD"
+    :return: array of active trip_ids
+    """
+    service_calendar = get_service_calendar(gtfs_data["calendar"], gtfs_data.get("calendar_dates"))
+    active_services = service_calendar.services_on_date(service_date)
+    return get_service_trip_index(gtfs_data["trips"]).trips_for_services(active_services)
 
 
 def get_stop_times_for_trip(trip_id: str, stop_times_df: pd.DataFrame) -> List[str]:
     """
     Retrieves all stop times from a specific trip, ordered by stop sequence from stop_times.txt
+    Lookups go through the shared TimetableIndex, which sorts stop_times once per DataFrame.
     :param trip_id: the ID of the trip to retrieve stops for
     :param stop_times_df: stop_times.txt DataFrame
     :return: list of stop_ids in the order visited by the trip
     """
-    filtered = stop_times_df[stop_times_df["trip_id"] == trip_id]
+    stop_times_in_trip = get_timetable_index(stop_times_df).stops_for_trip(trip_id)
+    return stop_times_in_trip.tolist()
+
+
+class RoutePattern:
+    """
+    Group of trips on one route that visit exactly the same stops in the same order.
+    The stop array is shared by every trip, and trips are rows of dense (trips x stops) time
+    matrices sorted by first departure. Trips in a pattern never overtake each other, so every
+    column of departures is sorted and the earliest catchable trip at a stop is a binary search.
+    """
+    __slots__ = ("route_id", "stops", "trip_ids", "headsigns", "direction_names", "arrivals", "departures")
 
-    # Get all stops in chronological order
-    filtered = filtered.sort_values("stop_sequence")
+    def __init__(self, route_id: str, stops: np.ndarray, trip_ids: np.ndarray, headsigns: np.ndarray,
+                 direction_names: np.ndarray, arrivals: np.ndarray, departures: np.ndarray):
+        """
+        :param route_id: GTFS route_id shared by all trips
+        :param stops: stop codes visited, in order
+        :param trip_ids: trip_ids, one per matrix row
+        :param headsigns: trip_headsign per row
+        :param direction_names: trip_direction_name per row
+        :param arrivals: (trips x stops) arrival seconds
+        :param departures: (trips x stops) departure seconds
+        """
+        self.route_id = route_id
+        self.stops = stops
+        self.trip_ids = trip_ids
+        self.headsigns = headsigns
+        self.direction_names = direction_names
+        self.arrivals = arrivals
+        self.departures = departures
 
-    stop_times_in_trip = filtered["stop_id"].tolist()
-    return stop_times_in_trip
+    def __len__(self) -> int:
+        return len(self.trip_ids)
+
+    def earliest_trip(self, pos: int, ready_secs: int) -> int:
+        """
+        :param pos: position of the stop in self.stops
+        :param ready_secs: time the traveller is at the stop, in seconds
+        :return: row of the first trip departing at or after ready_secs, or -1 if none does
+        """
+        row = int(np.searchsorted(self.departures[:, pos], ready_secs, side="left"))
+        return row if row < len(self.trip_ids) else -1
+
+
+class RoutePatternList(list):
+    """
+    List of RoutePatterns with a trip_id -> (pattern, row) lookup.
+    """
+
+    def __init__(self, patterns: List[RoutePattern]):
+        super().__init__(patterns)
+        self.trip_rows: Dict[str, Tuple[int, int]] = {
+            str(trip_id): (p, row) for p, pattern in enumerate(patterns) for row, trip_id in enumerate(pattern.trip_ids)
+        }
+
+    def pattern_for_trip(self, trip_id: str) -> Optional[RoutePattern]:
+        """
+        :param trip_id: GTFS trip_id
+        :return: the pattern containing the trip, or None if the trip is not in any pattern
+        """
+        found = self.trip_rows.get(str(trip_id))
+        return self[found[0]] if found is not None else None
+
+
+def _carry_times_forward(times: np.ndarray) -> np.ndarray:
+    # Non-timepoint stops have no published time; carry the previous stop's time forward
+    return np.maximum.accumulate(times)
+
+
+def build_route_patterns(trips_df: pd.DataFrame, active_trips: List[str],
+                         timetable: TimetableIndex) -> RoutePatternList:
+    """
+    Groups active trips into RoutePatterns by route and identical stop sequence, splitting
+    groups further where one trip would overtake another.
+    :param trips_df: trips.txt DataFrame
+    :param active_trips: trip_ids running on the service day
+    :param timetable: TimetableIndex over stop_times
+    :return: RoutePatternList
+    """
+    trip_keys = trips_df["trip_id"].astype(str)
+    trip_routes = dict(zip(trip_keys, trips_df["route_id"].astype(str)))
+    empty = pd.Series("", index=trips_df.index)
+    trip_headsigns = dict(zip(trip_keys, trips_df.get("trip_headsign", empty).fillna("")))
+    trip_directions = dict(zip(trip_keys, trips_df.get("trip_direction_name", empty).fillna("")))
+
+    groups: Dict[Tuple[str, bytes], List[Tuple[str, np.ndarray, np.ndarray]]] = {}
+    for trip_id in active_trips:
+        trip_slice = timetable.trip_slice(trip_id)
+        if trip_slice.stop - trip_slice.start < 2:
+            continue
+        stops = timetable.stop_codes[trip_slice]
+        key = (trip_routes.get(trip_id), stops.tobytes())
+        arrivals = _carry_times_forward(timetable.arrival_secs[trip_slice])
+        departures = _carry_times_forward(timetable.departure_secs[trip_slice])
+        groups.setdefault(key, []).append((trip_id, arrivals, departures))
+
+    patterns = []
+    for (route_id, stop_bytes), members in groups.items():
+        stops = np.frombuffer(stop_bytes, dtype=np.int32)
+        members.sort(key=lambda member: int(member[2][0]))
+        arrivals = np.vstack([member[1] for member in members]).astype(np.int64)
+        departures = np.vstack([member[2] for member in members]).astype(np.int64)
+
+        for rows in split_fifo(arrivals, departures):
+            trip_ids = [members[row][0] for row in rows]
+            patterns.append(RoutePattern(
+                route_id=route_id,
+                stops=stops,
+                trip_ids=np.array(trip_ids, dtype=object),
+                headsigns=np.array([trip_headsigns.get(trip_id, "") for trip_id in trip_ids], dtype=object),
+                direction_names=np.array([trip_directions.get(trip_id, "") for trip_id in trip_ids], dtype=object),
+                arrivals=arrivals[rows],
+                departures=departures[rows]
+            ))
+
+    return RoutePatternList(patterns)
+
+
+def split_fifo(arrivals: np.ndarray, departures: np.ndarray) -> List[List[int]]:
+    """
+    Greedy FIFO split of trips sharing a stop sequence: each trip joins the first group it does
+    not overtake, so times in every column of a group are sorted.
+    :param arrivals: (trips x stops) arrival seconds, rows sorted by first departure
+    :param departures: (trips x stops) departure seconds, same rows
+    :return: list of row lists, one per group, each in the original row order
+    """
+    groups: List[List[int]] = []
+    for row in range(len(arrivals)):
+        for group in groups:
+            last = group[-1]
+            if np.all(arrivals[last] <= arrivals[row]) and np.all(departures[last] <= departures[row]):
+                group.append(row)
+                break
+        else:
+            groups.append([row])
+    return groups
+
+
+def get_route_patterns(gtfs_data: Dict[str, pd.DataFrame], day_of_week: str) -> RoutePatternList:
+    """
+    Returns the process-wide route patterns for a feed and service day, building them on first use.
+    :param gtfs_data: loaded GTFS dataset
+    :param day_of_week: "monday", "tuesday", etc.
+    :return: RoutePatternList of the trips active that day
+    """
+    day_of_week = day_of_week.lower()
+
+    def build(stop_times_df: pd.DataFrame) -> RoutePatternList:
+        active_services = get_active_service_ids(day_of_week, gtfs_data["calendar"])
+        active_trips = filter_trips_by_service(gtfs_data["trips"], active_services)
+        return build_route_patterns(gtfs_data["trips"], active_trips, get_timetable_index(stop_times_df))
+
+    return cached_on(gtfs_data["stop_times"], f"route_patterns:{day_of_week}", build)
+
+
+def get_current_route_patterns(gtfs_data: Dict[str, pd.DataFrame], day_of_week: str) -> RoutePatternList:
+    """
+    Returns the route patterns the routers search: the ones a DelayOverlay keeps with its delays
+    laid over them when there is one for the day, the static get_route_patterns otherwise.
+    Anything written to disk or carried across a feed reload must use the static patterns.
+    :param gtfs_data: loaded GTFS dataset
+    :param day_of_week: "monday", "tuesday", etc.
+    :return: RoutePatternList of the trips active that day
+    """
+    day_of_week = day_of_week.lower()
+    delayed = peek_cached(gtfs_data["stop_times"], f"delayed_route_patterns:{day_of_week}")
+    return delayed if delayed is not None else get_route_patterns(gtfs_data, day_of_week)
 
 
-def get_route_for_trip(trip_id: str, trips_df: pd.DataFrame, routes_df: pd.DataFrame) -> str:
+def get_route_for_trip(trip_id: str, trips_df: pd.DataFrame, routes_df: pd.DataFrame,
+                       pattern: Optional[RoutePattern] = None, row: Optional[int] = None) -> str:
     """
     Provides readable route names for CLI output based on a trip found via trip_id
+    When the trip's RoutePattern is given, names come from the pattern instead of scanning trips_df.
+    A missing headsign or direction name is left out on either path.
     :param trip_id: the ID of the trip to retrieve name for
     :param trips_df: trips.txt DataFrame
     :param routes_df: routes.txt DataFrame
+    :param pattern: optional RoutePattern containing the trip
+    :param row: optional row of the trip in pattern, e.g. from RoutePatternList.trip_rows; searched for if omitted
     :return: string name/description of route the trip is a part of
     """
-    trip_row = trips_df[trips_df["trip_id"] == trip_id]
-    if trip_row.empty:
-        return f"Trip ID '{trip_id}' not found."
-    route_id = trip_row["route_id"].item()
-    trip_headsign = trip_row["trip_headsign"].item()
-    trip_direction = trip_row["trip_direction_name"].item()
+    if pattern is not None and row is None:
+        rows = np.flatnonzero(pattern.trip_ids == trip_id)
+        row = int(rows[0]) if len(rows) else None
+    if pattern is not None and row is not None:
+        route_id = pattern.route_id
+        trip_headsign = pattern.headsigns[row]
+        trip_direction = pattern.direction_names[row]
+    else:
+        trip_row = trips_df[trips_df["trip_id"] == trip_id]
+        if trip_row.empty:
+            return f"Trip ID '{trip_id}' not found."
+        trip = trip_row.iloc[0]
+        route_id = trip["route_id"]
+        # Blank cells are NaN here but "" in the patterns, see build_route_patterns
+        trip_headsign = "" if pd.isna(trip.get("trip_headsign")) else str(trip.get("trip_headsign"))
+        trip_direction = "" if pd.isna(trip.get("trip_direction_name")) else str(trip.get("trip_direction_name"))
 
     route_row = routes_df[routes_df["route_id"] == route_id]
     if route_row.empty:
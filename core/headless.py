@@ -0,0 +1,210 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+import core.schedule_parser as schedule_parser
+from core.buildings import BuildingIndex, get_building_index, load_buildings
+from core.csa import get_connection_table
+from core.delay_overlay import DelayOverlay
+from core.feed_cache import compute_feed_fingerprint
+from core.gtfs_parser import load_gtfs_files
+from core.plan_cache import PlanCache
+from core.raptor import DEFAULT_MAX_RIDES, get_raptor_data
+from core.route_planner import DEFAULT_MAX_WALKING_DISTANCE, PLANNER_MODES, plan_route
+from core.service_calendar import WEEKDAYS
+from core.travel_matrix import DEFAULT_MATRIX_DIR, TravelTimeMatrix, load_travel_time_matrix
+from utils.distance import WalkingTimes, get_walking_times
+
+
+class AutoAcceptRules:
+    """
+    Decides which building matches are accepted without a prompt in headless runs.
+    """
+
+    def __init__(self, min_score: float = 80.0, accept_fuzzy: bool = True, aliases: Optional[Dict[str, str]] = None):
+        """
+        :param min_score: minimum fuzzy score (0-100) for the best candidate to be accepted
+        :param accept_fuzzy: False to only accept exact matches and aliases
+        :param aliases: dict of user building name -> official name applied before any matching
+        """
+        self.min_score = min_score
+        self.accept_fuzzy = accept_fuzzy
+        self.aliases = dict(aliases or {})
+
+    @classmethod
+    def from_dict(cls, rules: Optional[Dict[str, Any]]) -> "AutoAcceptRules":
+        """
+        :param rules: dict with optional min_score, accept_fuzzy and aliases keys
+        :return: AutoAcceptRules with defaults for the missing keys
+        """
+        rules = rules or {}
+        return cls(float(rules.get("min_score", 80.0)), bool(rules.get("accept_fuzzy", True)), rules.get("aliases"))
+
+
+def resolve_building_names(user_buildings: List[str], building_index: BuildingIndex,
+                           rules: Optional[AutoAcceptRules] = None) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Non-interactive version of cli.match_and_confirm_buildings: aliases, exact matches and,
+    if the rules allow it, the best fuzzy match of every other name are accepted without prompting.
+    :param user_buildings: unique building names from a schedule
+    :param building_index: BuildingIndex over the official buildings
+    :param rules: AutoAcceptRules, defaults to accepting fuzzy matches scoring at least 80
+    :return: tuple of (user name -> official name, names that could not be matched)
+    """
+    rules = rules or AutoAcceptRules()
+    name_mapping = {}
+    remaining = []
+    for name in user_buildings:
+        alias = rules.aliases.get(name)
+        if alias is not None and building_index.get(alias) is not None:
+            name_mapping[name] = building_index.get(alias)["name"]
+        else:
+            remaining.append(name)
+
+    match_results = building_index.match(remaining, score_cutoff=rules.min_score)
+    name_mapping.update(match_results["exact_matches"])
+    unmatched = list(match_results["unmatched"])
+    if rules.accept_fuzzy:
+        name_mapping.update(match_results["best_matches"])
+    else:
+        unmatched.extend(match_results["best_matches"])
+    return name_mapping, unmatched
+
+
+def plan_schedule(schedule_data: Union[List[Dict[str, Any]], pd.DataFrame], gtfs_data: Dict[str, Any],
+                  building_index: BuildingIndex,
+                  max_walking_distance: float = DEFAULT_MAX_WALKING_DISTANCE, max_rides: int = DEFAULT_MAX_RIDES,
+                  home: Optional[Dict[str, float]] = None, mode: str = "raptor",
+                  plan_cache: Optional[PlanCache] = None, rules: Optional[AutoAcceptRules] = None,
+                  walking_times: Optional[WalkingTimes] = None,
+                  travel_matrix: Optional[TravelTimeMatrix] = None) -> Dict[str, Any]:
+    """
+    Runs the schedule pipeline (validate, match buildings, attach coordinates, plan) without
+    prompting or exiting; every problem is reported in the returned errors list instead.
+    :param schedule_data: list of class dicts or a DataFrame with day, start_time, end_time and building;
+    every stage runs column-wise, see schedule_parser.validate_schedule_frame
+    :param gtfs_data: loaded GTFS dataset
+    :param building_index: BuildingIndex over the official buildings
+    :param max_walking_distance: max walk to or from a stop in meters
+    :param max_rides: cap on the number of buses per journey
+    :param home: optional dict with lat/long keys used as the origin of each day's first class
+    :param mode: "raptor" or "csa", see route_planner.plan_journeys
+    :param plan_cache: optional PlanCache shared across calls
+    :param rules: AutoAcceptRules for building matches, see resolve_building_names
+    :param walking_times: optional WalkingTimes for street walking times, see route_planner.plan_journeys
+    :param travel_matrix: optional TravelTimeMatrix for the walk-or-bus suggestions, see route_planner.plan_route
+    :return: dict with plan, building_mapping and errors
+    """
+    errors = []
+    if mode not in PLANNER_MODES:
+        return {"plan": {}, "building_mapping": {}, "errors": [f"Unknown planner mode '{mode}'."]}
+
+    try:
+        frame = schedule_data if isinstance(schedule_data, pd.DataFrame) else pd.DataFrame(list(schedule_data))
+        if frame.empty:
+            return {"plan": {}, "building_mapping": {}, "errors": []}
+        validated, invalid = schedule_parser.validate_schedule_frame(frame)
+        user_buildings = schedule_parser.unique_building_names(validated)
+    except (KeyError, AttributeError, TypeError, ValueError) as e:
+        return {"plan": {}, "building_mapping": {}, "errors": [f"Malformed schedule: {e}"]}
+    if len(invalid):
+        errors.append(f"{len(invalid)} schedule rows have an invalid day or time.")
+    # Blank CSV cells arrive as NaN; those rows cannot be placed and are skipped with a message
+    missing_building = validated["building"].isna() | (validated["building"].astype(str).str.strip() == "")
+    if missing_building.any():
+        errors.append(f"{int(missing_building.sum())} schedule rows have no building and were skipped.")
+
+    name_mapping, unmatched = resolve_building_names(user_buildings, building_index, rules)
+    for name in unmatched:
+        errors.append(f"Building '{name}' could not be matched to any known building.")
+
+    placed, unplaced = schedule_parser.attach_official_buildings(validated, name_mapping, building_index)
+    # Unmatched names were reported above; only matched buildings without coordinates are left
+    for building, reason in unplaced.loc[unplaced["building"].isin(name_mapping), ["building", "reason"]] \
+            .drop_duplicates().itertuples(index=False):
+        errors.append(f"Error attaching coordinates for '{name_mapping[building]}': {reason}")
+
+    coordinates = placed.drop_duplicates("building")
+    building_coords = {building: {"lat": lat, "long": long}
+                       for building, lat, long in zip(coordinates["building"], coordinates["lat"], coordinates["long"])}
+    planned = placed.astype(object).where(placed.notna(), None).to_dict("records")
+
+    plan = plan_route(planned, building_coords, gtfs_data, max_walking_distance, max_rides,
+                      home=home, mode=mode, plan_cache=plan_cache, walking_times=walking_times,
+                      travel_matrix=travel_matrix)
+    return {"plan": plan, "building_mapping": name_mapping, "errors": errors}
+
+
+# Loaded once per process: in the server or batch runner before its pool forks, or by init_worker otherwise
+_state: Dict[str, Any] = {}
+
+
+def load_state(gtfs_folder: str = "data/gtfs/", cache_dir: Optional[str] = "data/cache/gtfs/",
+               buildings_path: str = "data/buildings.geojson", warm_days=WEEKDAYS,
+               trip_updates_path: Optional[str] = None,
+               travel_matrix_dir: Optional[str] = DEFAULT_MATRIX_DIR,
+               routing_only: bool = False) -> Dict[str, Any]:
+    """
+    Loads the feed, building data and per-day routing indexes into this process.
+    :param gtfs_folder: path to folder containing GTFS txt files
+    :param cache_dir: folder for the parsed feed snapshot
+    :param buildings_path: path to buildings JSON file
+    :param warm_days: service days whose RAPTOR and CSA indexes are built up front
+    :param trip_updates_path: optional GTFS-Realtime JSON file of delays for today, see delay_overlay
+    :param travel_matrix_dir: folder of a precomputed TravelTimeMatrix used for walk-or-bus suggestions when
+    it exists and matches the feed
+    :param routing_only: True in planning workers, which map the compiled timetable instead of reading
+    stop_times, see gtfs_parser.load_gtfs_files
+    :return: the process-wide state dict; walks to and from stops use cached Google walking times when
+    GOOGLE_API_KEY is set, and the straight-line estimate otherwise
+    """
+    if _state:
+        return _state
+    # Compiled here so planning workers started afterwards can map the timetable
+    gtfs_data = load_gtfs_files(gtfs_folder, cache_dir, routing_only=routing_only, precompile=True)
+    warm_routing_indexes(gtfs_data, warm_days)
+    plan_cache = PlanCache(gtfs_folder=gtfs_folder)
+    overlay = None
+    if trip_updates_path is not None:
+        overlay = DelayOverlay(gtfs_data, path=trip_updates_path, plan_cache=plan_cache)
+        overlay.refresh(force=True)
+    travel_matrix = None
+    if travel_matrix_dir is not None and os.path.isdir(travel_matrix_dir):
+        travel_matrix = load_travel_time_matrix(travel_matrix_dir, compute_feed_fingerprint(gtfs_folder))
+    _state.update({
+        "gtfs_data": gtfs_data,
+        "building_index": get_building_index(load_buildings(buildings_path)),
+        "plan_cache": plan_cache,
+        "delay_overlay": overlay,
+        "walking_times": get_walking_times(),
+        "travel_matrix": travel_matrix,
+        "gtfs_folder": gtfs_folder,
+        "cache_dir": cache_dir,
+        "warm_days": warm_days
+    })
+    return _state
+
+
+def warm_routing_indexes(gtfs_data: Dict[str, Any], days) -> None:
+    """
+    Builds the RAPTOR and CSA indexes of the given service days up front, so pools forked afterwards
+    share them and the first plans do not pay for them.
+    :param gtfs_data: loaded GTFS dataset
+    :param days: service day names
+    """
+    if "stop_times" in gtfs_data:
+        for day in days:
+            get_raptor_data(gtfs_data, day)
+            get_connection_table(gtfs_data, day)
+
+
+def init_worker(gtfs_folder: str, cache_dir: Optional[str], buildings_path: str,
+                trip_updates_path: Optional[str] = None) -> None:
+    """
+    Pool initializer shared by the server and batch runner; arguments as for load_state.
+    """
+    # Forked workers inherit the parent's state; spawned ones map the compiled routing arrays and only
+    # unpickle the small feed tables, never stop_times
+    load_state(gtfs_folder, cache_dir, buildings_path, warm_days=(), trip_updates_path=trip_updates_path,
+               routing_only=True)
@@ -0,0 +1,100 @@
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from core.buildings import get_building_index
+from core.csa import UNREACHED, get_connection_table
+from core.stop_index import get_stop_index
+from utils.distance import estimate_walking_seconds_array, haversine_distances_meters
+from utils.time_utils import to_seconds
+
+DEFAULT_MAX_WALKING_DISTANCE = 800.0
+
+
+class Isochrone:
+    """
+    Earliest arrival at every stop and every building from one origin and departure time.
+    Arrays are aligned with stop_ids and building_names, with UNREACHED where nothing gets there,
+    so "reachable within N minutes" is a single comparison.
+    """
+
+    def __init__(self, departure_secs: int, stop_ids: np.ndarray, stop_arrival_secs: np.ndarray,
+                 building_names: np.ndarray, building_arrival_secs: np.ndarray):
+        self.departure_secs = departure_secs
+        self.stop_ids = stop_ids
+        self.stop_arrival_secs = stop_arrival_secs
+        self.building_names = building_names
+        self.building_arrival_secs = building_arrival_secs
+
+    def stops_within(self, minutes: float) -> np.ndarray:
+        """
+        :param minutes: travel time budget
+        :return: stop_ids reachable within the budget
+        """
+        return self.stop_ids[self.stop_arrival_secs <= self.departure_secs + minutes * 60]
+
+    def buildings_within(self, minutes: float) -> np.ndarray:
+        """
+        :param minutes: travel time budget
+        :return: building names reachable within the budget, by walking, bus or both
+        """
+        return self.building_names[self.building_arrival_secs <= self.departure_secs + minutes * 60]
+
+
+def compute_isochrone(building_name: str, day_of_week: str, departure_time: Union[str, int],
+                      gtfs_data: Dict[str, pd.DataFrame], buildings_data: List[Dict[str, Any]],
+                      max_walking_distance: float = DEFAULT_MAX_WALKING_DISTANCE,
+                      max_minutes: float = None) -> Isochrone:
+    """
+    One-to-all search from a building: one forward Connection Scan gives the earliest arrival at
+    every stop, and each building then takes the best of walking there directly or walking from a stop.
+    :param building_name: official origin building name
+    :param day_of_week: "monday", "tuesday", etc.
+    :param departure_time: time leaving the building, as HH:MM:SS or seconds
+    :param gtfs_data: loaded GTFS dataset
+    :param buildings_data: list of building dictionaries or a BuildingIndex
+    :param max_walking_distance: max walk in meters between a building and a stop
+    :param max_minutes: optional budget; connections leaving after it are not scanned
+    :return: Isochrone with arrival arrays for stops and buildings
+    """
+    coordinates = get_building_index(buildings_data).coordinates(building_name)
+    if "error" in coordinates:
+        raise ValueError(f"{building_name}: {coordinates['error']}")
+    departure_secs = to_seconds(departure_time)
+    horizon = None if max_minutes is None else departure_secs + int(max_minutes * 60)
+
+    table = get_connection_table(gtfs_data, day_of_week)
+    stop_index = get_stop_index(gtfs_data["stops"])
+    # StopIndex position -> connection table stop code, -1 for stops no trip serves
+    codes = np.array([table.stop_code.get(stop_id, -1) for stop_id in stop_index.stop_ids], dtype=np.int64)
+
+    access = stop_index.stop_walks(coordinates["lat"], coordinates["long"], max_walking_distance, table.stop_code)
+    stop_arrivals = table.earliest_arrivals(access, departure_secs, horizon)
+
+    buildings = [b for b in get_building_index(buildings_data).by_name.values()
+                 if b.get("lat") is not None and b.get("long") is not None]
+    building_names = np.array([b["name"] for b in buildings], dtype=object)
+    lats = np.array([b["lat"] for b in buildings], dtype=np.float64)
+    lngs = np.array([b["long"] for b in buildings], dtype=np.float64)
+
+    direct = haversine_distances_meters(coordinates["lat"], coordinates["long"], lats, lngs)
+    building_arrivals = departure_secs + estimate_walking_seconds_array(direct)
+
+    served = codes >= 0
+    reached = np.zeros(len(codes), dtype=bool)
+    reached[served] = stop_arrivals[codes[served]] != UNREACHED
+    if reached.any():
+        reached_positions = np.flatnonzero(reached)
+        egress = stop_index.distance_matrix(lats, lngs)[:, reached_positions]
+        via_stop = stop_arrivals[codes[reached_positions]] + estimate_walking_seconds_array(egress)
+        via_stop[egress > max_walking_distance] = UNREACHED
+        building_arrivals = np.minimum(building_arrivals, via_stop.min(axis=1))
+
+    return Isochrone(
+        departure_secs=departure_secs,
+        stop_ids=table.stop_id_values,
+        stop_arrival_secs=stop_arrivals,
+        building_names=building_names,
+        building_arrival_secs=building_arrivals
+    )
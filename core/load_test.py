@@ -0,0 +1,93 @@
+import argparse
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+import core.schedule_parser as schedule_parser
+from core.client import PlannerClient
+from core.server import DEFAULT_HOST, DEFAULT_PORT
+
+
+def run_load_test(schedule: List[Dict[str, Any]], host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                  concurrency: int = 8, requests: int = 200, home: Dict[str, float] = None) -> Dict[str, Any]:
+    """
+    Sends the same schedule from several client threads at once and measures each request.
+    :param schedule: list of class dicts to plan
+    :param host: planning service host
+    :param port: planning service port
+    :param concurrency: number of clients sending in parallel
+    :param requests: total number of plan requests
+    :param home: optional origin for each day's first class
+    :return: dict with request count, errors, throughput and latency percentiles in ms
+    """
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker() -> None:
+        client = PlannerClient(host, port)
+        try:
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    client.plan(schedule, home=home)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else None
+
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else None,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else None,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99)
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Load test the campus transit planning service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--schedule", default="data/class_schedule.txt", help="schedule CSV sent with every request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    schedule = schedule_parser.load_schedule(args.schedule)
+    result = run_load_test(schedule, args.host, args.port, args.concurrency, args.requests)
+    print(f"{result['requests']} requests, {result['errors']} errors in {result['seconds']:.2f}s")
+    if result["throughput_rps"] is not None:
+        print(f"Throughput: {result['throughput_rps']:.1f} req/s")
+        print(f"Latency ms: mean {result['mean_ms']:.1f}, p50 {result['p50_ms']:.1f}, "
+              f"p95 {result['p95_ms']:.1f}, p99 {result['p99_ms']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from core.feed_cache import compute_feed_fingerprint
+
+DEFAULT_MAX_ENTRIES = 4096
+# Class times are whole minutes, so one-minute buckets never merge two different requests
+DEFAULT_BUCKET_SECONDS = 60
+# How often lookups re-stat the GTFS folder to notice a new feed
+DEFAULT_CHECK_INTERVAL_SECONDS = 5.0
+# Decimal places non-building origins (e.g. home) are rounded to, about 10 m
+ORIGIN_PRECISION = 4
+
+PlanKey = Tuple[Hashable, ...]
+
+
+def _plan_trip_ids(plan: Any) -> Set[str]:
+    """
+    :param plan: list of journey options from route_planner.plan_journeys
+    :return: trip_ids of every ride leg in the options
+    """
+    if not isinstance(plan, list):
+        return set()
+    return {str(leg["trip_id"]) for option in plan if isinstance(option, dict)
+            for leg in option.get("legs", []) if leg.get("trip_id") is not None}
+
+
+class PlanCache:
+    """
+    In-memory LRU cache of planner results keyed by (origin, destination building, service day,
+    arrival bucket, max walking distance, ride cap, mode).
+
+    Many students share class buildings and start times, so identical plan_journeys calls are
+    answered from here. Entries are dropped least recently used first once max_entries is reached,
+    and the whole cache is cleared when the fingerprint of the GTFS folder changes. Each entry
+    also records the trips its journeys ride, so invalidate_trips drops only the plans a delay touches.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, bucket_secs: int = DEFAULT_BUCKET_SECONDS,
+                 gtfs_folder: Optional[str] = "data/gtfs/",
+                 check_interval_secs: float = DEFAULT_CHECK_INTERVAL_SECONDS):
+        """
+        :param max_entries: max plans kept
+        :param bucket_secs: width of the arrival-time buckets; plans are computed for the bucket start
+        :param gtfs_folder: feed folder watched for changes, or None to only invalidate manually
+        :param check_interval_secs: min seconds between two checks of the feed fingerprint
+        """
+        self.max_entries = max_entries
+        self.bucket_secs = bucket_secs
+        self.gtfs_folder = gtfs_folder
+        self.check_interval_secs = check_interval_secs
+        self.entries: "OrderedDict[PlanKey, Any]" = OrderedDict()
+        self.entry_trips: Dict[PlanKey, Set[str]] = {}
+        self.trip_entries: Dict[str, Set[PlanKey]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.fingerprint = compute_feed_fingerprint(gtfs_folder) if gtfs_folder else None
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def bucket_start(self, arrival_secs: int) -> int:
+        """
+        :param arrival_secs: requested arrival time in seconds
+        :return: start of the bucket containing it, the arrival time plans are computed for
+        """
+        return arrival_secs - arrival_secs % self.bucket_secs
+
+    def key(self, origin: Any, destination: str, day_of_week: str, arrival_secs: int,
+            max_walking_distance: float, max_rides: int, mode: str) -> PlanKey:
+        """
+        :param origin: origin building name, or a dict with lat/long keys for other origins
+        :return: hashable cache key
+        """
+        if isinstance(origin, dict):
+            origin = (round(origin["lat"], ORIGIN_PRECISION), round(origin["long"], ORIGIN_PRECISION))
+        return (origin, destination, day_of_week.lower(), arrival_secs // self.bucket_secs,
+                float(max_walking_distance), max_rides, mode)
+
+    def check_feed(self) -> bool:
+        """
+        Re-reads the feed fingerprint at most once per check interval and clears every entry if it changed.
+        :return: True if the cache was invalidated
+        """
+        if self.gtfs_folder is None or time.monotonic() - self._checked_at < self.check_interval_secs:
+            return False
+        self._checked_at = time.monotonic()
+        fingerprint = compute_feed_fingerprint(self.gtfs_folder)
+        if fingerprint == self.fingerprint:
+            return False
+        self.fingerprint = fingerprint
+        self.invalidate()
+        return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.entry_trips.clear()
+            self.trip_entries.clear()
+            self.invalidations += 1
+
+    def invalidate_trips(self, trip_ids: Iterable[str]) -> int:
+        """
+        Drops the plans whose journeys ride any of the given trips, e.g. after their times changed.
+        Plans that do not ride them are kept even where a changed trip could now beat them, e.g. a
+        delayed bus that now leaves later and still arrives in time; such plans stay valid but are
+        no longer the latest departure until they are evicted or the feed changes.
+        :param trip_ids: GTFS trip_ids
+        :return: number of entries dropped
+        """
+        with self._lock:
+            keys = set()
+            for trip_id in trip_ids:
+                keys.update(self.trip_entries.get(str(trip_id), ()))
+            for key in keys:
+                del self.entries[key]
+                self._forget(key)
+            if keys:
+                self.invalidations += 1
+            return len(keys)
+
+    def _forget(self, key: PlanKey) -> None:
+        # Caller holds the lock
+        for trip_id in self.entry_trips.pop(key, ()):
+            entries = self.trip_entries.get(trip_id)
+            if entries is not None:
+                entries.discard(key)
+                if not entries:
+                    del self.trip_entries[trip_id]
+
+    def get(self, key: PlanKey) -> Optional[Any]:
+        """
+        :param key: key from self.key
+        :return: a copy of the cached plan, or None on a miss
+        """
+        self.check_feed()
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: PlanKey, value: Any) -> None:
+        """
+        Stores a plan, evicting the least recently used ones beyond max_entries.
+        :param key: key from self.key
+        :param value: planner result
+        """
+        trip_ids = _plan_trip_ids(value)
+        with self._lock:
+            self._forget(key)
+            self.entries[key] = copy.deepcopy(value)
+            self.entries.move_to_end(key)
+            self.entry_trips[key] = trip_ids
+            for trip_id in trip_ids:
+                self.trip_entries.setdefault(trip_id, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self._forget(evicted)
+                self.evictions += 1
+
+    def get_or_plan(self, key: PlanKey, planner: Callable[[], Any]) -> Any:
+        """
+        :param key: key from self.key
+        :param planner: called on a miss to compute the plan
+        :return: cached or freshly computed plan
+        """
+        value = self.get(key)
+        if value is None:
+            value = planner()
+            self.put(key, value)
+        return value
+
+    def hit_rate(self) -> Optional[float]:
+        """
+        :return: fraction of lookups served from the cache, or None before the first lookup
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def stats(self) -> dict:
+        """
+        :return: dict with entries, hits, misses, evictions, invalidations and hit_rate
+        """
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hit_rate()
+        }
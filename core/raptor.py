@@ -0,0 +1,256 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.footpaths import get_footpaths
+from core.gtfs_parser import get_current_route_patterns
+from core.timetable import get_timetable_index
+from utils.memo import cached_on
+
+UNREACHED = np.iinfo(np.int64).max
+DEFAULT_MAX_RIDES = 3
+
+
+class RaptorData:
+    """
+    Round-based public transit routing (RAPTOR) over the patterns active on one service day.
+
+    Round k finds the earliest arrival at every stop using at most k rides: it scans each
+    pattern serving a stop improved in round k - 1, hops on the earliest catchable trip and
+    rides it to the end of the pattern, then relaxes walking transfers from the stops it improved.
+    """
+
+    def __init__(self, gtfs_data: Dict[str, pd.DataFrame], day_of_week: str,
+                 transfer_radius: Optional[float] = None):
+        """
+        :param gtfs_data: loaded GTFS dataset
+        :param day_of_week: "monday", "tuesday", etc.
+        :param transfer_radius: max walking transfer between stops in meters, by default the radius the
+        feed was loaded with, see footpaths.get_transfer_radius
+        """
+        self.timetable = get_timetable_index(gtfs_data["stop_times"])
+        self.stop_id_values = self.timetable.stop_id_values
+        self.stop_code = {str(stop_id): code for code, stop_id in enumerate(self.stop_id_values)}
+        self.n_stops = len(self.stop_id_values)
+
+        self.patterns = get_current_route_patterns(gtfs_data, day_of_week)
+
+        stop_patterns: List[List[Tuple[int, int]]] = [[] for _ in range(self.n_stops)]
+        for p, pattern in enumerate(self.patterns):
+            for pos, code in enumerate(pattern.stops.tolist()):
+                stop_patterns[code].append((p, pos))
+        self.stop_patterns = stop_patterns
+
+        self.foot_offsets, self.foot_targets, self.foot_secs = get_footpaths(gtfs_data, transfer_radius)
+
+    def footpaths(self, code: int) -> List[Tuple[int, int]]:
+        """
+        :param code: stop code
+        :return: list of (neighbour stop code, walk seconds)
+        """
+        start, end = self.foot_offsets[code], self.foot_offsets[code + 1]
+        return list(zip(self.foot_targets[start:end].tolist(), self.foot_secs[start:end].tolist()))
+
+    def query(self, access: Dict[int, int], egress: Dict[int, int], departure_secs: int,
+              max_rides: int = DEFAULT_MAX_RIDES, max_arrival_secs: int = None) -> List[Dict[str, Any]]:
+        """
+        Earliest-arrival search from an origin to a destination, both given as walks to nearby stops.
+        :param access: dict of stop code -> walking seconds from the origin to that stop
+        :param egress: dict of stop code -> walking seconds from that stop to the destination
+        :param departure_secs: time the traveller leaves the origin, in seconds
+        :param max_rides: cap on the number of buses in a journey
+        :param max_arrival_secs: optional latest useful arrival, used to prune the search
+        :return: Pareto-optimal journeys over (arrival, rides, walking), see _build_journey
+        """
+        limit = UNREACHED if max_arrival_secs is None else max_arrival_secs
+        # Earliest arrival by at least one ride; walking from the origin is left out so a stop it reaches
+        # first can still be reached by bus, e.g. an access stop that is also near the destination
+        best = np.full(self.n_stops, UNREACHED, dtype=np.int64)
+        arrivals = [np.full(self.n_stops, UNREACHED, dtype=np.int64)]
+        walking = [np.zeros(self.n_stops, dtype=np.int64)]
+        parents: List[Dict[int, tuple]] = [{}]
+
+        marked = set()
+        for code, walk_secs in access.items():
+            arrival = departure_secs + walk_secs
+            if arrival < arrivals[0][code] and arrival <= limit:
+                arrivals[0][code] = arrival
+                walking[0][code] = walk_secs
+                parents[0][code] = ("access", walk_secs)
+                marked.add(code)
+        # One footpath from the stops walked to, as the connection scan allows before its first ride
+        for code, walk_secs in access.items():
+            for neighbour, foot_secs in self.footpaths(code):
+                arrival = departure_secs + walk_secs + foot_secs
+                if arrival < arrivals[0][neighbour] and arrival <= limit:
+                    arrivals[0][neighbour] = arrival
+                    walking[0][neighbour] = walk_secs + foot_secs
+                    parents[0][neighbour] = ("walk", code, foot_secs, ("access", walk_secs))
+                    marked.add(neighbour)
+
+        candidates = []
+        for k in range(1, max_rides + 1):
+            if not marked:
+                break
+            prev_arrivals = arrivals[k - 1]
+            prev_walking = walking[k - 1]
+            round_arrivals = prev_arrivals.copy()
+            round_walking = prev_walking.copy()
+            round_parents: Dict[int, tuple] = {}
+
+            queue: Dict[int, int] = {}
+            for code in marked:
+                for p, pos in self.stop_patterns[code]:
+                    if pos < queue.get(p, len(self.patterns[p].stops)):
+                        queue[p] = pos
+
+            improved = set()
+            # Stops reached by a ride this round, with that ride's arrival, walking and parent. Footpaths
+            # are relaxed only from these, so a walk never starts from another walk of the same round.
+            ride_reached: Dict[int, Tuple[int, int, tuple]] = {}
+            for p, start in queue.items():
+                pattern = self.patterns[p]
+                stops = pattern.stops.tolist()
+                trip = -1
+                board_pos = -1
+                for pos in range(start, len(stops)):
+                    code = stops[pos]
+                    if trip >= 0:
+                        arrival = int(pattern.arrivals[trip, pos])
+                        if arrival < best[code] and arrival <= limit:
+                            round_arrivals[code] = arrival
+                            best[code] = arrival
+                            round_walking[code] = prev_walking[stops[board_pos]]
+                            round_parents[code] = ("ride", p, trip, board_pos, pos)
+                            ride_reached[code] = (arrival, int(round_walking[code]), round_parents[code])
+                            improved.add(code)
+
+                    ready = prev_arrivals[code]
+                    if ready != UNREACHED and (trip < 0 or ready <= pattern.departures[trip, pos]):
+                        row = pattern.earliest_trip(pos, ready)
+                        if row >= 0 and (trip < 0 or row < trip):
+                            trip = row
+                            board_pos = pos
+
+            for code, (ride_arrival, ride_walking, ride_parent) in ride_reached.items():
+                for neighbour, walk_secs in self.footpaths(code):
+                    arrival = ride_arrival + walk_secs
+                    if arrival < best[neighbour] and arrival <= limit:
+                        round_arrivals[neighbour] = arrival
+                        best[neighbour] = arrival
+                        round_walking[neighbour] = ride_walking + walk_secs
+                        round_parents[neighbour] = ("walk", code, walk_secs, ride_parent)
+                        improved.add(neighbour)
+
+            arrivals.append(round_arrivals)
+            walking.append(round_walking)
+            parents.append(round_parents)
+            marked = improved
+
+            for code, walk_secs in egress.items():
+                if code in round_parents:
+                    arrival = int(round_arrivals[code]) + walk_secs
+                    if arrival <= limit:
+                        candidates.append((arrival, k, int(round_walking[code]) + walk_secs, code, walk_secs))
+
+        journeys = [self._build_journey(parents, k, code, egress_secs)
+                    for _, k, _, code, egress_secs in pareto_filter(candidates, (0, 1, 2))]
+        return journeys
+
+    def _build_journey(self, parents: List[Dict[int, tuple]], k: int, code: int, egress_secs: int) -> Dict[str, Any]:
+        """
+        Walks parent pointers back from a destination stop to rebuild the legs of a journey.
+        :return: dict with departure_secs, arrival_secs, rides, walking_secs and legs
+        """
+        legs = [{"type": "walk", "from_stop": self.stop_id_values[code], "to_stop": None, "duration": egress_secs}]
+        parent = None
+        while True:
+            if parent is None:
+                while code not in parents[k]:
+                    k -= 1
+                parent = parents[k][code]
+            if parent[0] == "access":
+                legs.append({"type": "walk", "from_stop": None, "to_stop": self.stop_id_values[code],
+                             "duration": parent[1]})
+                break
+            if parent[0] == "walk":
+                legs.append({"type": "walk", "from_stop": self.stop_id_values[parent[1]],
+                             "to_stop": self.stop_id_values[code], "duration": parent[2]})
+                # The walk starts where the ride it carries alighted, even if a walk since beat that arrival
+                code, parent = parent[1], parent[3]
+                continue
+            _, p, trip, board_pos, alight_pos = parent
+            pattern = self.patterns[p]
+            legs.append({
+                "type": "ride",
+                "trip_id": pattern.trip_ids[trip],
+                "route_id": pattern.route_id,
+                "from_stop": self.stop_id_values[pattern.stops[board_pos]],
+                "to_stop": self.stop_id_values[pattern.stops[alight_pos]],
+                "board_secs": int(pattern.departures[trip, board_pos]),
+                "alight_secs": int(pattern.arrivals[trip, alight_pos])
+            })
+            code = int(pattern.stops[board_pos])
+            k -= 1
+            parent = None
+        legs.reverse()
+        return summarize_legs(legs)
+
+
+def summarize_legs(legs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Derives journey totals from its legs. The departure is the latest time the traveller can
+    leave and still catch the first bus, so any slack is spent at the origin rather than a stop.
+    :param legs: ordered walk and ride legs
+    :return: dict with departure_secs, arrival_secs, rides, walking_secs and legs
+    """
+    rides = [leg for leg in legs if leg["type"] == "ride"]
+    walking_secs = sum(leg["duration"] for leg in legs if leg["type"] == "walk")
+    if not rides:
+        return {"departure_secs": None, "arrival_secs": None, "rides": 0,
+                "walking_secs": walking_secs, "legs": legs}
+
+    first_ride = legs.index(rides[0])
+    last_ride = legs.index(rides[-1])
+    departure = rides[0]["board_secs"] - sum(leg["duration"] for leg in legs[:first_ride])
+    arrival = rides[-1]["alight_secs"] + sum(leg["duration"] for leg in legs[last_ride + 1:])
+    return {
+        "departure_secs": departure,
+        "arrival_secs": arrival,
+        "rides": len(rides),
+        "walking_secs": walking_secs,
+        "legs": legs
+    }
+
+
+def pareto_filter(items: List[tuple], keys: Tuple[int, ...]) -> List[tuple]:
+    """
+    Keeps the items not dominated on the given tuple positions, where lower is better for every key.
+    :param items: candidate tuples
+    :param keys: positions in each tuple to compare
+    :return: non-dominated items, sorted by the keys
+    """
+    front = []
+    for item in sorted(items, key=lambda x: tuple(x[i] for i in keys)):
+        values = tuple(item[i] for i in keys)
+        dominated = False
+        for kept in front:
+            kept_values = tuple(kept[i] for i in keys)
+            if all(a <= b for a, b in zip(kept_values, values)):
+                dominated = True
+                break
+        if not dominated:
+            front.append(item)
+    return front
+
+
+def get_raptor_data(gtfs_data: Dict[str, pd.DataFrame], day_of_week: str) -> RaptorData:
+    """
+    Returns the process-wide RaptorData for a feed and service day, building it on first use.
+    :param gtfs_data: loaded GTFS dataset
+    :param day_of_week: "monday", "tuesday", etc.
+    :return: RaptorData shared by every planning call on the same feed and day
+    """
+    return cached_on(gtfs_data["stop_times"], f"raptor:{day_of_week.lower()}",
+                     lambda _: RaptorData(gtfs_data, day_of_week.lower()))
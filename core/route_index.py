@@ -0,0 +1,127 @@
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.timetable import get_timetable_index
+from utils.memo import cached_on
+
+
+def _csr(keys: np.ndarray, values: np.ndarray, n_keys: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Packs (key, value) pairs into offsets and a value array, with duplicates removed and values sorted per key.
+    :return: tuple of (offsets of length n_keys + 1, values)
+    """
+    span = int(values.max()) + 1 if len(values) else 1
+    packed = np.unique(keys.astype(np.int64) * span + values)
+    offsets = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(packed // span, minlength=n_keys), out=offsets[1:])
+    return offsets, (packed % span).astype(np.int32)
+
+
+class RouteIndex:
+    """
+    Inverted indexes between stops and routes, built once per feed.
+
+    stop -> routes and stop -> (route, direction) are stored as compressed integer arrays with
+    offsets per stop code, so the routes serving a handful of nearby stops is the union of a
+    few short slices. route -> stop patterns keeps each distinct ordered stop sequence a route runs.
+    """
+
+    def __init__(self, gtfs_data: Dict[str, pd.DataFrame]):
+        """
+        :param gtfs_data: loaded GTFS dataset
+        """
+        timetable = get_timetable_index(gtfs_data["stop_times"])
+        trips_df = gtfs_data["trips"]
+
+        self.stop_id_values = timetable.stop_id_values
+        self.stop_code = {str(stop_id): code for code, stop_id in enumerate(self.stop_id_values)}
+        self.route_ids = np.array(sorted(trips_df["route_id"].astype(str).unique()), dtype=object)
+        self.route_code = {route_id: code for code, route_id in enumerate(self.route_ids)}
+
+        trip_routes = dict(zip(trips_df["trip_id"].astype(str), trips_df["route_id"].astype(str)))
+        if "direction_id" in trips_df:
+            directions = pd.to_numeric(trips_df["direction_id"].astype(str), errors="coerce").fillna(0).astype(int)
+        else:
+            directions = pd.Series(0, index=trips_df.index)
+        trip_directions = dict(zip(trips_df["trip_id"].astype(str), directions))
+
+        # Route code and direction of every timetable trip, -1 where trips.txt has no such trip
+        trip_route_codes = np.array([self.route_code.get(trip_routes.get(str(trip_id)), -1)
+                                     for trip_id in timetable.trip_ids], dtype=np.int64)
+        trip_direction_ids = np.array([trip_directions.get(str(trip_id), 0) for trip_id in timetable.trip_ids],
+                                      dtype=np.int64)
+
+        row_trip = np.repeat(np.arange(len(timetable)), np.diff(timetable.trip_offsets))
+        row_routes = trip_route_codes[row_trip]
+        known = row_routes >= 0
+        row_stops = timetable.stop_codes[known].astype(np.int64)
+        row_routes = row_routes[known]
+        row_directions = trip_direction_ids[row_trip][known]
+
+        n_stops = len(self.stop_id_values)
+        self.stop_route_offsets, self.stop_routes = _csr(row_stops, row_routes, n_stops)
+        # (route, direction) pairs are packed into one integer: route_code * 2 + direction
+        self.stop_route_direction_offsets, packed = _csr(row_stops, row_routes * 2 + row_directions, n_stops)
+        self.stop_route_directions = packed
+
+        patterns: Dict[int, Dict[bytes, np.ndarray]] = {}
+        for trip, route in enumerate(trip_route_codes.tolist()):
+            if route < 0:
+                continue
+            stops = timetable.stop_codes[timetable.trip_offsets[trip]:timetable.trip_offsets[trip + 1]]
+            patterns.setdefault(route, {}).setdefault(stops.tobytes(), stops)
+        self.route_patterns: List[List[np.ndarray]] = [list(patterns.get(route, {}).values())
+                                                       for route in range(len(self.route_ids))]
+
+    def route_codes_for_stops(self, stop_ids: Iterable[str]) -> np.ndarray:
+        """
+        :param stop_ids: GTFS stop_ids
+        :return: sorted unique route codes serving any of the stops
+        """
+        slices = []
+        for stop_id in stop_ids:
+            code = self.stop_code.get(str(stop_id))
+            if code is not None:
+                slices.append(self.stop_routes[self.stop_route_offsets[code]:self.stop_route_offsets[code + 1]])
+        if not slices:
+            return np.array([], dtype=np.int32)
+        return np.unique(np.concatenate(slices))
+
+    def routes_for_stops(self, stop_ids: Iterable[str]) -> List[str]:
+        """
+        :param stop_ids: GTFS stop_ids
+        :return: sorted route_ids serving any of the stops
+        """
+        return self.route_ids[self.route_codes_for_stops(stop_ids)].tolist()
+
+    def route_directions_for_stop(self, stop_id: str) -> List[Tuple[str, int]]:
+        """
+        :param stop_id: GTFS stop_id
+        :return: list of (route_id, direction_id) pairs that stop at this stop
+        """
+        code = self.stop_code.get(str(stop_id))
+        if code is None:
+            return []
+        start, end = self.stop_route_direction_offsets[code], self.stop_route_direction_offsets[code + 1]
+        return [(self.route_ids[packed // 2], packed % 2) for packed in self.stop_route_directions[start:end].tolist()]
+
+    def stop_patterns_for_route(self, route_id: str) -> List[List[str]]:
+        """
+        :param route_id: GTFS route_id
+        :return: each distinct ordered list of stop_ids the route runs
+        """
+        route = self.route_code.get(str(route_id))
+        if route is None:
+            return []
+        return [self.stop_id_values[stops].tolist() for stops in self.route_patterns[route]]
+
+
+def get_route_index(gtfs_data: Dict[str, pd.DataFrame]) -> RouteIndex:
+    """
+    Returns the process-wide RouteIndex for a feed, building it on first use.
+    :param gtfs_data: loaded GTFS dataset
+    :return: shared RouteIndex
+    """
+    return cached_on(gtfs_data["stop_times"], "route_index", lambda _: RouteIndex(gtfs_data))
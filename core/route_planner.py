@@ -1,51 +1,45 @@
-# TODO: Implement full logic flow from earlier (find stop → route → trip)
-# 1. For each class in schedule, find nearby stops
-# 2. For each stop, find routes serving it
-# 3. For each route, find viable trips before class time
-# 4. Find boarding options for the user location
-# 5. Calculate journey time and pick best option
-# 6. Return summary for all classes
+from typing import Dict
+
+from core.csa import get_connection_table
+from core.gtfs_parser import get_route_for_trip, get_route_patterns
+from core.plan_cache import PlanCache
+from core.route_index import get_route_index
+from core.raptor import DEFAULT_MAX_RIDES, RaptorData, get_raptor_data, pareto_filter, summarize_legs
+from core.stop_index import StopIndex, get_stop_index
+from core.suggestions import suggest_transport_option, suggest_transport_option_between
+from core.travel_matrix import TravelTimeMatrix
+from utils.distance import WalkingTimes, estimate_walking_seconds, haversine_distance_meters
+from utils.time_utils import seconds_to_time, time_to_seconds, to_seconds
+
+DEFAULT_MAX_WALKING_DISTANCE = 800.0
+PLANNER_MODES = ("raptor", "csa")
+# How long before class start the planner will look for departures
+SEARCH_WINDOW_SECONDS = 2 * 3600
 
 def find_nearby_stops(lat: float, lng: float, stops_data, max_distance: int):
     """
     Find bus stops within max_distance meters of given coordinates.
     :param lat: latitude of reference point
     :param lng: longitude of reference point
-    :param stops_data: GTFS stops data
+    :param stops_data: GTFS stops data, either the stops DataFrame or a prebuilt StopIndex
     :param max_distance: max walking distance in meters
-    :return: list of nearby stops with distance info
+    :return: list of nearby stops with distance info, closest first
     """
-    pass
+    if isinstance(stops_data, StopIndex):
+        stop_index = stops_data
+    else:
+        stop_index = get_stop_index(stops_data)
+    return stop_index.nearby_stops(lat, lng, max_distance)
 
 def get_routes_for_stops(stop_ids: list, gtfs_data: dict):
     """
     Get all bus routes that serve a list of stops.
+    Answered from the shared RouteIndex, so no stop_times/trips join runs per call.
     :param stop_ids: list of stop IDs
     :param gtfs_data: full GTFS dataset
     :return: list of route IDs serving these stops
     """
-    pass
-
-def find_viable_trips(destination_stops: list, target_arrival_time: str, day_of_week: str, gtfs_data: dict):
-    """
-    Find bus trips arriving before target time on given day.
-    :param destination_stops: list of stops near destination building
-    :param target_arrival_time: desired arrival time as HH:MM:SS
-    :param day_of_week: day string (e.g. 'monday')
-    :param gtfs_data: GTFS dataset
-    :return: list of viable trip dicts with trip info
-    """
-    pass
-
-def find_boarding_options(viable_trips: list, current_location: dict, gtfs_data: dict):
-    """
-    For each viable trip, find possible boarding stops accessible from user location.
-    :param viable_trips: list of viable trips
-    :param current_location: dict with lat/lng keys
-    :param gtfs_data: GTFS dataset
-    :return: list of boarding options with stop info and walking times
-    """
-    pass
+    return get_route_index(gtfs_data).routes_for_stops(stop_ids)
 
 def calculate_journey_time(option: dict):
     """
@@ -53,22 +47,211 @@ def calculate_journey_time(option: dict):
     :param option: dict with boarding and trip details
     :return: dict with added total journey time and departure time from origin
     """
-    pass
+    summary = summarize_legs(option["legs"])
+    updated_option = dict(option)
+    updated_option.update(summary)
+
+    if summary["rides"] == 0:
+        # Walk-only options carry their own times since there is no bus to anchor them to
+        updated_option["departure_secs"] = option["departure_secs"]
+        updated_option["arrival_secs"] = option["arrival_secs"]
+
+    departure = updated_option["departure_secs"]
+    arrival = updated_option["arrival_secs"]
+    updated_option["total_journey_time"] = arrival - departure
+    updated_option["departure_time"] = seconds_to_time(departure)
+    updated_option["arrival_time"] = seconds_to_time(arrival)
+    return updated_option
 
 def select_best_bus_option(boarding_options: list):
     """
     Select the best bus option based on journey time and departure time.
+    Prefers the latest departure from the origin, then fewer rides, then less walking.
     :param boarding_options: list of boarding options with journey times
     :return: best bus option dict or None if no options
     """
-    pass
+    if not boarding_options:
+        return None
+    return min(boarding_options,
+               key=lambda option: (-option["departure_secs"], option["rides"], option["walking_secs"],
+                                   option["total_journey_time"]))
 
-def plan_route(schedule: list, building_coords: dict, gtfs_data: dict):
+def plan_journeys(origin: dict, destination: dict, day_of_week: str, target_arrival_time: str, gtfs_data: dict,
+                  max_walking_distance: float = DEFAULT_MAX_WALKING_DISTANCE, max_rides: int = DEFAULT_MAX_RIDES,
+                  mode: str = "raptor", walking_times: WalkingTimes = None):
+    """
+    Finds the journeys from origin to destination that arrive by target_arrival_time and leave as late as possible.
+    For every ride count up to max_rides, the latest workable departure is binary searched with RAPTOR
+    (earliest arrival never decreases as departure moves later), and the results are reduced to the
+    options that are Pareto-optimal on departure time, number of rides and walking. Each ride count costs
+    one query at the start of the SEARCH_WINDOW_SECONDS window plus about seven bisection steps, so about
+    24 RAPTOR queries with the default three rides.
+    In "csa" mode a single reverse Connection Scan returns only the latest departure that makes it,
+    without a ride cap, which is cheaper when alternatives are not needed.
+    :param origin: dict with lat/long keys
+    :param destination: dict with lat/long keys
+    :param day_of_week: day string (e.g. 'monday')
+    :param target_arrival_time: desired arrival time as HH:MM:SS or seconds
+    :param gtfs_data: GTFS dataset
+    :param max_walking_distance: max walk to or from a stop in meters
+    :param max_rides: cap on the number of buses per journey (ignored in "csa" mode)
+    :param mode: "raptor" or "csa"
+    :param walking_times: optional WalkingTimes for the walks to and from stops and the direct walk;
+    the straight-line estimate is used without it
+    :return: list of journey options, see calculate_journey_time
+    """
+    if mode not in PLANNER_MODES:
+        raise ValueError(f"Unknown planner mode '{mode}', expected one of {PLANNER_MODES}")
+
+    arrive_by = to_seconds(target_arrival_time)
+    if mode == "csa":
+        network = get_connection_table(gtfs_data, day_of_week)
+    else:
+        network = get_raptor_data(gtfs_data, day_of_week)
+    stop_index = get_stop_index(gtfs_data["stops"])
+    access = stop_index.stop_walks(origin["lat"], origin["long"], max_walking_distance, network.stop_code,
+                                   walking_times)
+    egress = stop_index.stop_walks(destination["lat"], destination["long"], max_walking_distance,
+                                   network.stop_code, walking_times, to_point=True)
+
+    options = []
+    direct_distance = haversine_distance_meters(origin["lat"], origin["long"], destination["lat"], destination["long"])
+    if direct_distance <= max_walking_distance:
+        if walking_times is not None:
+            walk_secs = walking_times.seconds([((origin["lat"], origin["long"]),
+                                                (destination["lat"], destination["long"]))])[0]
+        else:
+            walk_secs = estimate_walking_seconds(direct_distance)
+        options.append(calculate_journey_time({
+            "departure_secs": arrive_by - walk_secs,
+            "arrival_secs": arrive_by,
+            "legs": [{"type": "walk", "from_stop": None, "to_stop": None, "duration": walk_secs}]
+        }))
+
+    if access and egress and mode == "csa":
+        journey = network.latest_departure(access, egress, arrive_by)
+        if journey is not None:
+            options.append(calculate_journey_time(journey))
+    elif access and egress:
+        for rides in range(1, max_rides + 1):
+            journeys = _latest_departure_journeys(network, access, egress, arrive_by, rides)
+            options.extend(calculate_journey_time(journey) for journey in journeys)
+
+    patterns = get_route_patterns(gtfs_data, day_of_week)
+    for option in options:
+        for leg in option["legs"]:
+            if leg["type"] == "ride":
+                found = patterns.trip_rows.get(str(leg["trip_id"]))
+                pattern, row = (patterns[found[0]], found[1]) if found is not None else (None, None)
+                leg["route"] = get_route_for_trip(leg["trip_id"], gtfs_data["trips"], gtfs_data["routes"],
+                                                  pattern, row)
+                leg["board_time"] = seconds_to_time(leg["board_secs"])
+                leg["alight_time"] = seconds_to_time(leg["alight_secs"])
+
+    candidates = [(-option["departure_secs"], option["rides"], option["walking_secs"], i)
+                  for i, option in enumerate(options)]
+    return [options[c[3]] for c in pareto_filter(candidates, (0, 1, 2))]
+
+def _latest_departure_journeys(raptor_data: RaptorData, access: Dict[int, int], egress: Dict[int, int],
+                               arrive_by: int, max_rides: int):
+    """
+    Binary searches, to the minute, the latest origin departure that still reaches the destination by
+    arrive_by with at most max_rides buses.
+    :return: RAPTOR journeys for that departure, or an empty list if nothing arrives in time
+    """
+    def search(departure):
+        return raptor_data.query(access, egress, departure, max_rides, max_arrival_secs=arrive_by)
+
+    low = arrive_by - SEARCH_WINDOW_SECONDS
+    journeys = search(low)
+    if not journeys:
+        return []
+
+    high = arrive_by
+    while high - low > 60:
+        middle = (low + high) // 2
+        middle_journeys = search(middle)
+        if middle_journeys:
+            low, journeys = middle, middle_journeys
+        else:
+            high = middle
+    return journeys
+
+def _class_start_secs(user_class: dict) -> int:
+    """
+    :param user_class: class dict, validated or not
+    :return: class start in seconds, from the start_secs key validate_schedule_data adds when present
+    """
+    if "start_secs" in user_class:
+        return user_class["start_secs"]
+    return time_to_seconds(user_class["start_time"].strip())
+
+def plan_route(schedule: list, building_coords: dict, gtfs_data: dict,
+               max_walking_distance: float = DEFAULT_MAX_WALKING_DISTANCE, max_rides: int = DEFAULT_MAX_RIDES,
+               home: dict = None, mode: str = "raptor", plan_cache: PlanCache = None,
+               walking_times: WalkingTimes = None, travel_matrix: TravelTimeMatrix = None):
     """
     Main planner to suggest best bus options for each class in schedule.
+    Each class is planned from the previous class on the same day, and the first class of a day from home
+    if given; classes with no known origin are returned without options.
     :param schedule: list of class dicts
     :param building_coords: dict of building names to coordinates
     :param gtfs_data: loaded GTFS dataset
-    :return: dict of class times mapped to suggested bus options
+    :param max_walking_distance: max walk to or from a stop in meters
+    :param max_rides: cap on the number of buses per journey
+    :param home: optional dict with lat/long keys used as the origin of each day's first class
+    :param mode: "raptor" for Pareto alternatives or "csa" for just the latest departure, see plan_journeys
+    :param plan_cache: optional PlanCache shared across schedules; journeys are then planned for the
+    start of the class time's arrival bucket and reused for identical requests
+    :param walking_times: optional WalkingTimes for street walking times, see plan_journeys
+    :param travel_matrix: optional TravelTimeMatrix answering the walk-or-bus suggestion between two
+    buildings with a lookup; the distance rule is used without it and for trips from home
+    :return: dict of class times mapped to suggested bus options and a walk-or-bus suggestion
     """
-    pass
+    classes_by_day = {}
+    for user_class in schedule:
+        classes_by_day.setdefault(user_class["day"].strip().lower(), []).append(user_class)
+
+    plan = {}
+    for day, day_classes in classes_by_day.items():
+        day_classes.sort(key=_class_start_secs)
+        origin = home
+        origin_name = "home" if home else None
+
+        for user_class in day_classes:
+            building = user_class["building"]
+            destination = building_coords.get(building, user_class)
+            start_secs = _class_start_secs(user_class)
+            start_time = seconds_to_time(start_secs)
+            options = []
+            suggestion = None
+            if origin is not None and origin_name != building:
+                distance = haversine_distance_meters(origin["lat"], origin["long"], destination["lat"],
+                                                     destination["long"])
+                if travel_matrix is not None and origin_name != "home":
+                    suggestion = suggest_transport_option_between(travel_matrix, origin_name, building, day,
+                                                                  start_secs, distance)
+                else:
+                    suggestion = suggest_transport_option(distance)
+            if origin is not None and origin_name != building and plan_cache is not None:
+                key = plan_cache.key(origin_name if origin_name != "home" else origin, building, day, start_secs,
+                                     max_walking_distance, max_rides, mode)
+                options = plan_cache.get_or_plan(key, lambda: plan_journeys(
+                    origin, destination, day, plan_cache.bucket_start(start_secs), gtfs_data,
+                    max_walking_distance, max_rides, mode, walking_times))
+            elif origin is not None and origin_name != building:
+                options = plan_journeys(origin, destination, day, start_secs, gtfs_data, max_walking_distance,
+                                        max_rides, mode, walking_times)
+
+            plan[f"{day} {start_time}"] = {
+                "course_code": user_class.get("course_code"),
+                "origin": origin_name,
+                "building": building,
+                "suggestion": suggestion,
+                "best_option": select_best_bus_option(options),
+                "options": options
+            }
+            origin = destination
+            origin_name = building
+
+    return plan
@@ -1,8 +1,12 @@
 import sys
-from typing import List, Dict, Any
-from utils.time_utils import is_time_before
-from core.buildings import get_building_coordinates
+from typing import List, Dict, Any, Tuple
+import numpy as np
 import pandas as pd
+from utils.time_utils import MISSING_TIME, clock_time_to_seconds, clock_times_to_seconds
+from core.buildings import get_building_index
+
+REQUIRED_COLUMNS = ["course_code", "class_name", "day", "start_time", "end_time", "building"]
+VALID_DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
 
 def load_schedule(csv_path: str = "data/class_schedule.txt") -> List[Dict[str, Any]]:
     """
@@ -10,12 +14,11 @@ def load_schedule(csv_path: str = "data/class_schedule.txt") -> List[Dict[str, A
     :param csv_path: path to schedule CSV file
     :return: list of class dicts with time, building, day info
     """
-    required_columns = ["course_code", "class_name", "day", "start_time", "end_time", "building"]
     try:
         df = pd.read_csv(csv_path)
     except FileNotFoundError:
         raise FileNotFoundError(f"Schedule file not found: {csv_path}")
-    for col in required_columns:
+    for col in REQUIRED_COLUMNS:
         if col not in df.columns:
             raise ValueError(f"Missing required column: '{col}' in class_schedule.txt.")
 
@@ -26,13 +29,11 @@ def load_schedule(csv_path: str = "data/class_schedule.txt") -> List[Dict[str, A
 def validate_schedule_data(schedule_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Validates each row of schedule data: time format and day.
+    Valid rows also get start_secs/end_secs integer keys so later stages never reparse the strings.
     :param schedule_data: list of parsed records
     :return: list of validated records to be compared with the original csv
     """
-    valid_days = {
-        "monday", "tuesday", "wednesday",
-        "thursday", "friday", "saturday", "sunday"
-    }
+    valid_days = set(VALID_DAYS)
     validated = []
 
     for item in schedule_data:
@@ -42,39 +43,14 @@ def validate_schedule_data(schedule_data: List[Dict[str, Any]]) -> List[Dict[str
             print(f"Invalid day: {item['day']} in {item}")
             continue
 
-        # Check if both times are in HH:MM:SS format
-        start_time = item.get("start_time")
-        end_time = item.get("end_time")
-
-        valid_time = True
+        # Check if both times are in HH:MM:SS format, parsing each to seconds exactly once
+        start_secs = clock_time_to_seconds(item.get("start_time"))
+        end_secs = clock_time_to_seconds(item.get("end_time"))
 
-        for time_str in [start_time, end_time]:
-            if time_str.count(":") != 2:
-                valid_time = False
-                break
-
-            parts = time_str.split(":")
-            if len(parts) != 3:
-                valid_time = False
-                break
-
-            try:
-                hour = int(parts[0])
-                minute = int(parts[1])
-                second = int(parts[2])
-
-                if not (0 <= hour <= 23):
-                    valid_time = False
-                if not (0 <= minute <= 59):
-                    valid_time = False
-                if not (0 <= second <= 59):
-                    valid_time = False
-            except ValueError:
-                valid_time = False
-                break
+        valid_time = start_secs is not None and end_secs is not None
 
         if valid_time:
-            if not is_time_before(start_time, end_time):
+            if not start_secs < end_secs:
                 print(f"Start time is not before end time in {item}")
                 valid_time = False
 
@@ -82,6 +58,8 @@ def validate_schedule_data(schedule_data: List[Dict[str, Any]]) -> List[Dict[str
             print(f"Invalid time format in {item}")
             continue
 
+        item["start_secs"] = start_secs
+        item["end_secs"] = end_secs
         # Update day to lowercase for consistency
         item["day"] = day
         validated.append(item)
@@ -95,20 +73,15 @@ def extract_unique_building_names(schedule_data: List[Dict[str, Any]]) -> List[s
     :param schedule_data: list of class records from validated schedule
     :return: list of unique building names
     """
-    result = []
-
+    # dict keeps first-seen order and makes each membership check O(1)
+    result = {}
     for item in schedule_data:
         building = item.get("building")
-        already_in_result = False
+        # Blank CSV cells are read as NaN, which is truthy but not a name
+        if isinstance(building, str) and building.strip():
+            result.setdefault(building, None)
 
-        for existing in result:
-            if building == existing:
-                already_in_result = True
-                break
-        if building and not already_in_result:
-            result.append(building)
-
-    return result
+    return list(result)
 
 
 def apply_matched_building_names(schedule_data: List[Dict[str, Any]],
@@ -139,14 +112,15 @@ def update_schedule_with_coordinates(schedule_data: List[Dict[str, Any]], buildi
     Adds two new rows to the schedule data with every building's unique coordinates and returns the schedule as
     an updated list of dictionaries for every class
     :param schedule_data: the validated and building-matched user schedule
-    :param buildings_data: the list of building dictionaries
+    :param buildings_data: the list of building dictionaries or a BuildingIndex
     :return: an updated schedule including the coordinates of every building
     """
     updated_schedule = []
+    building_index = get_building_index(buildings_data)
 
     for user_class in schedule_data:
         user_building = user_class.get("building")
-        coords_for_building = get_building_coordinates(user_building, buildings_data)
+        coords_for_building = building_index.coordinates(user_building)
 
         if "error" in coords_for_building:
             print(f"Error attaching coordinates for '{user_building}': {coords_for_building['error']}")
@@ -158,3 +132,94 @@ def update_schedule_with_coordinates(schedule_data: List[Dict[str, Any]], buildi
         updated_schedule.append(updated_class)
 
     return updated_schedule
+
+
+def load_schedule_frame(csv_path: str) -> pd.DataFrame:
+    """
+    Loads a schedule or registrar roster CSV as a DataFrame, for the bulk functions below.
+    Extra columns (e.g. a student id) are kept as-is.
+    :param csv_path: path to schedule CSV file
+    :return: DataFrame with at least the load_schedule columns, every value read as a string
+    """
+    try:
+        df = pd.read_csv(csv_path, dtype=str, skipinitialspace=True)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Schedule file not found: {csv_path}")
+    for col in REQUIRED_COLUMNS:
+        if col not in df.columns:
+            raise ValueError(f"Missing required column: '{col}' in {csv_path}.")
+    return df
+
+
+def validate_schedule_frame(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Bulk version of validate_schedule_data: checks every day and time at once, with the same rules.
+    :param df: schedule DataFrame with day, start_time and end_time columns
+    :return: tuple of (valid rows with a lowercase day and start_secs/end_secs columns,
+    error report with the row label, reason, day, start_time and end_time of every invalid row)
+    """
+    day = df["day"].astype("string").str.strip().str.lower()
+    start_secs = clock_times_to_seconds(df["start_time"])
+    end_secs = clock_times_to_seconds(df["end_time"])
+
+    bad_day = ~day.isin(VALID_DAYS).to_numpy(dtype=bool, na_value=False)
+    bad_time = (start_secs == MISSING_TIME) | (end_secs == MISSING_TIME)
+    bad_order = ~bad_time & (start_secs >= end_secs)
+    invalid = bad_day | bad_time | bad_order
+
+    reason = np.select([bad_day, bad_time, bad_order],
+                       ["Invalid day", "Invalid time format", "Start time is not before end time"], default="")
+    errors = pd.DataFrame({
+        "row": df.index[invalid],
+        "reason": reason[invalid],
+        "day": df["day"].to_numpy()[invalid],
+        "start_time": df["start_time"].to_numpy()[invalid],
+        "end_time": df["end_time"].to_numpy()[invalid]
+    })
+
+    valid = ~invalid
+    validated = df.loc[valid].assign(day=day[valid].astype(object), start_secs=start_secs[valid],
+                                     end_secs=end_secs[valid])
+    return validated, errors
+
+
+def unique_building_names(df: pd.DataFrame) -> List[str]:
+    """
+    Bulk version of extract_unique_building_names using a hash-based pd.unique.
+    :param df: schedule DataFrame with a building column
+    :return: list of unique non-empty building names in first-seen order
+    """
+    buildings = df["building"].dropna()
+    buildings = buildings[buildings.str.strip() != ""]
+    return pd.unique(buildings).tolist()
+
+
+def attach_official_buildings(df: pd.DataFrame, name_mapping: Dict[str, str],
+                              buildings_data) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Bulk version of apply_matched_building_names followed by update_schedule_with_coordinates:
+    maps user building names to official ones and joins the coordinates column-wise.
+    :param df: validated schedule DataFrame with a building column
+    :param name_mapping: dict of user building name -> official building name
+    :param buildings_data: the list of building dictionaries or a BuildingIndex
+    :return: tuple of (rows with official building, lat and long,
+    error report with the row label, building and reason of every row that could not be placed)
+    """
+    building_frame = get_building_index(buildings_data).to_frame()
+    official = df["building"].map(name_mapping)
+    lat = official.map(building_frame["lat"])
+    long = official.map(building_frame["long"])
+
+    unmatched = official.isna().to_numpy()
+    no_coordinates = ~unmatched & (lat.isna() | long.isna()).to_numpy()
+    invalid = unmatched | no_coordinates
+    reason = np.where(unmatched, "No matching building found.", "Coordinates not available for this building.")
+    errors = pd.DataFrame({
+        "row": df.index[invalid],
+        "building": df["building"].to_numpy()[invalid],
+        "reason": reason[invalid]
+    })
+
+    valid = ~invalid
+    placed = df.loc[valid].assign(building=official[valid], lat=lat[valid], long=long[valid])
+    return placed, errors
@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from core.feed_cache import compute_feed_fingerprint
+from core.feed_reload import reload_feed
+from core.headless import init_worker, load_state, plan_schedule, warm_routing_indexes
+from core.raptor import DEFAULT_MAX_RIDES
+from core.route_planner import DEFAULT_MAX_WALKING_DISTANCE
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class RequestTooLarge(ValueError):
+    """
+    Raised for a request body over MAX_BODY_BYTES, answered with 413 instead of 400.
+    """
+
+
+def reload_state() -> Dict[str, Any]:
+    """
+    Switches the loaded state to the feed now in its GTFS folder with feed_reload.reload_feed,
+    rebuilding only the patterns of changed routes and the routing indexes of the warm days before the swap.
+    :return: summary of the feed diff
+    """
+    state = load_state()
+    gtfs_data = state["gtfs_data"]
+    diff = reload_feed(gtfs_data, state["gtfs_folder"], state["cache_dir"])
+    # Days the old feed had not warmed yet, e.g. when warm_days changed
+    warm_routing_indexes(gtfs_data, state["warm_days"])
+    plan_cache = state["plan_cache"]
+    plan_cache.fingerprint = compute_feed_fingerprint(state["gtfs_folder"])
+    if not diff.is_empty():
+        plan_cache.invalidate()
+    if state["travel_matrix"] is not None and state["travel_matrix"].fingerprint != plan_cache.fingerprint:
+        # Suggestions fall back to the distance rule until the matrix is rebuilt for the new feed
+        state["travel_matrix"] = None
+    if state["delay_overlay"] is not None:
+        state["delay_overlay"].refresh(force=True)
+    return diff.summary()
+
+
+def parse_plan_options(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Checks the numeric options of a /plan request in the event loop, so a bad value is answered with
+    400 before any worker is involved.
+    :param payload: decoded request body
+    :return: copy of payload with max_walking_distance as a float and max_rides as an int
+    :raises ValueError: if either option is not a number or out of range
+    """
+    try:
+        max_walking_distance = float(payload.get("max_walking_distance", DEFAULT_MAX_WALKING_DISTANCE))
+        max_rides = int(payload.get("max_rides", DEFAULT_MAX_RIDES))
+    except (TypeError, ValueError):
+        raise ValueError("max_walking_distance and max_rides must be numbers")
+    if not math.isfinite(max_walking_distance) or max_walking_distance < 0:
+        raise ValueError("max_walking_distance must be a non-negative number of meters")
+    if max_rides < 1:
+        raise ValueError("max_rides must be at least 1")
+    return {**payload, "max_walking_distance": max_walking_distance, "max_rides": max_rides}
+
+
+def handle_plan(payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Plans one schedule request inside a worker process.
+    :param payload: dict with schedule and optional home, max_walking_distance, max_rides, mode,
+    see parse_plan_options
+    :return: tuple of (dict with plan, building_mapping and errors,
+    this worker's pid, plan cache stats and unreadable trip update count for the server's /stats)
+    """
+    state = load_state()
+    # Each worker lays new delays over its own copy of the arrays and drops its own affected plans
+    if state["delay_overlay"] is not None:
+        state["delay_overlay"].refresh()
+    result = plan_schedule(
+        payload.get("schedule") or [],
+        state["gtfs_data"],
+        state["building_index"],
+        max_walking_distance=float(payload.get("max_walking_distance", DEFAULT_MAX_WALKING_DISTANCE)),
+        max_rides=int(payload.get("max_rides", DEFAULT_MAX_RIDES)),
+        home=payload.get("home"),
+        mode=payload.get("mode", "raptor"),
+        plan_cache=state["plan_cache"],
+        walking_times=state["walking_times"],
+        travel_matrix=state["travel_matrix"]
+    )
+    overlay_errors = state["delay_overlay"].errors if state["delay_overlay"] is not None else 0
+    return result, {"pid": os.getpid(), **state["plan_cache"].stats(), "trip_update_errors": overlay_errors}
+
+
+class PlannerServer:
+    """
+    Minimal JSON-over-HTTP planning service.
+
+    The asyncio loop only parses requests and writes responses; each plan runs in a process pool
+    whose workers share the feed and indexes loaded once at startup.
+
+    GET /health, GET /stats, POST /plan with a JSON body and POST /reload are supported, over
+    keep-alive connections. A reload patches the feed in this process while the current workers keep
+    answering from the old one, then swaps in a pool forked from the updated state.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: Optional[int] = None,
+                 gtfs_folder: str = "data/gtfs/", cache_dir: Optional[str] = "data/cache/gtfs/",
+                 buildings_path: str = "data/buildings.geojson", trip_updates_path: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.config = (gtfs_folder, cache_dir, buildings_path, trip_updates_path)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.started_at = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.plans = 0
+        self.in_flight = 0
+        self.total_plan_secs = 0.0
+        self.reloads = 0
+        # Latest plan cache stats reported by each worker pid; counts are cumulative per worker
+        self.worker_cache_stats: Dict[int, Dict[str, Any]] = {}
+        self._reload_lock = asyncio.Lock()
+
+    async def start(self) -> asyncio.AbstractServer:
+        gtfs_folder, cache_dir, buildings_path, trip_updates_path = self.config
+        load_state(gtfs_folder, cache_dir, buildings_path, trip_updates_path=trip_updates_path)
+        self.pool = self._start_pool()
+        return await asyncio.start_server(self._handle_connection, self.host, self.port)
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=self.config)
+
+    async def reload(self) -> Dict[str, Any]:
+        """
+        Reloads the feed off the event loop and replaces the worker pool once it is done;
+        plans already running finish on the old pool.
+        :return: summary of the feed diff
+        """
+        async with self._reload_lock:
+            summary = await asyncio.get_running_loop().run_in_executor(None, reload_state)
+            old_pool, self.pool = self.pool, self._start_pool()
+            if old_pool is not None:
+                old_pool.shutdown(wait=False)
+            self.reloads += 1
+            return summary
+
+    async def serve_forever(self) -> None:
+        server = await self.start()
+        print(f"Planning service listening on http://{self.host}:{self.port} with {self.workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError as e:
+                    # The body boundary is unknown after a bad header, so the connection is closed
+                    self.requests += 1
+                    self.errors += 1
+                    status = 413 if isinstance(e, RequestTooLarge) else 400
+                    self._write_response(writer, status, {"error": str(e)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, response = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").split()
+        if len(parts) < 2:
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ValueError(f"Invalid Content-Length header '{headers['content-length']}'")
+        if length > MAX_BODY_BYTES:
+            raise RequestTooLarge(f"Request body of {length} bytes is over the {MAX_BODY_BYTES} byte limit")
+        body = await reader.readexactly(length) if length else b""
+        return parts[0].upper(), parts[1], headers, body
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        self.requests += 1
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, self.stats()
+        if method == "POST" and path == "/reload":
+            try:
+                return 200, await self.reload()
+            except Exception as e:
+                self.errors += 1
+                return 500, {"error": f"Reload failed: {e}"}
+        if method != "POST" or path != "/plan":
+            self.errors += 1
+            return 404, {"error": f"No route for {method} {path}"}
+
+        try:
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object")
+        except ValueError as e:
+            self.errors += 1
+            return 400, {"error": f"Invalid JSON: {e}"}
+        try:
+            payload = parse_plan_options(payload)
+        except ValueError as e:
+            self.errors += 1
+            return 400, {"error": str(e)}
+
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            result, cache_stats = await asyncio.get_running_loop().run_in_executor(self.pool, handle_plan, payload)
+        except Exception as e:
+            self.errors += 1
+            return 500, {"error": f"Planning failed: {e}"}
+        finally:
+            self.in_flight -= 1
+        self.plans += 1
+        self.total_plan_secs += time.perf_counter() - started
+        self.worker_cache_stats[cache_stats.pop("pid")] = cache_stats
+        return 200, result
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, response: Dict[str, Any], keep_alive: bool) -> None:
+        body = json.dumps(response, default=str).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                  500: "Internal Server Error"}[status]
+        writer.write((f"HTTP/1.1 {status} {reason}\r\n"
+                      f"Content-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + body)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        :return: dict with uptime, request, error and reload counts, plans in flight, mean plan latency and
+        the plan cache stats and unreadable trip update files summed over the last report of every worker,
+        including replaced ones
+        """
+        cache = {name: sum(stats[name] for stats in self.worker_cache_stats.values())
+                 for name in ("entries", "hits", "misses", "evictions", "invalidations")}
+        lookups = cache["hits"] + cache["misses"]
+        cache["hit_rate"] = cache["hits"] / lookups if lookups else None
+        return {
+            "uptime_secs": round(time.time() - self.started_at, 1),
+            "workers": self.workers,
+            "requests": self.requests,
+            "errors": self.errors,
+            "plans": self.plans,
+            "reloads": self.reloads,
+            "in_flight": self.in_flight,
+            "mean_plan_secs": self.total_plan_secs / self.plans if self.plans else None,
+            "trip_update_errors": sum(stats["trip_update_errors"] for stats in self.worker_cache_stats.values()),
+            "plan_cache": cache
+        }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the campus transit planning service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="planning processes (default: CPU count)")
+    parser.add_argument("--gtfs", default="data/gtfs/", help="GTFS folder")
+    parser.add_argument("--cache-dir", default="data/cache/gtfs/", help="feed snapshot folder")
+    parser.add_argument("--buildings", default="data/buildings.geojson", help="buildings JSON file")
+    parser.add_argument("--trip-updates", default=None,
+                        help="GTFS-Realtime JSON file of today's delays, re-read when it changes")
+    args = parser.parse_args(argv)
+
+    server = PlannerServer(args.host, args.port, args.workers, args.gtfs, args.cache_dir, args.buildings,
+                           args.trip_updates)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("Planning service stopped.")
+
+
+if __name__ == "__main__":
+    main()
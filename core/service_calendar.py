@@ -0,0 +1,206 @@
+import weakref
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.memo import cached_on, clear_cached, peek_cached
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+# calendar_dates.txt exception_type values
+SERVICE_ADDED = 1
+SERVICE_REMOVED = 2
+
+DateLike = Union[date, datetime, str, int]
+
+
+def parse_service_date(value: DateLike) -> date:
+    """
+    Normalizes the date formats used across the planner to a datetime.date.
+    :param value: date/datetime, GTFS "YYYYMMDD" string or int, or ISO "YYYY-MM-DD" string
+    :return: datetime.date
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    if "-" in text:
+        return date.fromisoformat(text)
+    return datetime.strptime(text, "%Y%m%d").date()
+
+
+class ServiceCalendar:
+    """
+    Precomputed answer to "which services run on this date" for a whole feed.
+
+    Every date between the earliest start_date and latest end_date gets one row in a packed
+    bitset (one bit per service), with calendar_dates exceptions already applied, so a date
+    lookup is an offset computation and a row read.
+    """
+
+    def __init__(self, calendar_df: pd.DataFrame, calendar_dates_df: Optional[pd.DataFrame] = None):
+        """
+        :param calendar_df: calendar.txt DataFrame
+        :param calendar_dates_df: optional calendar_dates.txt DataFrame
+        """
+        service_ids = calendar_df["service_id"].astype(str).tolist()
+        if calendar_dates_df is not None:
+            known = set(service_ids)
+            for service_id in pd.unique(calendar_dates_df["service_id"].astype(str)):
+                if service_id not in known:
+                    known.add(service_id)
+                    service_ids.append(service_id)
+        self.service_ids = np.array(service_ids, dtype=object)
+        self.service_position = {service_id: i for i, service_id in enumerate(service_ids)}
+        n_services = len(service_ids)
+        n_calendar = len(calendar_df)
+
+        # Weekday pattern per service, ignoring date ranges, for callers that only know the day name
+        self.weekday_mask = np.zeros((7, n_services), dtype=bool)
+        for weekday, day_name in enumerate(WEEKDAYS):
+            self.weekday_mask[weekday, :n_calendar] = calendar_df[day_name].to_numpy() == 1
+
+        starts = [parse_service_date(v) for v in calendar_df["start_date"]]
+        ends = [parse_service_date(v) for v in calendar_df["end_date"]]
+        exceptions: List[Tuple[date, int, int]] = []
+        if calendar_dates_df is not None:
+            for service_id, day, exception_type in zip(calendar_dates_df["service_id"].astype(str),
+                                                       calendar_dates_df["date"],
+                                                       calendar_dates_df["exception_type"]):
+                exceptions.append((parse_service_date(day), self.service_position[service_id], int(exception_type)))
+
+        all_dates = starts + ends + [exception[0] for exception in exceptions]
+        if not all_dates:
+            self.first_date = date.today()
+            self.bitsets = np.zeros((0, (n_services + 7) // 8), dtype=np.uint8)
+            return
+        self.first_date = min(all_dates)
+        n_days = (max(all_dates) - self.first_date).days + 1
+
+        active = np.zeros((n_days, n_services), dtype=bool)
+        weekday_of_row = (self.first_date.weekday() + np.arange(n_days)) % 7
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            first = (start - self.first_date).days
+            last = (end - self.first_date).days + 1
+            active[first:last, i] = self.weekday_mask[weekday_of_row[first:last], i]
+        for day, service, exception_type in exceptions:
+            active[(day - self.first_date).days, service] = exception_type == SERVICE_ADDED
+
+        self.bitsets = np.packbits(active, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.bitsets)
+
+    def active_mask(self, service_date: DateLike) -> np.ndarray:
+        """
+        :param service_date: date to look up
+        :return: bool array aligned with self.service_ids, all False outside the feed's date range
+        """
+        offset = (parse_service_date(service_date) - self.first_date).days
+        if offset < 0 or offset >= len(self.bitsets):
+            return np.zeros(len(self.service_ids), dtype=bool)
+        return np.unpackbits(self.bitsets[offset], count=len(self.service_ids)).astype(bool)
+
+    def services_on_date(self, service_date: DateLike) -> np.ndarray:
+        """
+        :param service_date: date to look up
+        :return: array of service_ids running on that date
+        """
+        return self.service_ids[self.active_mask(service_date)]
+
+    def services_on_weekday(self, day_of_week: str) -> np.ndarray:
+        """
+        :param day_of_week: "monday", "tuesday", etc.
+        :return: array of service_ids scheduled on that weekday in calendar.txt, regardless of dates
+        """
+        return self.service_ids[self.weekday_mask[WEEKDAYS.index(day_of_week.lower())]]
+
+
+class ServiceTripIndex:
+    """
+    Service -> trip lookup for trips.txt.
+
+    Trips are sorted by service once with offsets per service, and the trip array for each
+    distinct set of services is built on first request and reused, since a feed only has a
+    handful of distinct weekday and holiday service combinations.
+    """
+
+    def __init__(self, trips_df: pd.DataFrame):
+        """
+        :param trips_df: trips.txt DataFrame
+        """
+        services = trips_df["service_id"].astype(str).to_numpy(dtype=object)
+        trip_ids = trips_df["trip_id"].astype(str).to_numpy(dtype=object)
+        order = np.argsort(services, kind="stable")
+        sorted_services = services[order]
+
+        self.trip_ids = trip_ids[order]
+        self.service_ids, starts = np.unique(sorted_services, return_index=True)
+        ends = np.append(starts[1:], len(sorted_services))
+        self.service_slices: Dict[str, slice] = {
+            service_id: slice(int(start), int(end)) for service_id, start, end in zip(self.service_ids, starts, ends)
+        }
+        self._combinations: Dict[Tuple[str, ...], np.ndarray] = {}
+
+    def trips_for_service(self, service_id: str) -> np.ndarray:
+        """
+        :param service_id: GTFS service_id
+        :return: view of trip_ids belonging to that service
+        """
+        return self.trip_ids[self.service_slices.get(str(service_id), slice(0, 0))]
+
+    def trips_for_services(self, service_ids: Iterable[str]) -> np.ndarray:
+        """
+        :param service_ids: active service_ids
+        :return: shared, read-only array of trip_ids belonging to any of the services
+        """
+        key = tuple(sorted(set(str(service_id) for service_id in service_ids)))
+        trips = self._combinations.get(key)
+        if trips is None:
+            parts = [self.trips_for_service(service_id) for service_id in key]
+            trips = np.concatenate(parts) if parts else np.array([], dtype=object)
+            trips.flags.writeable = False
+            self._combinations[key] = trips
+        return trips
+
+
+def get_service_calendar(calendar_df: pd.DataFrame, calendar_dates_df: Optional[pd.DataFrame] = None) -> ServiceCalendar:
+    """
+    Returns the process-wide ServiceCalendar for a calendar DataFrame, building it on first use.
+    :param calendar_df: calendar.txt DataFrame
+    :param calendar_dates_df: optional calendar_dates.txt DataFrame, applied as exceptions
+    :return: shared ServiceCalendar
+    """
+    if calendar_dates_df is None:
+        return cached_on(calendar_df, "service_calendar", ServiceCalendar)
+    # Held by calendar_dates and checked against calendar by identity, so replacing either table rebuilds it
+    name = f"service_calendar:{id(calendar_df)}"
+    entry = peek_cached(calendar_dates_df, name)
+    if entry is None or entry[0]() is not calendar_df:
+        clear_cached(calendar_dates_df, name)
+        entry = cached_on(calendar_dates_df, name, lambda _: (weakref.ref(calendar_df),
+                                                              ServiceCalendar(calendar_df, calendar_dates_df)))
+    return entry[1]
+
+
+def get_service_trip_index(trips_df: pd.DataFrame) -> ServiceTripIndex:
+    """
+    Returns the process-wide ServiceTripIndex for a trips DataFrame, building it on first use.
+    :param trips_df: trips.txt DataFrame
+    :return: shared ServiceTripIndex
+    """
+    return cached_on(trips_df, "service_trip_index", ServiceTripIndex)
+
+
+def service_dates(first: DateLike, last: DateLike) -> List[date]:
+    """
+    Lists every date from first to last inclusive, e.g. to loop over a semester.
+    :param first: first date
+    :param last: last date
+    :return: list of datetime.date
+    """
+    first_date = parse_service_date(first)
+    n_days = (parse_service_date(last) - first_date).days + 1
+    return [first_date + timedelta(days=i) for i in range(max(0, n_days))]
@@ -0,0 +1,167 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.distance import (WalkingTimes, estimate_walking_seconds, haversine_distances_meters,
+                            haversine_distance_matrix_meters)
+from utils.memo import cached_on
+
+EARTH_RADIUS_M = 6371000.0
+DEFAULT_CELL_SIZE_M = 250.0
+
+
+class StopIndex:
+    """
+    Grid-bucketed spatial index over GTFS stops for fast radius queries.
+
+    Stops are projected onto a flat plane around the feed's mean latitude and bucketed into
+    square cells. A radius query only measures exact haversine distances to stops in the
+    handful of cells overlapping the search circle instead of every stop in the feed.
+    """
+
+    def __init__(self, stops_df: pd.DataFrame, cell_size: float = DEFAULT_CELL_SIZE_M):
+        """
+        :param stops_df: stops.txt DataFrame
+        :param cell_size: grid cell edge length in meters
+        """
+        self.stop_ids = stops_df["stop_id"].astype(str).to_numpy()
+        self.stop_names = stops_df["stop_name"].astype(str).to_numpy()
+        self.lats = stops_df["stop_lat"].to_numpy(dtype=np.float64)
+        self.lngs = stops_df["stop_lon"].to_numpy(dtype=np.float64)
+        self.cell_size = float(cell_size)
+
+        self._ref_lat = float(self.lats.mean()) if len(self.lats) else 0.0
+        self._x_scale = math.radians(1) * EARTH_RADIUS_M * math.cos(math.radians(self._ref_lat))
+        self._y_scale = math.radians(1) * EARTH_RADIUS_M
+
+        cell_x = np.floor(self.lngs * self._x_scale / self.cell_size).astype(np.int64)
+        cell_y = np.floor(self.lats * self._y_scale / self.cell_size).astype(np.int64)
+
+        # Sort stops by cell once so every bucket is a contiguous slice of self._order
+        self._order = np.lexsort((cell_y, cell_x))
+        sorted_x = cell_x[self._order]
+        sorted_y = cell_y[self._order]
+        boundaries = np.flatnonzero((np.diff(sorted_x) != 0) | (np.diff(sorted_y) != 0)) + 1
+        starts = np.concatenate(([0], boundaries)) if len(self._order) else np.array([], dtype=np.int64)
+        ends = np.concatenate((boundaries, [len(self._order)])) if len(self._order) else starts
+
+        self._cells: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        for start, end in zip(starts, ends):
+            self._cells[(int(sorted_x[start]), int(sorted_y[start]))] = (int(start), int(end))
+
+        self._position = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+
+    def __len__(self) -> int:
+        return len(self.stop_ids)
+
+    def position_of(self, stop_id: str) -> int:
+        """
+        :param stop_id: GTFS stop_id
+        :return: row position of the stop in the index arrays, or -1 if unknown
+        """
+        return self._position.get(str(stop_id), -1)
+
+    def query_radius(self, lat: float, lng: float, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds every stop within radius meters of a point.
+        :param lat: latitude of reference point
+        :param lng: longitude of reference point
+        :param radius: search radius in meters
+        :return: tuple of (stop positions, distances in meters), both sorted by increasing distance
+        """
+        x = lng * self._x_scale
+        y = lat * self._y_scale
+        # Pad by 1% so projection error at the edge of the circle never drops a real match
+        reach = radius * 1.01
+        min_cx = math.floor((x - reach) / self.cell_size)
+        max_cx = math.floor((x + reach) / self.cell_size)
+        min_cy = math.floor((y - reach) / self.cell_size)
+        max_cy = math.floor((y + reach) / self.cell_size)
+
+        slices = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                bounds = self._cells.get((cx, cy))
+                if bounds is not None:
+                    slices.append(self._order[bounds[0]:bounds[1]])
+
+        if not slices:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        candidates = np.concatenate(slices)
+        distances = haversine_distances_meters(lat, lng, self.lats[candidates], self.lngs[candidates])
+        within = distances <= radius
+        candidates = candidates[within]
+        distances = distances[within]
+
+        order = np.argsort(distances, kind="stable")
+        return candidates[order], distances[order]
+
+    def distance_matrix(self, lats, lngs, dtype=np.float64) -> np.ndarray:
+        """
+        Distances from many points (e.g. every campus building) to every stop in one vectorized call.
+        :param lats: array-like of M latitudes
+        :param lngs: array-like of M longitudes
+        :param dtype: np.float64 or np.float32
+        :return: M x len(self) matrix of distances in meters, columns in index order
+        """
+        return haversine_distance_matrix_meters(lats, lngs, self.lats, self.lngs, dtype)
+
+    def nearby_stops(self, lat: float, lng: float, radius: float) -> List[Dict[str, Any]]:
+        """
+        Radius query returning readable stop records instead of positions.
+        :param lat: latitude of reference point
+        :param lng: longitude of reference point
+        :param radius: search radius in meters
+        :return: list of dicts with keys: stop_id, stop_name, lat, long, distance, sorted by distance
+        """
+        positions, distances = self.query_radius(lat, lng, radius)
+        results = []
+        for pos, dist in zip(positions.tolist(), distances.tolist()):
+            results.append({
+                "stop_id": self.stop_ids[pos],
+                "stop_name": self.stop_names[pos],
+                "lat": float(self.lats[pos]),
+                "long": float(self.lngs[pos]),
+                "distance": dist
+            })
+        return results
+
+    def stop_walks(self, lat: float, lng: float, radius: float, stop_code: Dict[str, int],
+                   walking_times: Optional[WalkingTimes] = None, to_point: bool = False) -> Dict[int, int]:
+        """
+        Walking seconds between a point and every served stop within radius, the access and egress
+        walks of the routers. Stops are picked by straight-line distance; walking_times, when given,
+        supplies the street walking time of each of them in one batched lookup.
+        :param lat: latitude of reference point
+        :param lng: longitude of reference point
+        :param radius: max walking distance in meters
+        :param stop_code: stop_id -> router stop code; stops without a code are skipped
+        :param walking_times: optional WalkingTimes, the straight-line estimate is used without it
+        :param to_point: True for walks from the stops to the point, False for walks from the point
+        :return: dict of stop code -> walking seconds
+        """
+        walks = {}
+        positions, distances = self.query_radius(lat, lng, radius)
+        for pos, distance in zip(positions.tolist(), distances.tolist()):
+            code = stop_code.get(self.stop_ids[pos])
+            if code is not None:
+                walks[code] = (pos, distance)
+
+        if walking_times is None:
+            return {code: estimate_walking_seconds(distance) for code, (_, distance) in walks.items()}
+        point = (lat, lng)
+        stops = [(float(self.lats[pos]), float(self.lngs[pos])) for pos, _ in walks.values()]
+        pairs = [(stop, point) if to_point else (point, stop) for stop in stops]
+        return dict(zip(walks, walking_times.seconds(pairs)))
+
+
+def get_stop_index(stops_df: pd.DataFrame) -> StopIndex:
+    """
+    Returns the process-wide StopIndex for a stops DataFrame, building it on first use.
+    :param stops_df: stops.txt DataFrame
+    :return: StopIndex shared by every caller holding the same DataFrame
+    """
+    return cached_on(stops_df, "stop_index", StopIndex)
@@ -10,3 +10,25 @@ def suggest_transport_option(distance: float):
         return "Walk"
     else:
         return "Take the bus"
+
+
+def suggest_transport_option_between(matrix, origin: str, destination: str, day_of_week: str,
+                                     arrival_time, distance: float = None):
+    """
+    Suggest whether to walk or take bus between two buildings from the precomputed travel time
+    matrix, falling back to the distance rule when the matrix cannot answer.
+    :param matrix: TravelTimeMatrix from core.travel_matrix
+    :param origin: official origin building name
+    :param destination: official destination building name
+    :param day_of_week: "monday", "tuesday", etc.
+    :param arrival_time: time to arrive by, as HH:MM:SS or seconds
+    :param distance: optional distance in meters, used by the fallback
+    :return: 'walk' or 'bus'
+    """
+    walk_minutes = matrix.walking_minutes(origin, destination)
+    bus_minutes = matrix.transit_minutes(origin, destination, day_of_week, arrival_time)
+    if walk_minutes is None:
+        return suggest_transport_option(distance) if distance is not None else "Take the bus"
+    if bus_minutes is None or walk_minutes <= bus_minutes:
+        return "Walk"
+    return "Take the bus"
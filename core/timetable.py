@@ -0,0 +1,127 @@
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.memo import cached_on
+from utils.time_utils import MISSING_TIME, gtfs_times_to_seconds
+
+# Marker for stop_times rows without a published time (non-timepoint stops)
+NO_TIME = MISSING_TIME
+
+
+class TimetableIndex:
+    """
+    Compressed-sparse-row view of stop_times.txt.
+
+    Rows are sorted once by (trip, stop_sequence) into flat arrays, and trip_offsets[i]:trip_offsets[i + 1]
+    is the contiguous block of rows for trip i. Per-trip lookups are then a dict hit plus NumPy
+    slices, which are views into the shared arrays rather than copies.
+    """
+
+    def __init__(self, stop_times_df: pd.DataFrame):
+        """
+        :param stop_times_df: stop_times.txt DataFrame
+        """
+        trip_col = stop_times_df["trip_id"]
+        if not isinstance(trip_col.dtype, pd.CategoricalDtype):
+            trip_col = trip_col.astype(str).astype("category")
+        stop_col = stop_times_df["stop_id"]
+        if not isinstance(stop_col.dtype, pd.CategoricalDtype):
+            stop_col = stop_col.astype(str).astype("category")
+
+        trip_codes = trip_col.cat.codes.to_numpy()
+        all_stop_codes = stop_col.cat.codes.to_numpy()
+        sequences = stop_times_df["stop_sequence"].to_numpy()
+        # Rows without a trip or stop have code -1, which would index the last category
+        rows = np.flatnonzero((trip_codes >= 0) & (all_stop_codes >= 0))
+        order = rows[np.lexsort((sequences[rows], trip_codes[rows]))]
+
+        # Only keep trips that actually have rows, numbered densely in sorted order
+        sorted_trip_codes = trip_codes[order]
+        used_codes, counts = np.unique(sorted_trip_codes, return_counts=True)
+
+        self.trip_ids = trip_col.cat.categories.to_numpy(dtype=object)[used_codes]
+        self.trip_offsets = np.zeros(len(used_codes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.trip_offsets[1:])
+        self.trip_position: Mapping[str, int] = {str(trip_id): i for i, trip_id in enumerate(self.trip_ids)}
+
+        self.stop_id_values = stop_col.cat.categories.to_numpy(dtype=object)
+        self.stop_codes = all_stop_codes[order].astype(np.int32)
+        self.stop_sequences = sequences[order].astype(np.int32)
+        self.arrival_secs = gtfs_times_to_seconds(stop_times_df["arrival_time"])[order]
+        self.departure_secs = gtfs_times_to_seconds(stop_times_df["departure_time"])[order]
+
+    @classmethod
+    def from_arrays(cls, trip_ids: np.ndarray, trip_offsets: np.ndarray, stop_id_values: np.ndarray,
+                    stop_codes: np.ndarray, stop_sequences: np.ndarray, arrival_secs: np.ndarray,
+                    departure_secs: np.ndarray,
+                    trip_position: Optional[Mapping[str, int]] = None) -> "TimetableIndex":
+        """
+        Rebuilds an index from arrays already in sorted CSR order, e.g. views into a compiled
+        timetable file, without copying them.
+        :param trip_position: optional trip_id -> trip position mapping, built from trip_ids if omitted
+        :return: TimetableIndex over the given arrays
+        """
+        index = cls.__new__(cls)
+        index.trip_ids = trip_ids
+        index.trip_offsets = trip_offsets
+        if trip_position is None:
+            trip_position = {str(trip_id): i for i, trip_id in enumerate(trip_ids)}
+        index.trip_position = trip_position
+        index.stop_id_values = stop_id_values
+        index.stop_codes = stop_codes
+        index.stop_sequences = stop_sequences
+        index.arrival_secs = arrival_secs
+        index.departure_secs = departure_secs
+        return index
+
+    def __len__(self) -> int:
+        return len(self.trip_ids)
+
+    def trip_slice(self, trip_id: str) -> slice:
+        """
+        :param trip_id: GTFS trip_id
+        :return: slice into the row arrays for this trip, empty if the trip has no stop times
+        """
+        pos = self.trip_position.get(str(trip_id))
+        if pos is None:
+            return slice(0, 0)
+        return slice(int(self.trip_offsets[pos]), int(self.trip_offsets[pos + 1]))
+
+    def stops_for_trip(self, trip_id: str) -> np.ndarray:
+        """
+        :param trip_id: GTFS trip_id
+        :return: stop_ids in the order visited by the trip
+        """
+        return self.stop_id_values[self.stop_codes[self.trip_slice(trip_id)]]
+
+    def stop_codes_for_trip(self, trip_id: str) -> np.ndarray:
+        """
+        :param trip_id: GTFS trip_id
+        :return: view of integer stop codes (positions in stop_id_values) in visiting order
+        """
+        return self.stop_codes[self.trip_slice(trip_id)]
+
+    def arrivals_for_trip(self, trip_id: str) -> np.ndarray:
+        """
+        :param trip_id: GTFS trip_id
+        :return: view of arrival times in seconds, aligned with stops_for_trip
+        """
+        return self.arrival_secs[self.trip_slice(trip_id)]
+
+    def departures_for_trip(self, trip_id: str) -> np.ndarray:
+        """
+        :param trip_id: GTFS trip_id
+        :return: view of departure times in seconds, aligned with stops_for_trip
+        """
+        return self.departure_secs[self.trip_slice(trip_id)]
+
+
+def get_timetable_index(stop_times_df: pd.DataFrame) -> TimetableIndex:
+    """
+    Returns the process-wide TimetableIndex for a stop_times DataFrame, building it on first use.
+    :param stop_times_df: stop_times.txt DataFrame
+    :return: TimetableIndex shared by every caller holding the same DataFrame
+    """
+    return cached_on(stop_times_df, "timetable_index", TimetableIndex)
@@ -0,0 +1,239 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from core.csa import get_connection_table
+from core.gtfs_parser import get_active_service_ids
+from core.service_calendar import WEEKDAYS
+from core.stop_index import get_stop_index
+from utils.distance import estimate_walking_seconds_array, haversine_distance_matrix_meters
+from utils.time_utils import to_seconds
+
+MATRIX_VERSION = 1
+BUCKET_SECONDS = 15 * 60
+FIRST_BUCKET_SECONDS = 6 * 3600
+LAST_BUCKET_SECONDS = 22 * 3600
+# Access and egress walks considered between a building and a stop
+DEFAULT_MAX_WALKING_DISTANCE = 800.0
+# uint16 minutes; the largest value marks "no bus connection in time"
+UNREACHABLE_MINUTES = np.iinfo(np.uint16).max
+# Far enough below any departure that subtracting a walk cannot overflow
+NO_DEPARTURE = -(1 << 40)
+
+DEFAULT_MATRIX_DIR = "data/cache/travel_times/"
+TRAVEL_TIMES_NAME = "travel_times.npy"
+WALKING_TIMES_NAME = "walking_times.npy"
+METADATA_NAME = "travel_times.json"
+
+
+class TravelTimeMatrix:
+    """
+    Precomputed door-to-door travel times between every pair of campus buildings.
+
+    travel_times[layer, bucket, origin, destination] is how many minutes before the start of the
+    arrival bucket one has to leave the origin when taking the bus, and walking_times[origin,
+    destination] the minutes it takes to walk. Weekdays with the same active services share a
+    layer. Both arrays are memory-mapped, so a lookup reads two uint16 values from disk.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: folder written by build_travel_time_matrix
+        """
+        with open(os.path.join(directory, METADATA_NAME), "r") as f:
+            self.metadata: Dict[str, Any] = json.load(f)
+        self.directory = directory
+        self.buildings: List[str] = self.metadata["buildings"]
+        self.building_position = {name: i for i, name in enumerate(self.buildings)}
+        self.day_layers: Dict[str, int] = self.metadata["day_layers"]
+        self.first_bucket_secs: int = self.metadata["first_bucket_secs"]
+        self.bucket_secs: int = self.metadata["bucket_secs"]
+        self.n_buckets: int = self.metadata["n_buckets"]
+        self.travel_times = np.load(os.path.join(directory, TRAVEL_TIMES_NAME), mmap_mode="r")
+        self.walking_times = np.load(os.path.join(directory, WALKING_TIMES_NAME), mmap_mode="r")
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self.metadata.get("fingerprint")
+
+    def bucket_of(self, arrival_time: Union[str, int]) -> Optional[int]:
+        """
+        :param arrival_time: time to arrive by, as HH:MM:SS or seconds
+        :return: bucket whose start is the latest at or before arrival_time, or None outside the matrix
+        """
+        bucket = (to_seconds(arrival_time) - self.first_bucket_secs) // self.bucket_secs
+        return bucket if 0 <= bucket < self.n_buckets else None
+
+    def walking_minutes(self, origin: str, destination: str) -> Optional[int]:
+        """
+        :param origin: official origin building name
+        :param destination: official destination building name
+        :return: walking minutes, or None if either building is unknown
+        """
+        o = self.building_position.get(origin)
+        d = self.building_position.get(destination)
+        if o is None or d is None or self.walking_times[o, d] == UNREACHABLE_MINUTES:
+            return None
+        return int(self.walking_times[o, d])
+
+    def transit_minutes(self, origin: str, destination: str, day_of_week: str,
+                        arrival_time: Union[str, int]) -> Optional[int]:
+        """
+        :param origin: official origin building name
+        :param destination: official destination building name
+        :param day_of_week: "monday", "tuesday", etc.
+        :param arrival_time: time to arrive by, as HH:MM:SS or seconds
+        :return: minutes from leaving the origin to the start of the arrival bucket using a bus,
+        or None if no bus gets there in time or the query is outside the matrix
+        """
+        o = self.building_position.get(origin)
+        d = self.building_position.get(destination)
+        layer = self.day_layers.get(day_of_week.lower())
+        bucket = self.bucket_of(arrival_time)
+        if o is None or d is None or layer is None or bucket is None:
+            return None
+        minutes = self.travel_times[layer, bucket, o, d]
+        return None if minutes == UNREACHABLE_MINUTES else int(minutes)
+
+    def travel_minutes(self, origin: str, destination: str, day_of_week: str,
+                       arrival_time: Union[str, int]) -> Optional[int]:
+        """
+        :return: the shorter of walking and transit minutes, or None if neither is known
+        """
+        options = [minutes for minutes in (self.walking_minutes(origin, destination),
+                                           self.transit_minutes(origin, destination, day_of_week, arrival_time))
+                   if minutes is not None]
+        return min(options) if options else None
+
+
+def build_travel_time_matrix(gtfs_data: Dict[str, pd.DataFrame], buildings_data: List[Dict[str, Any]],
+                             out_dir: str, days: Optional[List[str]] = None,
+                             first_bucket_secs: int = FIRST_BUCKET_SECONDS,
+                             last_bucket_secs: int = LAST_BUCKET_SECONDS,
+                             bucket_secs: int = BUCKET_SECONDS,
+                             max_walking_distance: float = DEFAULT_MAX_WALKING_DISTANCE,
+                             fingerprint: Optional[str] = None) -> TravelTimeMatrix:
+    """
+    Offline precompute of the building x building matrix. For each destination building and each
+    distinct service day, one CSA profile scan gives the latest departure from every stop for every
+    arrival bucket, which is then combined with the walks from each origin building to its stops.
+    :param gtfs_data: loaded GTFS dataset
+    :param buildings_data: building records with name, lat and long
+    :param out_dir: folder to write the matrix files to
+    :param days: weekdays to cover, all seven by default
+    :param first_bucket_secs: start of the first arrival bucket, in seconds
+    :param last_bucket_secs: end of the last arrival bucket, in seconds
+    :param bucket_secs: bucket width, in seconds
+    :param max_walking_distance: max walk in meters between a building and a stop
+    :param fingerprint: optional feed fingerprint recorded so stale matrices can be detected
+    :return: TravelTimeMatrix over the written files
+    """
+    days = [day.lower() for day in (days or WEEKDAYS)]
+    buildings = [b for b in buildings_data if b.get("name") and b.get("lat") is not None and b.get("long") is not None]
+    names = [b["name"] for b in buildings]
+    lats = np.array([b["lat"] for b in buildings], dtype=np.float64)
+    lngs = np.array([b["long"] for b in buildings], dtype=np.float64)
+    n = len(buildings)
+    n_buckets = max(0, (last_bucket_secs - first_bucket_secs) // bucket_secs)
+    deadlines = first_bucket_secs + bucket_secs * np.arange(n_buckets, dtype=np.int64)
+
+    # Weekdays with identical active services produce identical layers
+    day_layers: Dict[str, int] = {}
+    layer_days: List[str] = []
+    service_sets: Dict[tuple, int] = {}
+    for day in days:
+        services = tuple(sorted(get_active_service_ids(day, gtfs_data["calendar"])))
+        if services not in service_sets:
+            service_sets[services] = len(layer_days)
+            layer_days.append(day)
+        day_layers[day] = service_sets[services]
+
+    os.makedirs(out_dir, exist_ok=True)
+    walk_secs = estimate_walking_seconds_array(haversine_distance_matrix_meters(lats, lngs, lats, lngs))
+    walking = np.lib.format.open_memmap(os.path.join(out_dir, WALKING_TIMES_NAME), mode="w+",
+                                        dtype=np.uint16, shape=(n, n))
+    walking[:] = np.minimum(np.ceil(walk_secs / 60), UNREACHABLE_MINUTES - 1).astype(np.uint16)
+    walking.flush()
+
+    travel = np.lib.format.open_memmap(os.path.join(out_dir, TRAVEL_TIMES_NAME), mode="w+",
+                                       dtype=np.uint16, shape=(len(layer_days), n_buckets, n, n))
+    stop_index = get_stop_index(gtfs_data["stops"])
+    for layer, day in enumerate(layer_days):
+        table = get_connection_table(gtfs_data, day)
+        walks = [stop_index.stop_walks(lats[i], lngs[i], max_walking_distance, table.stop_code) for i in range(n)]
+        access = [(np.array(list(w.keys()), dtype=np.int64), np.array(list(w.values()), dtype=np.int64))
+                  for w in walks]
+
+        for d in range(n):
+            travel[layer, :, :, d] = UNREACHABLE_MINUTES
+            if not walks[d] or not n_buckets:
+                continue
+            profiles = table.profiles(walks[d], int(deadlines[-1]))
+            # Latest departure from each profiled stop that still arrives by each deadline
+            stops = np.array(list(profiles.keys()), dtype=np.int64)
+            stop_latest = np.full((n_buckets, table.n_stops), NO_DEPARTURE, dtype=np.int64)
+            for stop, (departures, arrivals) in profiles.items():
+                first_ok = np.searchsorted(-arrivals, -deadlines, side="left")
+                ok = first_ok < len(arrivals)
+                stop_latest[ok, stop] = departures[first_ok[ok]]
+
+            for o in range(n):
+                codes, access_secs = access[o]
+                if o == d or not len(codes) or not len(stops):
+                    continue
+                latest = (stop_latest[:, codes] - access_secs).max(axis=1)
+                reachable = latest > NO_DEPARTURE
+                minutes = np.ceil((deadlines - latest) / 60)
+                travel[layer, reachable, o, d] = np.minimum(minutes[reachable], UNREACHABLE_MINUTES - 1)
+            travel[layer, :, d, d] = 0
+    travel.flush()
+    del travel, walking
+
+    metadata = {
+        "version": MATRIX_VERSION,
+        "fingerprint": fingerprint,
+        "buildings": names,
+        "day_layers": day_layers,
+        "first_bucket_secs": first_bucket_secs,
+        "bucket_secs": bucket_secs,
+        "n_buckets": int(n_buckets),
+        "max_walking_distance": max_walking_distance
+    }
+    tmp_path = os.path.join(out_dir, METADATA_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f)
+    os.replace(tmp_path, os.path.join(out_dir, METADATA_NAME))
+    return TravelTimeMatrix(out_dir)
+
+
+def load_travel_time_matrix(directory: str, fingerprint: Optional[str] = None) -> Optional[TravelTimeMatrix]:
+    """
+    Opens a precomputed matrix, memory-mapped.
+    :param directory: folder written by build_travel_time_matrix
+    :param fingerprint: optional current feed fingerprint; a matrix built from another feed is ignored
+    :return: TravelTimeMatrix, or None if missing, from an older format, or stale
+    """
+    try:
+        matrix = TravelTimeMatrix(directory)
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        print(f"No usable travel time matrix in {directory}: {e}")
+        return None
+    if matrix.metadata.get("version") != MATRIX_VERSION:
+        return None
+    if fingerprint is not None and matrix.fingerprint != fingerprint:
+        return None
+    return matrix
+
+
+if __name__ == "__main__":
+    from core.buildings import load_buildings
+    from core.feed_cache import compute_feed_fingerprint
+    from core.gtfs_parser import load_gtfs_files
+
+    print("Building campus travel time matrix...")
+    matrix = build_travel_time_matrix(load_gtfs_files(), load_buildings(), DEFAULT_MATRIX_DIR,
+                                      fingerprint=compute_feed_fingerprint("data/gtfs/"))
+    print(f"Wrote {len(matrix.buildings)} buildings x {matrix.n_buckets} buckets to {DEFAULT_MATRIX_DIR}")
@@ -1,4 +1,5 @@
 import json
+import sys
 
 import core.cli as cli
 import core.schedule_parser as parser
@@ -16,4 +17,11 @@ def main():
     print("\nReady to begin transit planning...\n")
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["serve"]:
+        import core.server as server
+        server.main(sys.argv[2:])
+    elif sys.argv[1:2] == ["batch"]:
+        import core.batch as batch
+        batch.main(sys.argv[2:])
+    else:
+        main()
@@ -0,0 +1,129 @@
+import os
+from typing import Dict, List
+
+import pandas as pd
+import pytest
+
+from core.gtfs_parser import read_gtfs_folder
+from core.timetable import get_timetable_index
+from utils.distance import estimate_walking_seconds, haversine_distance_meters
+
+# Synthetic campus: horizontal lines of stops about 90 m apart, lines about 170 m apart, so
+# footpaths reach neighbouring stops on the same and adjacent lines
+N_LINES = 8
+STOPS_PER_LINE = 12
+BASE_LAT = 43.0700
+BASE_LON = -89.4100
+LAT_STEP = 0.0015
+LON_STEP = 0.0011
+VERTICAL_COLUMNS = (1, 5, 9)
+
+
+def stop_id(line: int, column: int) -> str:
+    return f"S{line}_{column}"
+
+
+def _clock(seconds: int) -> str:
+    return f"{seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+
+
+def write_synthetic_feed(folder: str) -> None:
+    """
+    Writes a small GTFS feed: an east-west route per line, north-south routes on a few columns,
+    weekday and weekend services, and hourly express trips on H0 that overtake the regular ones.
+    :param folder: directory to write the txt files to
+    """
+    os.makedirs(folder, exist_ok=True)
+    stops = [{"stop_id": stop_id(line, column), "stop_name": f"Line {line} at {column}",
+              "stop_lat": round(BASE_LAT + line * LAT_STEP, 6), "stop_lon": round(BASE_LON + column * LON_STEP, 6)}
+             for line in range(N_LINES) for column in range(STOPS_PER_LINE)]
+    routes, trips, stop_times = [], [], []
+
+    def add_trip(route_id: str, service_id: str, direction: int, headsign: str, direction_name: str,
+                 stop_ids: List[str], start: int, hop_secs: int, dwell_secs: int = 20) -> None:
+        trip_id = f"{route_id}-{service_id}-{direction}-{start}"
+        trips.append({"trip_id": trip_id, "route_id": route_id, "service_id": service_id,
+                      "trip_headsign": headsign, "direction_id": direction, "trip_direction_name": direction_name})
+        secs = start
+        for sequence, stop in enumerate(stop_ids, start=1):
+            stop_times.append({"trip_id": trip_id, "arrival_time": _clock(secs),
+                               "departure_time": _clock(secs + dwell_secs), "stop_id": stop,
+                               "stop_sequence": sequence})
+            secs += dwell_secs + hop_secs
+
+    for line in range(N_LINES):
+        route_id = f"H{line}"
+        routes.append({"route_id": route_id, "route_short_name": route_id, "route_long_name": f"Route {route_id}",
+                       "route_type": 3})
+        eastbound = [stop_id(line, column) for column in range(STOPS_PER_LINE)]
+        hop = 70 + (line * 13) % 50
+        for service_id, headway in (("WK", 600), ("WE", 1800)):
+            for start in range(6 * 3600 + line * 45, 21 * 3600, headway):
+                add_trip(route_id, service_id, 0, "EAST END", "Eastbound", eastbound, start, hop)
+                add_trip(route_id, service_id, 1, "WEST END", "Westbound", eastbound[::-1], start + 300, hop)
+    for start in range(7 * 3600 + 180, 20 * 3600, 3600):
+        add_trip("H0", "WK", 0, "EAST END EXPRESS", "Eastbound", [stop_id(0, c) for c in range(STOPS_PER_LINE)],
+                 start, 35, dwell_secs=5)
+
+    for column in VERTICAL_COLUMNS:
+        route_id = f"V{column}"
+        routes.append({"route_id": route_id, "route_short_name": route_id, "route_long_name": f"Route {route_id}",
+                       "route_type": 3})
+        northbound = [stop_id(line, column) for line in range(N_LINES)]
+        for start in range(6 * 3600 + column * 60, 21 * 3600, 900):
+            add_trip(route_id, "WK", 0, "NORTH END", "Northbound", northbound, start, 100)
+            add_trip(route_id, "WK", 1, "SOUTH END", "Southbound", northbound[::-1], start + 420, 100)
+
+    calendar = [
+        {"service_id": "WK", "monday": 1, "tuesday": 1, "wednesday": 1, "thursday": 1, "friday": 1,
+         "saturday": 0, "sunday": 0, "start_date": 20250101, "end_date": 20351231},
+        {"service_id": "WE", "monday": 0, "tuesday": 0, "wednesday": 0, "thursday": 0, "friday": 0,
+         "saturday": 1, "sunday": 1, "start_date": 20250101, "end_date": 20351231}
+    ]
+    for name, rows in (("stops", stops), ("routes", routes), ("trips", trips), ("stop_times", stop_times),
+                       ("calendar", calendar)):
+        pd.DataFrame(rows).to_csv(os.path.join(folder, f"{name}.txt"), index=False)
+
+
+@pytest.fixture(scope="session")
+def feed_folder(tmp_path_factory) -> str:
+    folder = str(tmp_path_factory.mktemp("feed"))
+    write_synthetic_feed(folder)
+    return folder
+
+
+@pytest.fixture(scope="session")
+def gtfs_data(feed_folder) -> Dict[str, pd.DataFrame]:
+    """Parsed synthetic feed shared by tests that only read it."""
+    return read_gtfs_folder(feed_folder)
+
+
+def assert_feasible(journey: dict, gtfs_data: Dict[str, pd.DataFrame], transfer_radius: float) -> None:
+    """
+    Checks a planner journey against the timetable: every ride boards and alights where and when
+    its trip actually stops, walks between stops are single footpaths, and no connection is missed.
+    """
+    timetable = get_timetable_index(gtfs_data["stop_times"])
+    stops = gtfs_data["stops"].set_index(gtfs_data["stops"]["stop_id"].astype(str))
+    ready = None
+    previous_type = None
+    for leg in journey["legs"]:
+        if leg["type"] == "ride":
+            trip_slice = timetable.trip_slice(leg["trip_id"])
+            trip_stops = timetable.stops_for_trip(leg["trip_id"]).astype(str).tolist()
+            board = trip_stops.index(leg["from_stop"])
+            alight = trip_stops.index(leg["to_stop"], board + 1)
+            assert timetable.departure_secs[trip_slice][board] == leg["board_secs"]
+            assert timetable.arrival_secs[trip_slice][alight] == leg["alight_secs"]
+            if ready is not None:
+                assert ready <= leg["board_secs"], f"connection missed in {journey['legs']}"
+            ready = leg["alight_secs"]
+        elif leg["from_stop"] is not None and leg["to_stop"] is not None:
+            assert previous_type != "footpath", f"chained footpaths in {journey['legs']}"
+            a, b = stops.loc[leg["from_stop"]], stops.loc[leg["to_stop"]]
+            distance = haversine_distance_meters(a.stop_lat, a.stop_lon, b.stop_lat, b.stop_lon)
+            assert distance <= transfer_radius + 1e-6
+            assert leg["duration"] == estimate_walking_seconds(distance)
+            if ready is not None:
+                ready += leg["duration"]
+        previous_type = "footpath" if leg["type"] == "walk" and leg["from_stop"] and leg["to_stop"] else leg["type"]
@@ -0,0 +1,88 @@
+import io
+import json
+import os
+
+import pytest
+from rapidfuzz import fuzz, process, utils
+
+from core.buildings import (Building, BuildingIndex, get_building_index, iter_json_array, load_buildings,
+                            match_building_names)
+
+RAW = [
+    {"name": "West Hall", "street_address": "1 West St", "latlng": [43.0701, -89.4096]},
+    {"name": "East Hall", "street_address": "1 East St", "latlng": [43.0790, -89.3990]},
+    {"name": "Engineering Hall", "street_address": "1415 Engineering Dr", "latlng": [43.0721, -89.4101]},
+    {"name": "Memorial Union", "street_address": "800 Langdon St", "latlng": [43.0762, -89.3999]},
+    {"name": "Storage Annex", "street_address": None, "latlng": None},
+    {"street_address": "No name here"},
+]
+
+
+def _write_buildings(path, rows=RAW) -> str:
+    path.write_text(json.dumps(rows, indent=2))
+    return str(path)
+
+
+def test_exact_fuzzy_and_unmatched_names(tmp_path):
+    index = get_building_index(load_buildings(_write_buildings(tmp_path / "buildings.json")))
+    assert len(index) == 5
+    result = index.match(["  west hall ", "MEMORIAL-UNION!", "enginering hall", "Moon Base"])
+    assert result["exact_matches"] == {"  west hall ": "West Hall"}
+    assert result["best_matches"] == {"MEMORIAL-UNION!": "Memorial Union", "enginering hall": "Engineering Hall"}
+    assert result["unmatched"] == ["Moon Base"]
+    assert all(len(names) == 4 for names in result["suggestions"].values())
+
+    assert index.coordinates("east hall") == {"lat": 43.0790, "long": -89.3990}
+    assert index.coordinates("Storage Annex") == {"error": "Coordinates not available for this building."}
+    assert index.coordinates("Moon Base") == {"error": "No matching building found."}
+
+
+def test_batched_scores_match_the_per_name_lookup(tmp_path):
+    buildings = load_buildings(_write_buildings(tmp_path / "buildings.json"))
+    index = BuildingIndex(buildings)
+    queries = ["east hal", "Engineerign", "union memorial", "annex storage", "Hall"]
+    result = match_building_names(queries, index)
+    for query in queries:
+        name, score, _ = process.extractOne(query, index.names, scorer=fuzz.WRatio, processor=utils.default_process)
+        if score >= 80:
+            assert result["best_matches"][query] == name
+        else:
+            assert query in result["unmatched"]
+
+
+def test_streamed_array_matches_json_load():
+    text = json.dumps(RAW * 20)
+    for chunk_size in (1, 7, 4096):
+        assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == RAW * 20
+    assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+    with pytest.raises(ValueError, match="JSON array"):
+        list(iter_json_array(io.StringIO('{"name": "West Hall"}')))
+    with pytest.raises(ValueError, match="closing"):
+        list(iter_json_array(io.StringIO(text[:-1])))
+
+
+def test_loaded_buildings_are_cached_until_the_file_changes(tmp_path):
+    path = _write_buildings(tmp_path / "buildings.json")
+    buildings = load_buildings(path)
+    assert load_buildings(path) is buildings
+    assert get_building_index(buildings) is get_building_index(buildings)
+
+    _write_buildings(tmp_path / "buildings.json", RAW[:2])
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    reloaded = load_buildings(path)
+    assert reloaded is not buildings and [b["name"] for b in reloaded] == ["West Hall", "East Hall"]
+    with pytest.raises(FileNotFoundError):
+        load_buildings(str(tmp_path / "missing.json"))
+
+
+def test_building_records_act_like_dicts():
+    building = Building("West Hall", "1 West St", 43.0701, -89.4096)
+    assert building["name"] == "West Hall" and building.get("lat") == 43.0701
+    assert building.get("floor") is None and "long" in building
+    assert dict(building) == building.to_dict() == {"name": "West Hall", "street_address": "1 West St",
+                                                    "lat": 43.0701, "long": -89.4096}
+    assert json.loads(json.dumps(building.to_dict()))["long"] == -89.4096
+    with pytest.raises(KeyError):
+        building["floor"]
+    with pytest.raises(AttributeError):
+        building.floor = 3
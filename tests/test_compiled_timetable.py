@@ -0,0 +1,111 @@
+import random
+
+import numpy as np
+import pytest
+
+from conftest import BASE_LAT, BASE_LON, LAT_STEP, LON_STEP, N_LINES, STOPS_PER_LINE
+from core import route_planner
+from core.compiled_timetable import (CompiledTimetable, SortedPositions, attach_compiled_timetable,
+                                     compiled_timetable_path)
+from core.delay_overlay import DelayOverlay
+from core.footpaths import get_footpaths
+from core.gtfs_parser import get_current_route_patterns, get_route_patterns, load_gtfs_files
+from core.timetable import get_timetable_index
+
+DAYS = ("monday", "tuesday", "saturday")
+
+
+@pytest.fixture(scope="module")
+def parsed_and_compiled(feed_folder, tmp_path_factory):
+    cache_dir = str(tmp_path_factory.mktemp("cache"))
+    # The first load parses and compiles; the second maps the compiled file
+    parsed = load_gtfs_files(feed_folder, cache_dir, precompile=True)
+    compiled = load_gtfs_files(feed_folder, cache_dir)
+    return parsed, compiled
+
+
+def _patterns_by_trips(patterns):
+    return {tuple(str(t) for t in p.trip_ids): p for p in patterns}
+
+
+def test_compiled_arrays_match_parsed(parsed_and_compiled):
+    parsed, compiled = parsed_and_compiled
+    a, b = get_timetable_index(parsed["stop_times"]), get_timetable_index(compiled["stop_times"])
+    # Views into the read-only mapping, so the second load really came from the compiled file
+    assert not b.arrival_secs.flags.writeable
+    for name in ("trip_offsets", "stop_codes", "stop_sequences", "arrival_secs", "departure_secs"):
+        assert np.array_equal(getattr(a, name), getattr(b, name)), name
+    assert [str(t) for t in a.trip_ids] == [str(t) for t in b.trip_ids]
+    for x, y in zip(get_footpaths(parsed), get_footpaths(compiled)):
+        assert np.array_equal(x, y)
+
+    for day in DAYS:
+        expected = _patterns_by_trips(get_route_patterns(parsed, day))
+        actual = _patterns_by_trips(get_route_patterns(compiled, day))
+        assert expected.keys() == actual.keys()
+        for trips, pattern in expected.items():
+            other = actual[trips]
+            assert pattern.route_id == other.route_id
+            assert np.array_equal(pattern.stops, other.stops)
+            assert np.array_equal(pattern.arrivals, other.arrivals)
+            assert np.array_equal(pattern.departures, other.departures)
+
+
+def test_compiled_and_parsed_plan_the_same_journeys(parsed_and_compiled):
+    parsed, compiled = parsed_and_compiled
+    rng = random.Random(22)
+    for _ in range(25):
+        points = [{"lat": BASE_LAT + rng.uniform(0, (N_LINES - 1) * LAT_STEP),
+                   "long": BASE_LON + rng.uniform(0, (STOPS_PER_LINE - 1) * LON_STEP)} for _ in range(2)]
+        day = rng.choice(DAYS)
+        arrive_by = rng.randrange(8 * 3600, 20 * 3600, 60)
+        for mode in route_planner.PLANNER_MODES:
+            assert (route_planner.plan_journeys(*points, day, arrive_by, parsed, mode=mode) ==
+                    route_planner.plan_journeys(*points, day, arrive_by, compiled, mode=mode))
+
+
+def _departures(patterns, trip_id):
+    return patterns.pattern_for_trip(trip_id).departures[patterns.trip_rows[trip_id][1]]
+
+
+def test_days_sharing_a_layer_get_their_own_patterns(feed_folder, tmp_path):
+    load_gtfs_files(feed_folder, str(tmp_path), precompile=True)
+    gtfs_data = load_gtfs_files(feed_folder, str(tmp_path))
+    monday, tuesday = get_route_patterns(gtfs_data, "monday"), get_route_patterns(gtfs_data, "tuesday")
+    assert monday is not tuesday
+
+    trip_id = "H2-WK-0-36090"
+    before = _departures(tuesday, trip_id).copy()
+    DelayOverlay(gtfs_data, "monday").apply({trip_id: (600, [])})
+    assert np.array_equal(_departures(get_current_route_patterns(gtfs_data, "monday"), trip_id), before + 600)
+    assert np.array_equal(_departures(get_current_route_patterns(gtfs_data, "tuesday"), trip_id), before)
+    assert np.array_equal(_departures(monday, trip_id), before)
+
+
+def test_routing_only_load_maps_the_file_without_stop_times(parsed_and_compiled, feed_folder, tmp_path):
+    parsed, _ = parsed_and_compiled
+    load_gtfs_files(feed_folder, str(tmp_path), precompile=True)
+    routing = load_gtfs_files(feed_folder, str(tmp_path), routing_only=True)
+    assert len(routing["stop_times"]) == 0
+    assert routing["stop_times"].attrs["compiled_timetable"] == compiled_timetable_path(str(tmp_path))
+
+    expected, timetable = get_timetable_index(parsed["stop_times"]), get_timetable_index(routing["stop_times"])
+    assert isinstance(timetable.trip_position, SortedPositions)
+    assert len(timetable.trip_position) == len(expected.trip_position)
+    assert all(timetable.trip_position[trip_id] == pos for trip_id, pos in expected.trip_position.items())
+    assert timetable.trip_position.get("no-such-trip") is None and "zzz" not in timetable.trip_position
+    assert np.array_equal(timetable.stops_for_trip("H2-WK-0-36090"), expected.stops_for_trip("H2-WK-0-36090"))
+
+    west = {"lat": BASE_LAT, "long": BASE_LON}
+    east = {"lat": BASE_LAT + 6 * LAT_STEP, "long": BASE_LON + 10 * LON_STEP}
+    for mode in route_planner.PLANNER_MODES:
+        assert (route_planner.plan_journeys(west, east, "monday", 9 * 3600, parsed, mode=mode) ==
+                route_planner.plan_journeys(west, east, "monday", 9 * 3600, routing, mode=mode))
+
+
+def test_attach_refuses_a_feed_with_its_own_indexes(feed_folder, tmp_path):
+    load_gtfs_files(feed_folder, str(tmp_path), precompile=True)
+    gtfs_data = load_gtfs_files(feed_folder, None)
+    get_timetable_index(gtfs_data["stop_times"])
+    with pytest.raises(ValueError, match="timetable_index"):
+        attach_compiled_timetable(gtfs_data, CompiledTimetable(compiled_timetable_path(str(tmp_path))))
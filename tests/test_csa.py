@@ -0,0 +1,59 @@
+import random
+
+from core import route_planner
+from core.csa import ConnectionTable
+from core.footpaths import DEFAULT_TRANSFER_RADIUS_M
+from core.timetable import get_timetable_index
+from tests.conftest import assert_feasible
+
+
+def test_latest_departure_credits_access_stop_reachable_on_foot(gtfs_data):
+    # S3_0 is an access stop and also a short walk from the destination, so walking already sets
+    # its latest departure; the bus from it to S3_6 must still be found
+    table = ConnectionTable(gtfs_data, "monday")
+    code = table.stop_code
+    deadline = 10 * 3600
+    journey = table.latest_departure({code["S3_0"]: 60}, {code["S3_0"]: 300, code["S3_6"]: 0}, deadline)
+
+    # Latest H3 eastbound trip from S3_0 that reaches S3_6 in time; the journey may leave later
+    # still by walking on to a stop further along the line
+    timetable = get_timetable_index(gtfs_data["stop_times"])
+    latest_trip = 0
+    for trip_id in timetable.trip_ids:
+        trip_slice = timetable.trip_slice(trip_id)
+        if str(trip_id).startswith("H3-WK-0-") and timetable.arrival_secs[trip_slice][6] <= deadline:
+            latest_trip = max(latest_trip, int(timetable.departure_secs[trip_slice][0]))
+
+    assert journey is not None
+    assert journey["rides"] >= 1
+    assert journey["departure_secs"] >= latest_trip - 60
+    assert_feasible(journey, gtfs_data, DEFAULT_TRANSFER_RADIUS_M)
+
+
+def test_csa_and_raptor_agree_on_latest_departure(gtfs_data):
+    stops = gtfs_data["stops"]
+    rng = random.Random(11)
+    compared = 0
+    for _ in range(40):
+        a, b = (stops.iloc[rng.randrange(len(stops))] for _ in range(2))
+        origin = {"lat": a.stop_lat + 0.0004, "long": a.stop_lon}
+        destination = {"lat": b.stop_lat - 0.0004, "long": b.stop_lon}
+        if route_planner.haversine_distance_meters(origin["lat"], origin["long"], destination["lat"],
+                                                   destination["long"]) <= 500:
+            continue
+        arrive_by = rng.randrange(8 * 3600, 20 * 3600)
+        by_mode = {}
+        for mode in route_planner.PLANNER_MODES:
+            options = route_planner.plan_journeys(origin, destination, "monday", arrive_by, gtfs_data,
+                                                  max_walking_distance=500, max_rides=6, mode=mode)
+            for option in options:
+                assert option["arrival_secs"] <= arrive_by
+                assert_feasible(option, gtfs_data, DEFAULT_TRANSFER_RADIUS_M)
+            by_mode[mode] = max((option["departure_secs"] for option in options), default=None)
+
+        assert (by_mode["csa"] is None) == (by_mode["raptor"] is None)
+        if by_mode["csa"] is not None:
+            # RAPTOR binary searches the departure to the minute; CSA is exact
+            assert 0 <= by_mode["csa"] - by_mode["raptor"] < 60
+            compared += 1
+    assert compared > 20
@@ -0,0 +1,91 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import write_synthetic_feed
+from core.compiled_timetable import CompiledTimetable, compiled_timetable_path
+from core.csa import get_connection_table
+from core.delay_overlay import DelayOverlay
+from core.feed_reload import reload_feed
+from core.gtfs_parser import (get_current_route_patterns, get_route_patterns, load_gtfs_files,
+                              read_gtfs_folder)
+from core.plan_cache import PlanCache
+from core.raptor import get_raptor_data
+
+DELAYED_TRIP = "H2-WK-0-36090"
+CHANGED_TRIP = "V5-WK-0-36300"
+
+
+def _departures(patterns, trip_id):
+    return np.asarray(patterns.pattern_for_trip(trip_id).departures[patterns.trip_rows[trip_id][1]])
+
+
+def _shift_trip(folder, trip_id, secs):
+    path = os.path.join(folder, "stop_times.txt")
+    stop_times = pd.read_csv(path, dtype=str)
+    rows = stop_times["trip_id"] == trip_id
+    for column in ("arrival_time", "departure_time"):
+        seconds = stop_times.loc[rows, column].map(lambda t: sum(int(x) * f for x, f in zip(t.split(":"), (3600, 60, 1))))
+        stop_times.loc[rows, column] = [f"{s // 3600:02}:{s % 3600 // 60:02}:{s % 60:02}" for s in seconds + secs]
+    stop_times.to_csv(path, index=False)
+
+
+def test_delays_survive_a_reload_once_and_stay_out_of_static_data(tmp_path):
+    folder, cache_dir = str(tmp_path / "feed"), str(tmp_path / "cache")
+    write_synthetic_feed(folder)
+    gtfs_data = load_gtfs_files(folder, cache_dir)
+    scheduled = _departures(get_route_patterns(gtfs_data, "monday"), DELAYED_TRIP).copy()
+    raptor_data = get_raptor_data(gtfs_data, "monday")
+
+    overlay = DelayOverlay(gtfs_data, "monday")
+    assert overlay.apply({DELAYED_TRIP: (600, [])}) == {DELAYED_TRIP}
+    assert np.array_equal(_departures(get_current_route_patterns(gtfs_data, "monday"), DELAYED_TRIP),
+                          scheduled + 600)
+    assert np.array_equal(_departures(get_route_patterns(gtfs_data, "monday"), DELAYED_TRIP), scheduled)
+    assert raptor_data.patterns is get_current_route_patterns(gtfs_data, "monday")
+
+    _shift_trip(folder, CHANGED_TRIP, 120)
+    diff = reload_feed(gtfs_data, folder, cache_dir)
+    assert CHANGED_TRIP in diff.changed_trips and "H2" not in diff.affected_routes
+    assert np.array_equal(_departures(get_route_patterns(gtfs_data, "monday"), DELAYED_TRIP), scheduled)
+
+    # The reload is picked up by the first refresh; a second one must not add the delay again
+    for _ in range(2):
+        overlay.refresh(force=True)
+        assert np.array_equal(_departures(get_current_route_patterns(gtfs_data, "monday"), DELAYED_TRIP),
+                              scheduled + 600)
+        assert np.array_equal(_departures(get_raptor_data(gtfs_data, "monday").patterns, DELAYED_TRIP),
+                              scheduled + 600)
+    table = get_connection_table(gtfs_data, "monday")
+    trip_departures = table.dep_secs[table.trip == table.timetable.trip_position[DELAYED_TRIP]]
+    assert int(trip_departures.min()) == int(scheduled[0]) + 600
+
+    compiled = CompiledTimetable(compiled_timetable_path(cache_dir))
+    assert np.array_equal(_departures(compiled.route_patterns("monday"), DELAYED_TRIP), scheduled)
+    assert np.array_equal(_departures(compiled.route_patterns("monday"), CHANGED_TRIP),
+                          _departures(get_route_patterns(gtfs_data, "monday"), CHANGED_TRIP))
+
+
+def test_unreadable_updates_are_counted_once_and_then_replaced(feed_folder, tmp_path, capsys):
+    # A feed of its own, as the delays are laid over the shared gtfs_data fixture's patterns otherwise
+    gtfs_data = read_gtfs_folder(feed_folder)
+    path = tmp_path / "trip_updates.json"
+    path.write_text("{not json")
+    plan_cache = PlanCache(gtfs_folder=None)
+    plan_cache.put(("West Hall", "East Hall", "monday", 600, 800.0, 2, "raptor"),
+                   [{"legs": [{"type": "ride", "trip_id": DELAYED_TRIP}]}])
+    plan_cache.put(("West Hall", "East Hall", "monday", 660, 800.0, 2, "raptor"),
+                   [{"legs": [{"type": "ride", "trip_id": CHANGED_TRIP}]}])
+    overlay = DelayOverlay(gtfs_data, "monday", path=str(path), plan_cache=plan_cache)
+    for _ in range(2):
+        assert overlay.refresh(force=True) == set()
+    assert overlay.errors == 1 and "Ignoring unreadable trip updates" in overlay.last_error
+    assert capsys.readouterr().out.count("Ignoring unreadable trip updates") == 1
+
+    path.write_text(json.dumps({"entity": [{"trip_update": {"trip": {"trip_id": DELAYED_TRIP}, "delay": 300}}]}))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert overlay.refresh(force=True) == {DELAYED_TRIP}
+    # Only the plan riding the delayed trip is dropped
+    assert len(plan_cache) == 1 and plan_cache.invalidations == 1
@@ -0,0 +1,74 @@
+import pytest
+
+from conftest import BASE_LAT, BASE_LON, LAT_STEP, LON_STEP
+from core.delay_overlay import DelayOverlay
+from core.departure_board import DepartureBoard, get_departure_board
+from core.gtfs_parser import read_gtfs_folder
+from core.stop_index import get_stop_index
+from utils.time_utils import gtfs_times_to_seconds
+
+DELAYED_TRIP = "H2-WK-0-36090"
+NEXT_TRIP = "H2-WK-0-36690"
+
+
+def _expected(gtfs_data, stop_id: str, after: int):
+    stop_times = gtfs_data["stop_times"].copy()
+    stop_times["trip_id"] = stop_times["trip_id"].astype(str)
+    # Last stops are arrivals only
+    last = stop_times.groupby("trip_id")["stop_sequence"].transform("max")
+    rows = stop_times[(stop_times["stop_id"].astype(str) == stop_id) & (stop_times["stop_sequence"] < last) &
+                      stop_times["trip_id"].str.contains("-WK-")]
+    departures = sorted(zip(gtfs_times_to_seconds(rows["departure_time"]).tolist(), rows["trip_id"]))
+    return [(secs, trip_id) for secs, trip_id in departures if secs >= after]
+
+
+@pytest.fixture
+def gtfs_data(feed_folder):
+    # Delays are laid over the patterns, so each test gets a feed of its own
+    return read_gtfs_folder(feed_folder)
+
+
+def test_next_departures_match_the_stop_times(gtfs_data):
+    board = DepartureBoard(gtfs_data, "Monday")
+    for stop_id, after in (("S0_3", 9 * 3600), ("S3_5", "12:34:56"), ("S7_11", 6 * 3600)):
+        after_secs = after if isinstance(after, int) else 12 * 3600 + 34 * 60 + 56
+        expected = _expected(gtfs_data, stop_id, after_secs)
+        departures = board.next_departures(stop_id, after, n=8)
+        assert [d["departure_secs"] for d in departures] == [secs for secs, _ in expected[:8]]
+        assert all(d["stop_id"] == stop_id and d["route_id"] in d["route"] for d in departures)
+
+    first = board.next_departures("S0_3", 9 * 3600, n=1)[0]
+    # A departure exactly at the requested time is included
+    assert board.next_departures("S0_3", first["departure_secs"], n=1) == [first]
+    assert board.next_departures("S0_3", 23 * 3600) == []
+    assert board.next_departures("missing", 0) == []
+    # Last stops of every trip are arrivals, so the western end of line 0 only has eastbound departures
+    assert {d["headsign"] for d in board.next_departures("S0_0", 0, n=50)} == {"EAST END", "EAST END EXPRESS"}
+
+
+def test_delays_rebuild_the_board_with_ties_in_trip_order(gtfs_data):
+    board = get_departure_board(gtfs_data, "monday")
+    before = {d["trip_id"]: d["departure_secs"] for d in board.next_departures("S2_4", 10 * 3600, n=10)}
+    assert DELAYED_TRIP in before and NEXT_TRIP in before
+
+    # Ten minutes late, the trip departs every stop together with the next one on its route
+    DelayOverlay(gtfs_data, "monday").apply({DELAYED_TRIP: (600, [])})
+    delayed = get_departure_board(gtfs_data, "monday")
+    assert delayed is not board
+    departures = delayed.next_departures("S2_4", 10 * 3600, n=10)
+    times = {d["trip_id"]: d["departure_secs"] for d in departures}
+    assert times[DELAYED_TRIP] == before[DELAYED_TRIP] + 600 == times[NEXT_TRIP]
+    tied = [d["trip_id"] for d in departures if d["departure_secs"] == times[NEXT_TRIP]]
+    assert len(tied) == 2 and tied == sorted(tied, key=delayed.trip_ids.index)
+    assert [d["departure_secs"] for d in departures] == sorted(d["departure_secs"] for d in departures)
+
+
+def test_board_near_a_point_merges_the_stops(gtfs_data):
+    board = get_departure_board(gtfs_data, "monday")
+    lat, lng = BASE_LAT + 3 * LAT_STEP, BASE_LON + 5 * LON_STEP
+    merged = board.next_departures_near(gtfs_data["stops"], lat, lng, 200, "08:00:00", n=10)
+    assert len(merged) == 10
+    assert [d["departure_secs"] for d in merged] == sorted(d["departure_secs"] for d in merged)
+    nearby = {stop["stop_id"] for stop in get_stop_index(gtfs_data["stops"]).nearby_stops(lat, lng, 200)}
+    assert {d["stop_id"] for d in merged} <= nearby and len(nearby) > 1
+    assert all(d["distance"] <= 200 for d in merged)
@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+
+from utils.distance import (haversine_distance, haversine_distance_matrix, haversine_distance_matrix_meters,
+                            haversine_distances, haversine_distances_meters)
+
+
+def _points(n: int, seed: int):
+    rng = random.Random(seed)
+    # Campus-sized offsets plus a few far-apart and antipodal-ish points
+    points = [(43.07 + rng.uniform(-0.02, 0.02), -89.41 + rng.uniform(-0.03, 0.03)) for _ in range(n)]
+    return points + [(0.0, 0.0), (-43.07, 90.59), (89.9, 10.0), (43.07, -89.41)]
+
+
+def test_one_to_many_matches_the_scalar_formula():
+    lat, lon = 43.0700, -89.4100
+    points = _points(50, seed=3)
+    lats, lons = [p[0] for p in points], [p[1] for p in points]
+    expected = np.array([haversine_distance(lat, lon, p_lat, p_lon) for p_lat, p_lon in points])
+
+    assert np.allclose(haversine_distances(lat, lon, lats, lons), expected, rtol=1e-12, atol=1e-9)
+    assert np.allclose(haversine_distances_meters(lat, lon, lats, lons), expected * 1000, rtol=1e-12, atol=1e-6)
+    as_float32 = haversine_distances_meters(lat, lon, lats, lons, dtype=np.float32)
+    assert as_float32.dtype == np.float32
+    # Single precision is still well within a meter over campus distances
+    near = expected < 10
+    assert np.allclose(as_float32[near], expected[near] * 1000, atol=1.0)
+
+
+def test_matrix_matches_the_scalar_formula():
+    rows, cols = _points(7, seed=4), _points(11, seed=5)
+    matrix = haversine_distance_matrix([p[0] for p in rows], [p[1] for p in rows],
+                                       [p[0] for p in cols], [p[1] for p in cols])
+    assert matrix.shape == (len(rows), len(cols))
+    for i, (lat1, lon1) in enumerate(rows):
+        for j, (lat2, lon2) in enumerate(cols):
+            assert np.isclose(matrix[i, j], haversine_distance(lat1, lon1, lat2, lon2), rtol=1e-12, atol=1e-9)
+
+    meters = haversine_distance_matrix_meters([rows[0][0]], [rows[0][1]], [rows[0][0]], [rows[0][1]])
+    assert meters.shape == (1, 1) and meters[0, 0] == 0
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import pandas as pd
+
+from core.compiled_timetable import compiled_timetable_path
+from core.feed_cache import compute_feed_fingerprint, load_snapshot, save_snapshot
+from core.gtfs_parser import load_gtfs_files, read_gtfs_folder
+
+
+def test_snapshot_round_trip_keeps_tables_and_dtypes(feed_folder, tmp_path):
+    gtfs_data = read_gtfs_folder(feed_folder)
+    fingerprint = compute_feed_fingerprint(feed_folder)
+    save_snapshot(str(tmp_path), fingerprint, gtfs_data)
+
+    loaded = load_snapshot(str(tmp_path), fingerprint)
+    assert sorted(loaded) == sorted(gtfs_data)
+    for key, df in gtfs_data.items():
+        pd.testing.assert_frame_equal(loaded[key], df)
+    assert isinstance(loaded["stop_times"]["trip_id"].dtype, pd.CategoricalDtype)
+    assert "stop_times" not in load_snapshot(str(tmp_path), fingerprint, skip=("stop_times",))
+    assert load_snapshot(str(tmp_path), "stale") is None
+    assert load_snapshot(str(tmp_path / "empty"), fingerprint) is None
+
+
+def test_fingerprint_covers_the_folder_and_its_files(feed_folder, tmp_path):
+    copy = str(tmp_path / "copy")
+    # copytree keeps sizes and modification times, so only the folder path differs
+    shutil.copytree(feed_folder, copy)
+    fingerprint = compute_feed_fingerprint(copy)
+    assert fingerprint != compute_feed_fingerprint(feed_folder)
+    assert fingerprint == compute_feed_fingerprint(copy + os.sep)
+
+    path = os.path.join(copy, "routes.txt")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert compute_feed_fingerprint(copy) != fingerprint
+
+
+def test_corrupt_snapshot_falls_back_to_the_csvs(feed_folder, tmp_path, capsys):
+    cache_dir = str(tmp_path)
+    expected = load_gtfs_files(feed_folder, cache_dir)
+    fingerprint = compute_feed_fingerprint(feed_folder)
+    with open(os.path.join(cache_dir, "trips.pkl"), "wb") as f:
+        f.write(b"not a pickle")
+    assert load_snapshot(cache_dir, fingerprint) is None
+    assert "Ignoring unreadable GTFS snapshot" in capsys.readouterr().out
+
+    reparsed = load_gtfs_files(feed_folder, cache_dir)
+    pd.testing.assert_frame_equal(reparsed["trips"], expected["trips"])
+    # The re-parse rewrote the snapshot
+    pd.testing.assert_frame_equal(load_snapshot(cache_dir, fingerprint)["trips"], expected["trips"])
+
+
+def test_compiling_at_load_is_opt_in(feed_folder, tmp_path):
+    cache_dir = str(tmp_path)
+    load_gtfs_files(feed_folder, cache_dir)
+    assert not os.path.exists(compiled_timetable_path(cache_dir))
+    load_gtfs_files(feed_folder, cache_dir, precompile=True)
+    assert os.path.exists(compiled_timetable_path(cache_dir))
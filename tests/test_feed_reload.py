@@ -0,0 +1,138 @@
+import os
+
+import pandas as pd
+
+from conftest import write_synthetic_feed
+from core.feed_reload import apply_feed_diff, diff_feeds, reload_feed
+from core.gtfs_parser import get_route_patterns, read_gtfs_folder
+from core.raptor import get_raptor_data
+from core.route_index import get_route_index
+from utils.memo import peek_cached
+
+REMOVED = "H2-WK-0-36090"
+COPIED = "V5-WK-0-36300"
+ADDED = "V5-WK-0-99999"
+
+
+def _edit(folder: str, name: str, edit) -> None:
+    path = os.path.join(folder, f"{name}.txt")
+    edit(pd.read_csv(path, dtype=str)).to_csv(path, index=False)
+
+
+def _swap_trips(trips: pd.DataFrame) -> pd.DataFrame:
+    added = trips[trips["trip_id"] == COPIED].assign(trip_id=ADDED)
+    return pd.concat([trips[trips["trip_id"] != REMOVED], added], ignore_index=True)
+
+
+def _swap_stop_times(stop_times: pd.DataFrame) -> pd.DataFrame:
+    added = stop_times[stop_times["trip_id"] == COPIED].assign(trip_id=ADDED)
+    return pd.concat([stop_times[stop_times["trip_id"] != REMOVED], added], ignore_index=True)
+
+
+def _loaded_feed(folder: str):
+    write_synthetic_feed(folder)
+    old_data = read_gtfs_folder(folder)
+    get_route_patterns(old_data, "monday")
+    return old_data
+
+
+def test_added_and_removed_trips_only_rebuild_their_routes(tmp_path):
+    folder = str(tmp_path)
+    old_data = _loaded_feed(folder)
+    old_patterns = peek_cached(old_data["stop_times"], "route_patterns:monday")
+    _edit(folder, "trips", _swap_trips)
+    _edit(folder, "stop_times", _swap_stop_times)
+
+    new_data = read_gtfs_folder(folder)
+    diff = diff_feeds(old_data, new_data)
+    assert diff.added_trips == {ADDED} and diff.removed_trips == {REMOVED}
+    assert diff.changed_trips == set() and diff.changed_services == set()
+    assert diff.affected_routes == {"H2", "V5"} and not diff.stops_changed
+
+    apply_feed_diff(old_data, new_data, diff)
+    assert not diff.full_rebuild
+    patterns = peek_cached(new_data["stop_times"], "route_patterns:monday")
+    for pattern in patterns:
+        carried = any(pattern is old for old in old_patterns)
+        assert carried == (pattern.route_id not in diff.affected_routes)
+    assert ADDED in patterns.trip_rows and REMOVED not in patterns.trip_rows
+    # The patched patterns hold exactly the trips a fresh build of the new feed would
+    assert set(patterns.trip_rows) == set(get_route_patterns(read_gtfs_folder(folder), "monday").trip_rows)
+
+
+def test_calendar_dates_changes_affect_every_route_of_the_service(tmp_path):
+    folder = str(tmp_path)
+    old_data = _loaded_feed(folder)
+    pd.DataFrame([{"service_id": "WE", "date": 20261019, "exception_type": 1}]).to_csv(
+        os.path.join(folder, "calendar_dates.txt"), index=False)
+
+    new_data = read_gtfs_folder(folder)
+    diff = diff_feeds(old_data, new_data)
+    assert diff.changed_services == {"WE"}
+    assert not (diff.added_trips or diff.removed_trips or diff.changed_trips)
+    # Only the east-west routes run weekend trips
+    assert diff.affected_routes == {f"H{line}" for line in range(8)}
+
+    old_data["calendar_dates"] = new_data["calendar_dates"]
+    assert diff_feeds(old_data, new_data).is_empty()
+
+
+def test_moved_stops_drop_the_footpaths(tmp_path):
+    folder = str(tmp_path)
+    old_data = _loaded_feed(folder)
+    get_raptor_data(old_data, "monday")
+    _edit(folder, "stops", lambda stops: stops.assign(
+        stop_lat=stops["stop_lat"].where(stops["stop_id"] != "S3_4", "43.0751")))
+
+    new_data = read_gtfs_folder(folder)
+    diff = diff_feeds(old_data, new_data)
+    assert diff.stops_changed and not diff.affected_routes
+    apply_feed_diff(old_data, new_data, diff)
+    assert peek_cached(old_data["stop_times"], "footpaths:250") is not None
+    assert peek_cached(new_data["stop_times"], "footpaths:250") is None
+    # No route changed, so every pattern is carried over as is
+    old_patterns = peek_cached(old_data["stop_times"], "route_patterns:monday")
+    assert list(peek_cached(new_data["stop_times"], "route_patterns:monday")) == list(old_patterns)
+
+
+def test_full_rebuild_when_nothing_can_be_reused(tmp_path):
+    folder = str(tmp_path)
+    write_synthetic_feed(folder)
+    unbuilt = read_gtfs_folder(folder)
+    diff = diff_feeds(unbuilt, read_gtfs_folder(folder))
+    assert diff.is_empty()
+    new_data = read_gtfs_folder(folder)
+    apply_feed_diff(unbuilt, new_data, diff)
+    assert diff.full_rebuild and peek_cached(new_data["stop_times"], "route_patterns:monday") is None
+
+    old_data = _loaded_feed(folder)
+    # A stop the old timetable has never seen cannot keep the old stop codes
+    _edit(folder, "stops", lambda stops: pd.concat(
+        [stops, stops[stops["stop_id"] == "S0_0"].assign(stop_id="NEW")], ignore_index=True))
+    _edit(folder, "stop_times", lambda stop_times: stop_times.assign(
+        stop_id=stop_times["stop_id"].where(stop_times["trip_id"] != REMOVED, "NEW")))
+    new_data = read_gtfs_folder(folder)
+    diff = diff_feeds(old_data, new_data)
+    assert diff.changed_trips == {REMOVED} and diff.stops_changed
+    apply_feed_diff(old_data, new_data, diff)
+    assert diff.full_rebuild and peek_cached(new_data["stop_times"], "route_patterns:monday") is None
+    assert diff.summary()["full_rebuild"]
+
+
+def test_reload_warms_the_indexes_before_the_swap(tmp_path):
+    folder = str(tmp_path)
+    gtfs_data = _loaded_feed(folder)
+    get_raptor_data(gtfs_data, "monday")
+    get_route_index(gtfs_data)
+    _edit(folder, "trips", _swap_trips)
+    _edit(folder, "stop_times", _swap_stop_times)
+
+    diff = reload_feed(gtfs_data, folder, cache_dir=None)
+    assert diff.summary()["added_trips"] == 1
+    stop_times = gtfs_data["stop_times"]
+    assert ADDED in set(stop_times["trip_id"].astype(str))
+    assert peek_cached(stop_times, "raptor:monday") is not None
+    assert peek_cached(stop_times, "route_index") is not None
+    # Days and indexes the old feed had not built are still left for first use
+    assert peek_cached(stop_times, "raptor:tuesday") is None
+    assert peek_cached(stop_times, "csa:monday") is None
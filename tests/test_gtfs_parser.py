@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import write_synthetic_feed
+from core.gtfs_parser import (build_route_patterns, get_route_for_trip, get_route_patterns, load_stop_times_for_trips,
+                              read_gtfs_folder, split_fifo)
+from core.timetable import TimetableIndex, get_timetable_index
+
+TRIP = "H2-WK-0-36090"
+
+
+def _add_ghost_stop(folder: str) -> pd.DataFrame:
+    path = os.path.join(folder, "stop_times.txt")
+    stop_times = pd.read_csv(path, dtype=str)
+    ghost = stop_times[stop_times["trip_id"] == TRIP].iloc[[0]].assign(stop_id="GHOST", stop_sequence="999")
+    stop_times = pd.concat([stop_times, ghost], ignore_index=True)
+    stop_times.to_csv(path, index=False)
+    return stop_times
+
+
+def test_unknown_stops_are_dropped_with_a_warning(tmp_path, capsys):
+    folder = str(tmp_path)
+    write_synthetic_feed(folder)
+    raw = _add_ghost_stop(folder)
+
+    gtfs_data = read_gtfs_folder(folder, service_days=["monday"])
+    stop_times = gtfs_data["stop_times"]
+    assert "Dropped 1 stop_times rows" in capsys.readouterr().out
+    assert stop_times["stop_id"].notna().all() and "GHOST" not in stop_times["stop_id"].astype(str).values
+    assert (stop_times["trip_id"].astype(str) == TRIP).sum() == (raw["trip_id"] == TRIP).sum() - 1
+
+    timetable = TimetableIndex(stop_times)
+    assert timetable.stops_for_trip(TRIP).tolist() == raw.loc[raw["trip_id"] == TRIP, "stop_id"].tolist()[:-1]
+
+
+def test_service_days_filter_the_trips(tmp_path):
+    folder = str(tmp_path)
+    write_synthetic_feed(folder)
+    raw = pd.read_csv(os.path.join(folder, "stop_times.txt"), dtype=str)
+
+    for days, service in ((["monday"], "-WK-"), (["saturday"], "-WE-")):
+        trips = set(read_gtfs_folder(folder, service_days=days)["stop_times"]["trip_id"].astype(str))
+        expected = {trip_id for trip_id in raw["trip_id"] if service in trip_id}
+        assert trips == expected
+    both = read_gtfs_folder(folder, service_days=["monday", "sunday"])["stop_times"]
+    assert len(both) == len(raw)
+
+    nothing = load_stop_times_for_trips(os.path.join(folder, "stop_times.txt"), [])
+    assert nothing.empty and "trip_id" in nothing
+
+
+def test_rows_without_a_stop_stay_out_of_the_index(tmp_path):
+    folder = str(tmp_path)
+    write_synthetic_feed(folder)
+    stop_times = read_gtfs_folder(folder)["stop_times"]
+    expected = TimetableIndex(stop_times).stops_for_trip(TRIP).tolist()
+
+    first = stop_times.index[stop_times["trip_id"].astype(str) == TRIP][0]
+    stop_times.loc[first, "stop_id"] = None
+    timetable = TimetableIndex(stop_times)
+    assert timetable.stops_for_trip(TRIP).tolist() == expected[1:]
+    assert timetable.stop_codes.min() >= 0
+
+
+def test_route_names_agree_on_both_paths(gtfs_data):
+    trips = gtfs_data["trips"].copy()
+    trips["trip_headsign"] = trips["trip_headsign"].astype(object)
+    trips.loc[trips["trip_id"].astype(str) == TRIP, "trip_headsign"] = None
+    patterns = build_route_patterns(trips, [TRIP, "V5-WK-0-36300"], get_timetable_index(gtfs_data["stop_times"]))
+
+    for trip_id in (TRIP, "V5-WK-0-36300"):
+        p, row = patterns.trip_rows[trip_id]
+        from_pattern = get_route_for_trip(trip_id, trips, gtfs_data["routes"], patterns[p], row)
+        assert from_pattern == get_route_for_trip(trip_id, trips, gtfs_data["routes"], patterns[p])
+        assert from_pattern == get_route_for_trip(trip_id, trips, gtfs_data["routes"])
+        assert "nan" not in from_pattern
+    assert get_route_for_trip("missing", trips, gtfs_data["routes"]) == "Trip ID 'missing' not found."
+
+
+def test_fifo_split_keeps_overtaken_trips_apart():
+    # Row 1 leaves after row 0 but arrives first; row 2 follows row 0 without overtaking it
+    arrivals = np.array([[0, 600, 1200], [120, 400, 700], [300, 900, 1500]])
+    assert split_fifo(arrivals, arrivals + 20) == [[0, 2], [1]]
+    assert split_fifo(arrivals[[0, 2]], arrivals[[0, 2]]) == [[0, 1]]
+    assert split_fifo(arrivals[:0], arrivals[:0]) == []
+
+
+def test_express_trips_get_their_own_patterns(gtfs_data):
+    patterns = get_route_patterns(gtfs_data, "monday")
+    for pattern in patterns:
+        assert np.all(np.diff(pattern.departures, axis=0) >= 0), pattern.route_id
+        assert np.all(np.diff(pattern.arrivals, axis=0) >= 0), pattern.route_id
+
+    eastbound = [pattern for pattern in patterns
+                 if pattern.route_id == "H0" and set(pattern.headsigns) & {"EAST END", "EAST END EXPRESS"}]
+    assert len(eastbound) >= 2
+    express = [p for p in eastbound if "EAST END EXPRESS" in set(p.headsigns)]
+    # In this feed each express trip overtakes the regular trips around it, so none share a pattern
+    assert all(set(p.headsigns) == {"EAST END EXPRESS"} for p in express)
+
+    trips = gtfs_data["trips"]
+    active = trips.loc[trips["service_id"].astype(str) == "WK", "trip_id"].astype(str)
+    assert sorted(patterns.trip_rows) == sorted(active)
+    assert sum(len(pattern) for pattern in patterns) == len(active)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from conftest import BASE_LAT, BASE_LON, LAT_STEP, LON_STEP
+from core.buildings import BuildingIndex
+from core.csa import UNREACHED
+from core.isochrone import compute_isochrone
+from utils.distance import estimate_walking_seconds, haversine_distance_meters
+
+BUILDINGS = BuildingIndex([
+    {"name": "West Hall", "lat": BASE_LAT + 0.0001, "long": BASE_LON + 0.0004},
+    {"name": "East Hall", "lat": BASE_LAT + 6 * LAT_STEP, "long": BASE_LON + 10 * LON_STEP},
+    {"name": "Far Annex", "lat": BASE_LAT + 1.0, "long": BASE_LON},
+    {"name": "Storage Annex", "lat": None, "long": None},
+])
+DEPARTURE = 9 * 3600
+
+
+@pytest.fixture(scope="module")
+def isochrone(gtfs_data):
+    return compute_isochrone("West Hall", "monday", "09:00:00", gtfs_data, BUILDINGS)
+
+
+def test_thresholds_follow_the_arrival_times(isochrone):
+    assert isochrone.departure_secs == DEPARTURE
+    arrivals = dict(zip(isochrone.stop_ids.tolist(), isochrone.stop_arrival_secs.tolist()))
+    reached = {stop: secs for stop, secs in arrivals.items() if secs != UNREACHED}
+    assert len(reached) > 10 and isochrone.stops_within(0).size == 0
+
+    for minutes in (5, 10, 20, 40):
+        within = set(isochrone.stops_within(minutes).tolist())
+        assert within == {stop for stop, secs in reached.items() if secs <= DEPARTURE + minutes * 60}
+    # A stop is inside exactly from the minute it is reached
+    stop, secs = max(reached.items(), key=lambda item: item[1])
+    assert stop in isochrone.stops_within((secs - DEPARTURE) / 60)
+    assert stop not in isochrone.stops_within((secs - DEPARTURE - 1) / 60)
+
+
+def test_buildings_take_the_faster_of_walking_and_riding(isochrone, gtfs_data):
+    arrivals = dict(zip(isochrone.building_names.tolist(), isochrone.building_arrival_secs.tolist()))
+    assert set(arrivals) == {"West Hall", "East Hall", "Far Annex"}
+    stops = gtfs_data["stops"].set_index(gtfs_data["stops"]["stop_id"].astype(str))
+    stop_arrivals = dict(zip(isochrone.stop_ids.tolist(), isochrone.stop_arrival_secs.tolist()))
+    origin = BUILDINGS.get("West Hall")
+    for name, arrival in arrivals.items():
+        building = BUILDINGS.get(name)
+        best = DEPARTURE + estimate_walking_seconds(haversine_distance_meters(
+            origin["lat"], origin["long"], building["lat"], building["long"]))
+        for stop_id, secs in stop_arrivals.items():
+            meters = haversine_distance_meters(stops.at[stop_id, "stop_lat"], stops.at[stop_id, "stop_lon"],
+                                               building["lat"], building["long"])
+            if secs != UNREACHED and meters <= 800 and secs + estimate_walking_seconds(meters) < best:
+                best = secs + estimate_walking_seconds(meters)
+        assert arrival == pytest.approx(best, abs=1), name
+
+    assert arrivals["West Hall"] == DEPARTURE
+    assert isochrone.buildings_within(0).tolist() == ["West Hall"]
+    assert "East Hall" in isochrone.buildings_within((arrivals["East Hall"] - DEPARTURE) / 60)
+    assert "Far Annex" not in isochrone.buildings_within(120)
+
+
+def test_budget_only_cuts_what_is_beyond_it(isochrone, gtfs_data):
+    bounded = compute_isochrone("West Hall", "monday", DEPARTURE, gtfs_data, BUILDINGS, max_minutes=10)
+    assert np.array_equal(np.sort(bounded.stops_within(10)), np.sort(isochrone.stops_within(10)))
+    assert np.array_equal(np.sort(bounded.buildings_within(10)), np.sort(isochrone.buildings_within(10)))
+    assert len(bounded.stops_within(60)) < len(isochrone.stops_within(60))
+
+    with pytest.raises(ValueError, match="Storage Annex"):
+        compute_isochrone("Storage Annex", "monday", DEPARTURE, gtfs_data, BUILDINGS)
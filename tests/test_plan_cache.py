@@ -0,0 +1,68 @@
+import os
+
+from conftest import write_synthetic_feed
+from core.plan_cache import PlanCache
+
+
+def _plan(trip_id: str):
+    return [{"legs": [{"type": "walk"}, {"type": "ride", "trip_id": trip_id}]}]
+
+
+def _key(cache: PlanCache, destination: str, arrival_secs: int = 9 * 3600):
+    return cache.key("West Hall", destination, "Monday", arrival_secs, 800, 2, "raptor")
+
+
+def test_least_recently_used_plans_are_evicted_first():
+    cache = PlanCache(max_entries=2, gtfs_folder=None)
+    a, b, c = _key(cache, "A"), _key(cache, "B"), _key(cache, "C")
+    cache.put(a, _plan("T1"))
+    cache.put(b, _plan("T2"))
+    assert cache.get(a) == _plan("T1")
+    cache.put(c, _plan("T3"))
+    assert cache.get(b) is None and cache.get(a) is not None and cache.get(c) is not None
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1, "evictions": 1, "invalidations": 0,
+                             "hit_rate": 0.75}
+    # The evicted plan no longer counts as riding its trip
+    assert "T2" not in cache.trip_entries
+
+
+def test_keys_bucket_arrivals_and_plans_are_copied():
+    cache = PlanCache(gtfs_folder=None)
+    assert _key(cache, "A", 9 * 3600 + 10) == _key(cache, "A", 9 * 3600 + 50) != _key(cache, "A", 9 * 3600 + 60)
+    assert cache.bucket_start(9 * 3600 + 50) == 9 * 3600
+    home = {"lat": 43.070012, "long": -89.410049}
+    assert cache.key(home, "A", "monday", 0, 800, 2, "raptor")[0] == (43.07, -89.41)
+
+    calls = []
+    plan = cache.get_or_plan(_key(cache, "A"), lambda: calls.append(1) or _plan("T1"))
+    plan[0]["legs"].clear()
+    assert cache.get_or_plan(_key(cache, "A"), lambda: calls.append(1) or _plan("T1")) == _plan("T1")
+    assert calls == [1]
+
+
+def test_trip_invalidation_only_drops_plans_riding_the_trips():
+    cache = PlanCache(gtfs_folder=None)
+    cache.put(_key(cache, "A"), _plan("T1"))
+    cache.put(_key(cache, "B"), _plan("T2"))
+    cache.put(_key(cache, "C"), [])
+    assert cache.invalidate_trips(["T1", "T9"]) == 1
+    assert cache.get(_key(cache, "A")) is None and cache.get(_key(cache, "B")) is not None
+    assert cache.invalidate_trips(["T9"]) == 0
+    assert cache.invalidations == 1 and len(cache) == 2
+
+
+def test_feed_changes_clear_the_cache_after_the_check_interval(tmp_path):
+    folder = str(tmp_path)
+    write_synthetic_feed(folder)
+    cache = PlanCache(gtfs_folder=folder, check_interval_secs=3600)
+    cache.put(_key(cache, "A"), _plan("T1"))
+    path = os.path.join(folder, "trips.txt")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    # Within the interval the folder is not re-read
+    assert cache.get(_key(cache, "A")) is not None
+
+    cache.check_interval_secs = 0
+    assert cache.get(_key(cache, "A")) is None
+    assert len(cache) == 0 and cache.invalidations == 1
+    cache.put(_key(cache, "A"), _plan("T1"))
+    assert not cache.check_feed() and cache.get(_key(cache, "A")) is not None
@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+
+from core.csa import get_connection_table
+from core.footpaths import DEFAULT_TRANSFER_RADIUS_M, get_footpaths, get_transfer_radius
+from core.gtfs_parser import load_gtfs_files
+from core.raptor import RaptorData, get_raptor_data
+from tests.conftest import assert_feasible
+
+
+def test_query_journeys_are_feasible_without_chained_walks(gtfs_data):
+    raptor_data = RaptorData(gtfs_data, "monday")
+    codes = list(raptor_data.stop_code.values())
+    rng = random.Random(5)
+    found = 0
+    for _ in range(150):
+        origin, destination = rng.sample(codes, 2)
+        departure = rng.randrange(6 * 3600, 20 * 3600)
+        for journey in raptor_data.query({origin: 0}, {destination: 0}, departure, max_rides=4):
+            assert journey["departure_secs"] >= departure
+            assert_feasible(journey, gtfs_data, DEFAULT_TRANSFER_RADIUS_M)
+            found += 1
+    assert found > 100
+
+
+def test_walks_at_most_one_footpath_between_rides(gtfs_data):
+    # Stops along a line are within footpath range of each other, so a search that chains walks
+    # strolls along the line instead of riding it
+    raptor_data = RaptorData(gtfs_data, "monday")
+    code = raptor_data.stop_code
+    for journey in raptor_data.query({code["S0_0"]: 0}, {code["S6_9"]: 0}, 8 * 3600, max_rides=4):
+        footpaths = [leg for leg in journey["legs"] if leg["type"] == "walk" and leg["from_stop"] and leg["to_stop"]]
+        assert len(footpaths) <= journey["rides"] + 1
+        assert_feasible(journey, gtfs_data, DEFAULT_TRANSFER_RADIUS_M)
+
+
+def test_routers_use_the_radius_the_feed_was_loaded_with(feed_folder, tmp_path):
+    gtfs_data = load_gtfs_files(feed_folder, str(tmp_path), transfer_radius=400)
+    assert get_transfer_radius(gtfs_data) == 400
+    wide = get_footpaths(gtfs_data, 400)
+    assert len(wide[1]) > len(get_footpaths(gtfs_data, DEFAULT_TRANSFER_RADIUS_M)[1])
+    assert get_raptor_data(gtfs_data, "monday").foot_targets is wide[1]
+    assert get_connection_table(gtfs_data, "monday").foot_targets is wide[1]
+
+    uncached = load_gtfs_files(feed_folder, None, transfer_radius=400)
+    assert np.array_equal(RaptorData(uncached, "monday").foot_targets, wide[1])
+    assert get_transfer_radius(load_gtfs_files(feed_folder, None, transfer_radius=None)) == DEFAULT_TRANSFER_RADIUS_M
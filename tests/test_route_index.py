@@ -0,0 +1,37 @@
+import random
+
+from conftest import N_LINES, STOPS_PER_LINE, stop_id
+from core import route_planner
+from core.route_index import RouteIndex, get_route_index
+
+
+def _joined(gtfs_data, stop_ids):
+    stop_times, trips = gtfs_data["stop_times"], gtfs_data["trips"]
+    served = stop_times.loc[stop_times["stop_id"].astype(str).isin(stop_ids), "trip_id"].astype(str)
+    return sorted(set(trips.loc[trips["trip_id"].astype(str).isin(served), "route_id"].astype(str)))
+
+
+def test_routes_for_stops_match_the_stop_times_join(gtfs_data):
+    index = RouteIndex(gtfs_data)
+    rng = random.Random(13)
+    all_stops = [stop_id(line, column) for line in range(N_LINES) for column in range(STOPS_PER_LINE)]
+    for _ in range(30):
+        stops = rng.sample(all_stops, rng.randint(1, 6))
+        assert index.routes_for_stops(stops) == _joined(gtfs_data, stops)
+    assert index.routes_for_stops(["S0_1"]) == ["H0", "V1"]
+    assert index.routes_for_stops(["missing"]) == []
+    assert route_planner.get_routes_for_stops(["S3_4", "S3_5"], gtfs_data) == ["H3", "V5"]
+    assert get_route_index(gtfs_data) is get_route_index(gtfs_data)
+
+
+def test_directions_and_stop_patterns(gtfs_data):
+    index = get_route_index(gtfs_data)
+    assert index.route_directions_for_stop("S0_1") == [("H0", 0), ("H0", 1), ("V1", 0), ("V1", 1)]
+    assert index.route_directions_for_stop("missing") == []
+
+    # The H0 express trips run the same stops as the regular eastbound ones, so they add no pattern
+    eastbound = [stop_id(0, column) for column in range(STOPS_PER_LINE)]
+    assert sorted(index.stop_patterns_for_route("H0")) == sorted([eastbound, eastbound[::-1]])
+    assert index.stop_patterns_for_route("V5")[0] in ([stop_id(line, 5) for line in range(N_LINES)],
+                                                      [stop_id(line, 5) for line in reversed(range(N_LINES))])
+    assert index.stop_patterns_for_route("missing") == []
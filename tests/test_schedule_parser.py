@@ -0,0 +1,80 @@
+import pandas as pd
+
+from conftest import BASE_LAT, BASE_LON, LAT_STEP, LON_STEP
+from core import schedule_parser
+from core.buildings import BuildingIndex
+from core.headless import AutoAcceptRules, plan_schedule
+
+BUILDINGS = [
+    {"name": "West Hall", "lat": BASE_LAT + 0.0001, "long": BASE_LON + 0.0004},
+    {"name": "East Hall", "lat": BASE_LAT + 6 * LAT_STEP, "long": BASE_LON + 10 * LON_STEP},
+    {"name": "Storage Annex", "lat": None, "long": None},
+]
+
+ROWS = [
+    {"course_code": "CS 100", "class_name": "Intro", "day": " Monday", "start_time": "08:00:00",
+     "end_time": "08:50:00", "building": "West Hall"},
+    {"course_code": "CS 200", "class_name": "Data", "day": "monday", "start_time": "10:00:00",
+     "end_time": "10:50:00", "building": "East Hall"},
+    {"course_code": "CS 300", "class_name": "Bad day", "day": "someday", "start_time": "10:00:00",
+     "end_time": "10:50:00", "building": "East Hall"},
+    {"course_code": "CS 400", "class_name": "Bad time", "day": "tuesday", "start_time": "25:00:00",
+     "end_time": "10:50:00", "building": "East Hall"},
+    {"course_code": "CS 500", "class_name": "Backwards", "day": "tuesday", "start_time": "11:00:00",
+     "end_time": "10:00:00", "building": "West Hall"},
+    {"course_code": "CS 600", "class_name": "Lab", "day": "tuesday", "start_time": "13:00:00",
+     "end_time": "14:00:00", "building": "Storage Annex"},
+    {"course_code": "CS 700", "class_name": "Seminar", "day": "tuesday", "start_time": "15:00:00",
+     "end_time": "16:00:00", "building": "Moon Base"},
+]
+
+
+def test_frame_validation_matches_the_row_rules():
+    validated, errors = schedule_parser.validate_schedule_frame(pd.DataFrame(ROWS))
+    expected = schedule_parser.validate_schedule_data([dict(row) for row in ROWS])
+    assert validated["course_code"].tolist() == [row["course_code"] for row in expected]
+    assert validated["day"].tolist() == [row["day"] for row in expected]
+    assert validated["start_secs"].tolist() == [row["start_secs"] for row in expected]
+    assert validated["end_secs"].tolist() == [row["end_secs"] for row in expected]
+    assert errors["row"].tolist() == [2, 3, 4]
+    assert errors["reason"].tolist() == ["Invalid day", "Invalid time format", "Start time is not before end time"]
+
+
+def test_unique_names_and_attached_coordinates():
+    validated, _ = schedule_parser.validate_schedule_frame(pd.DataFrame(ROWS))
+    assert schedule_parser.unique_building_names(validated) == ["West Hall", "East Hall", "Storage Annex", "Moon Base"]
+
+    mapping = {"West Hall": "West Hall", "East Hall": "East Hall", "Storage Annex": "Storage Annex"}
+    placed, errors = schedule_parser.attach_official_buildings(validated, mapping, BuildingIndex(BUILDINGS))
+    assert placed["course_code"].tolist() == ["CS 100", "CS 200"]
+    assert placed["lat"].tolist() == [BUILDINGS[0]["lat"], BUILDINGS[1]["lat"]]
+    assert errors["building"].tolist() == ["Storage Annex", "Moon Base"]
+    assert errors["reason"].tolist() == ["Coordinates not available for this building.", "No matching building found."]
+
+
+def test_plan_schedule_reports_every_problem(gtfs_data):
+    result = plan_schedule(ROWS, gtfs_data, BuildingIndex(BUILDINGS), rules=AutoAcceptRules(accept_fuzzy=False))
+    assert result["errors"] == [
+        "3 schedule rows have an invalid day or time.",
+        "Building 'Moon Base' could not be matched to any known building.",
+        "Error attaching coordinates for 'Storage Annex': Coordinates not available for this building."
+    ]
+    assert sorted(result["plan"]) == ["monday 08:00:00", "monday 10:00:00"]
+    assert result["plan"]["monday 10:00:00"]["course_code"] == "CS 200"
+    # A DataFrame, as read by load_schedule_frame, plans the same as the equivalent rows
+    frame = pd.DataFrame(ROWS)
+    assert plan_schedule(frame, gtfs_data, BuildingIndex(BUILDINGS),
+                         rules=AutoAcceptRules(accept_fuzzy=False)) == result
+    assert plan_schedule([], gtfs_data, BuildingIndex(BUILDINGS)) == {"plan": {}, "building_mapping": {}, "errors": []}
+
+
+def test_rows_without_a_building_are_skipped_with_a_message(gtfs_data, tmp_path):
+    path = tmp_path / "schedule.csv"
+    path.write_text("course_code,class_name,day,start_time,end_time,building\n"
+                    "CS 100,Intro,monday,08:00:00,08:50:00,West Hall\n"
+                    "CS 200,Data,monday,10:00:00,10:50:00,\n")
+    frame = schedule_parser.load_schedule_frame(str(path))
+    result = plan_schedule(frame, gtfs_data, BuildingIndex(BUILDINGS))
+    assert result["errors"] == ["1 schedule rows have no building and were skipped."]
+    assert list(result["plan"]) == ["monday 08:00:00"]
+    assert schedule_parser.extract_unique_building_names(schedule_parser.load_schedule(str(path))) == ["West Hall"]
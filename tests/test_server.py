@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import BASE_LAT, BASE_LON, LAT_STEP, LON_STEP
+from core import headless
+from core.server import MAX_BODY_BYTES, PlannerServer
+
+SCHEDULE = [
+    {"course_code": "CS 100", "class_name": "Intro", "day": "monday", "start_time": "09:00:00",
+     "end_time": "09:50:00", "building": "West Hall"},
+    {"course_code": "CS 200", "class_name": "Data", "day": "monday", "start_time": "11:00:00",
+     "end_time": "11:50:00", "building": "East Hall"}
+]
+
+
+async def _exchange(request: bytes, planner: PlannerServer = None) -> bytes:
+    planner = planner or PlannerServer()
+    server = await asyncio.start_server(planner._handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+    return response
+
+
+def _post(path: str, payload) -> bytes:
+    body = json.dumps(payload).encode()
+    return (f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body
+
+
+def _json_body(response: bytes):
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+@pytest.fixture
+def planner(feed_folder, tmp_path):
+    buildings_path = tmp_path / "buildings.json"
+    buildings_path.write_text(json.dumps([
+        {"name": "West Hall", "street_address": "1 West St", "latlng": [BASE_LAT + 0.0001, BASE_LON + 0.0004]},
+        {"name": "East Hall", "street_address": "1 East St",
+         "latlng": [BASE_LAT + 6 * LAT_STEP, BASE_LON + 10 * LON_STEP]}
+    ]))
+    config = (feed_folder, str(tmp_path / "cache"), str(buildings_path))
+    headless.load_state(*config, warm_days=(), travel_matrix_dir=None)
+    # No pool: plans run on the event loop's default thread pool against the state loaded above
+    yield PlannerServer(gtfs_folder=config[0], cache_dir=config[1], buildings_path=config[2])
+    headless._state.clear()
+
+
+def test_malformed_content_length_is_a_bad_request():
+    for value in (b"abc", b"-5", b"1.5"):
+        response = asyncio.run(_exchange(b"POST /plan HTTP/1.1\r\nContent-Length: " + value + b"\r\n\r\n{}"))
+        assert response.startswith(b"HTTP/1.1 400 Bad Request")
+        assert b"Invalid Content-Length" in response
+
+
+def test_oversized_body_is_rejected_with_413():
+    request = f"POST /plan HTTP/1.1\r\nContent-Length: {MAX_BODY_BYTES + 1}\r\n\r\n{{}}".encode()
+    response = asyncio.run(_exchange(request))
+    assert response.startswith(b"HTTP/1.1 413 Payload Too Large")
+    assert b"Connection: close" in response
+
+
+def test_health_over_keep_alive_then_close():
+    response = asyncio.run(_exchange(b"GET /health HTTP/1.1\r\n\r\nGET /health HTTP/1.1\r\nConnection: close\r\n\r\n"))
+    assert response.count(b"HTTP/1.1 200 OK") == 2
+
+
+def test_bad_requests_never_reach_the_planner():
+    cases = [(_post("/plan", {"schedule": [], "max_rides": "two"}), b"400 Bad Request"),
+             (_post("/plan", {"schedule": [], "max_walking_distance": None}), b"400 Bad Request"),
+             (_post("/plan", {"schedule": [], "max_walking_distance": "NaN"}), b"400 Bad Request"),
+             (_post("/plan", {"schedule": [], "max_rides": 0}), b"400 Bad Request"),
+             (_post("/plan", ["not", "an", "object"]), b"400 Bad Request"),
+             (b"POST /plan HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\n\r\n{oops", b"400 Bad Request"),
+             (b"GET /plan HTTP/1.1\r\nConnection: close\r\n\r\n", b"404 Not Found")]
+    planner = PlannerServer()
+    for request, status in cases:
+        response = asyncio.run(_exchange(request, planner))
+        assert response.startswith(b"HTTP/1.1 " + status), response
+    assert planner.errors == len(cases) and planner.plans == 0
+
+
+def test_plan_and_stats(planner):
+    payload = {"schedule": SCHEDULE, "max_walking_distance": "800", "max_rides": 2}
+    for _ in range(2):
+        response = asyncio.run(_exchange(_post("/plan", payload), planner))
+        assert response.startswith(b"HTTP/1.1 200 OK")
+    result = _json_body(response)
+    assert result["errors"] == []
+    assert sorted(result["plan"]) == ["monday 09:00:00", "monday 11:00:00"]
+
+    stats = _json_body(asyncio.run(_exchange(b"GET /stats HTTP/1.1\r\nConnection: close\r\n\r\n", planner)))
+    assert stats["plans"] == 2 and stats["errors"] == 0
+    # The second request is answered from the cache filled by the first
+    assert stats["plan_cache"]["hits"] >= 1 and stats["plan_cache"]["misses"] >= 1
+
+
+def test_reload_swaps_the_pool(planner):
+    response = asyncio.run(_exchange(_post("/reload", {}), planner))
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert planner.reloads == 1 and planner.pool is not None
+    planner.pool.shutdown()
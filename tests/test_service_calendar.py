@@ -0,0 +1,68 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from core.service_calendar import ServiceCalendar, get_service_calendar
+
+WEEKDAY_FLAGS = {"monday": 1, "tuesday": 1, "wednesday": 1, "thursday": 1, "friday": 1, "saturday": 0, "sunday": 0}
+WEEKEND_FLAGS = {day: 1 - flag for day, flag in WEEKDAY_FLAGS.items()}
+
+
+def _calendar(n_extra: int = 0) -> pd.DataFrame:
+    rows = [{"service_id": "WK", **WEEKDAY_FLAGS, "start_date": 20260105, "end_date": 20260131},
+            {"service_id": "WE", **WEEKEND_FLAGS, "start_date": 20260105, "end_date": 20260131}]
+    # Enough extra services to spill the bitset past one byte
+    rows += [{"service_id": f"X{i}", **WEEKDAY_FLAGS, "start_date": 20260112, "end_date": 20260116}
+             for i in range(n_extra)]
+    return pd.DataFrame(rows)
+
+
+def _calendar_dates() -> pd.DataFrame:
+    return pd.DataFrame([
+        {"service_id": "WK", "date": 20260119, "exception_type": 2},
+        {"service_id": "WE", "date": 20260119, "exception_type": 1},
+        {"service_id": "EVENT", "date": 20260124, "exception_type": 1},
+        {"service_id": "EVENT", "date": 20260125, "exception_type": 1}
+    ])
+
+
+def test_bitsets_follow_weekdays_and_date_ranges():
+    calendar = ServiceCalendar(_calendar(n_extra=10))
+    assert calendar.bitsets.shape == (27, 2)
+    assert calendar.first_date == date(2026, 1, 5)
+    assert calendar.services_on_date("20260105").tolist() == ["WK"]
+    assert calendar.services_on_date("2026-01-10").tolist() == ["WE"]
+    assert calendar.services_on_date(date(2026, 1, 12)).tolist() == ["WK"] + [f"X{i}" for i in range(10)]
+    assert calendar.services_on_date(20260119).tolist() == ["WK"]
+    assert calendar.services_on_date("20260104").size == 0
+    assert calendar.services_on_date("20260201").size == 0
+    assert calendar.services_on_weekday("Saturday").tolist() == ["WE"]
+
+
+def test_exception_dates_add_and_remove_services():
+    calendar = ServiceCalendar(_calendar(), _calendar_dates())
+    assert calendar.service_ids.tolist() == ["WK", "WE", "EVENT"]
+    # A holiday Monday runs the weekend service instead
+    assert calendar.services_on_date("20260119").tolist() == ["WE"]
+    assert calendar.services_on_date("20260120").tolist() == ["WK"]
+    assert calendar.services_on_date("20260124").tolist() == ["WE", "EVENT"]
+    assert not calendar.active_mask("20260131")[2]
+    # Services only listed in calendar_dates have no weekday pattern
+    assert "EVENT" not in calendar.services_on_weekday("saturday").tolist()
+
+
+def test_shared_calendar_is_keyed_on_both_tables():
+    calendar_df, calendar_dates_df = _calendar(), _calendar_dates()
+    plain = get_service_calendar(calendar_df)
+    with_dates = get_service_calendar(calendar_df, calendar_dates_df)
+    assert plain is get_service_calendar(calendar_df)
+    assert with_dates is get_service_calendar(calendar_df, calendar_dates_df)
+    assert plain is not with_dates
+
+    other_dates = calendar_dates_df[calendar_dates_df["service_id"] != "WE"]
+    assert get_service_calendar(calendar_df, other_dates).services_on_date("20260119").size == 0
+    other_calendar = _calendar(n_extra=1)
+    assert np.array_equal(get_service_calendar(other_calendar, calendar_dates_df).service_ids,
+                          ["WK", "WE", "X0", "EVENT"])
+    assert with_dates is get_service_calendar(calendar_df, calendar_dates_df)
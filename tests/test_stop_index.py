@@ -0,0 +1,37 @@
+import random
+
+import numpy as np
+
+from conftest import BASE_LAT, BASE_LON, LAT_STEP, LON_STEP, N_LINES, STOPS_PER_LINE
+from core.stop_index import StopIndex, get_stop_index
+from utils.distance import haversine_distance_meters
+
+
+def _brute_force(index: StopIndex, lat: float, lng: float, radius: float):
+    distances = [haversine_distance_meters(lat, lng, index.lats[i], index.lngs[i]) for i in range(len(index))]
+    return {i: d for i, d in enumerate(distances) if d <= radius}
+
+
+def test_query_radius_matches_brute_force(gtfs_data):
+    rng = random.Random(2)
+    for cell_size in (50.0, 250.0, 1000.0):
+        index = StopIndex(gtfs_data["stops"], cell_size=cell_size)
+        for _ in range(40):
+            lat = BASE_LAT + rng.uniform(-2, N_LINES + 1) * LAT_STEP
+            lng = BASE_LON + rng.uniform(-2, STOPS_PER_LINE + 1) * LON_STEP
+            radius = rng.choice([0.0, 60.0, 180.0, 400.0, 900.0])
+            positions, distances = index.query_radius(lat, lng, radius)
+            expected = _brute_force(index, lat, lng, radius)
+            assert set(positions.tolist()) == set(expected)
+            assert np.allclose(distances, [expected[pos] for pos in positions.tolist()])
+            assert np.all(np.diff(distances) >= 0)
+
+
+def test_nearby_stops_and_shared_index(gtfs_data):
+    index = get_stop_index(gtfs_data["stops"])
+    assert get_stop_index(gtfs_data["stops"]) is index
+    nearest = index.nearby_stops(BASE_LAT + 3 * LAT_STEP, BASE_LON + 4 * LON_STEP, 10)
+    assert [stop["stop_id"] for stop in nearest] == ["S3_4"]
+    assert index.position_of("S3_4") == int(np.flatnonzero(index.stop_ids == "S3_4")[0])
+    assert index.position_of("missing") == -1
+    assert index.nearby_stops(BASE_LAT - 1, BASE_LON, 500) == []
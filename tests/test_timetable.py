@@ -0,0 +1,40 @@
+import numpy as np
+
+from core.timetable import TimetableIndex, get_timetable_index
+from utils.time_utils import gtfs_times_to_seconds
+
+
+def test_trip_slices_match_the_stop_times_rows(gtfs_data):
+    stop_times = gtfs_data["stop_times"]
+    # Rows are shuffled so the index has to do the (trip, stop_sequence) sort itself
+    timetable = TimetableIndex(stop_times.sample(frac=1, random_state=4))
+    assert len(timetable) == stop_times["trip_id"].nunique()
+
+    for trip_id, rows in stop_times.groupby(stop_times["trip_id"].astype(str)):
+        rows = rows.sort_values("stop_sequence")
+        trip_slice = timetable.trip_slice(trip_id)
+        assert trip_slice.stop - trip_slice.start == len(rows)
+        assert timetable.stops_for_trip(trip_id).tolist() == rows["stop_id"].astype(str).tolist()
+        assert timetable.stop_sequences[trip_slice].tolist() == rows["stop_sequence"].tolist()
+        assert np.array_equal(timetable.arrivals_for_trip(trip_id), gtfs_times_to_seconds(rows["arrival_time"]))
+        assert np.array_equal(timetable.departures_for_trip(trip_id), gtfs_times_to_seconds(rows["departure_time"]))
+        codes = timetable.stop_codes_for_trip(trip_id)
+        assert timetable.stop_id_values[codes].tolist() == rows["stop_id"].astype(str).tolist()
+
+
+def test_lookups_are_views_and_unknown_trips_are_empty(gtfs_data):
+    timetable = get_timetable_index(gtfs_data["stop_times"])
+    trip_id = str(timetable.trip_ids[3])
+    assert np.shares_memory(timetable.departures_for_trip(trip_id), timetable.departure_secs)
+    assert np.shares_memory(timetable.stop_codes_for_trip(trip_id), timetable.stop_codes)
+    assert timetable.trip_offsets[0] == 0 and timetable.trip_offsets[-1] == len(timetable.stop_codes)
+    assert np.all(np.diff(timetable.trip_offsets) > 0)
+
+    assert timetable.trip_slice("no-such-trip") == slice(0, 0)
+    assert timetable.stops_for_trip("no-such-trip").size == 0
+
+    rebuilt = TimetableIndex.from_arrays(timetable.trip_ids, timetable.trip_offsets, timetable.stop_id_values,
+                                         timetable.stop_codes, timetable.stop_sequences, timetable.arrival_secs,
+                                         timetable.departure_secs)
+    assert rebuilt.trip_slice(trip_id) == timetable.trip_slice(trip_id)
+    assert rebuilt.stops_for_trip(trip_id).tolist() == timetable.stops_for_trip(trip_id).tolist()
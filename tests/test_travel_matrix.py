@@ -0,0 +1,93 @@
+import math
+
+import numpy as np
+import pytest
+
+from conftest import BASE_LAT, BASE_LON, LAT_STEP, LON_STEP
+from core import route_planner
+from core.travel_matrix import UNREACHABLE_MINUTES, build_travel_time_matrix, load_travel_time_matrix
+
+FIRST_BUCKET = 8 * 3600
+BUCKET = 15 * 60
+LAST_BUCKET = 10 * 3600
+
+BUILDINGS = [
+    {"name": "West Hall", "lat": BASE_LAT + 0.0001, "long": BASE_LON + 0.0004},
+    {"name": "East Hall", "lat": BASE_LAT + 6 * LAT_STEP, "long": BASE_LON + 10 * LON_STEP},
+    {"name": "Library", "lat": BASE_LAT + 1 * LAT_STEP, "long": BASE_LON + 2 * LON_STEP},
+    # Half a world away: no stop within walking range and a walk longer than uint16 minutes
+    {"name": "Far Field", "lat": -BASE_LAT, "long": BASE_LON + 180.0},
+]
+
+
+@pytest.fixture(scope="module")
+def matrix(gtfs_data, tmp_path_factory):
+    return build_travel_time_matrix(gtfs_data, BUILDINGS, str(tmp_path_factory.mktemp("matrix")),
+                                    days=["monday", "tuesday", "saturday"], first_bucket_secs=FIRST_BUCKET,
+                                    last_bucket_secs=LAST_BUCKET, bucket_secs=BUCKET, fingerprint="feed-1")
+
+
+def test_bucket_boundaries(matrix):
+    assert matrix.n_buckets == (LAST_BUCKET - FIRST_BUCKET) // BUCKET
+    assert matrix.bucket_of(FIRST_BUCKET - 1) is None
+    assert matrix.bucket_of(FIRST_BUCKET) == 0
+    assert matrix.bucket_of(FIRST_BUCKET + BUCKET - 1) == 0
+    assert matrix.bucket_of(FIRST_BUCKET + BUCKET) == 1
+    assert matrix.bucket_of("09:59:59") == matrix.n_buckets - 1
+    assert matrix.bucket_of(LAST_BUCKET) is None
+    assert matrix.transit_minutes("West Hall", "East Hall", "monday", LAST_BUCKET) is None
+
+
+def test_transit_minutes_match_the_planner(matrix, gtfs_data):
+    west, east = BUILDINGS[0], BUILDINGS[1]
+    answered = 0
+    for bucket in range(matrix.n_buckets):
+        deadline = FIRST_BUCKET + bucket * BUCKET
+        journey = route_planner.plan_journeys(west, east, "monday", deadline, gtfs_data, mode="csa")
+        rides = [option for option in journey if option["rides"]]
+        expected = math.ceil((deadline - rides[0]["departure_secs"]) / 60) if rides else None
+        assert matrix.transit_minutes("West Hall", "East Hall", "monday", deadline + BUCKET - 1) == expected
+        answered += expected is not None
+    assert answered == matrix.n_buckets
+    # Monday and Tuesday run the same services and share a layer; Saturday has its own
+    assert matrix.day_layers["monday"] == matrix.day_layers["tuesday"] != matrix.day_layers["saturday"]
+    assert matrix.transit_minutes("West Hall", "East Hall", "saturday", "09:00:00") is not None
+
+
+def test_unknown_buildings_and_days(matrix):
+    assert matrix.walking_minutes("Nowhere", "East Hall") is None
+    assert matrix.transit_minutes("West Hall", "Nowhere", "monday", "09:00:00") is None
+    assert matrix.transit_minutes("West Hall", "East Hall", "sunday", "09:00:00") is None
+    assert matrix.travel_minutes("Nowhere", "Nowhere", "monday", "09:00:00") is None
+    assert matrix.travel_minutes("Library", "Library", "monday", "09:00:00") == 0
+
+
+def test_unreachable_sentinel_and_overflow(matrix):
+    # No bus reaches a building without stops, and its walk is clipped below the sentinel
+    assert matrix.transit_minutes("West Hall", "Far Field", "monday", "09:00:00") is None
+    assert matrix.walking_minutes("West Hall", "Far Field") == UNREACHABLE_MINUTES - 1
+    assert matrix.travel_minutes("West Hall", "Far Field", "monday", "09:00:00") == UNREACHABLE_MINUTES - 1
+    assert matrix.travel_times.dtype == np.uint16
+    assert (matrix.travel_times[:, :, 3, :3] == UNREACHABLE_MINUTES).all()
+
+
+def test_load_checks_the_fingerprint(matrix, tmp_path):
+    directory = str(tmp_path / "missing")
+    assert load_travel_time_matrix(directory) is None
+    assert load_travel_time_matrix(matrix.directory, "feed-1") is not None
+    assert load_travel_time_matrix(matrix.directory, "feed-2") is None
+
+
+def test_plan_route_suggests_from_the_matrix(matrix, gtfs_data):
+    coords = {b["name"]: {"lat": b["lat"], "long": b["long"]} for b in BUILDINGS}
+    schedule = [{"day": "monday", "start_time": "08:30:00", "building": "West Hall"},
+                {"day": "monday", "start_time": "09:30:00", "building": "East Hall"},
+                {"day": "monday", "start_time": "09:45:00", "building": "West Hall"}]
+    plan = route_planner.plan_route(schedule, coords, gtfs_data, travel_matrix=matrix)
+    walk = matrix.walking_minutes("West Hall", "East Hall")
+    bus = matrix.transit_minutes("West Hall", "East Hall", "monday", "09:30:00")
+    assert plan["monday 09:30:00"]["suggestion"] == ("Walk" if bus is None or walk <= bus else "Take the bus")
+    assert plan["monday 08:30:00"]["suggestion"] is None
+    # Without a matrix the suggestion falls back to the distance rule
+    fallback = route_planner.plan_route(schedule, coords, gtfs_data)
+    assert fallback["monday 09:30:00"]["suggestion"] == "Take the bus"
@@ -0,0 +1,116 @@
+import sqlite3
+import time
+
+from core import route_planner
+from utils import walking_cache
+from utils.distance import FakeDistanceMatrixClient, WalkingTimes, get_walking_distances
+from utils.walking_cache import WalkingTimeCache
+
+ORIGIN = (43.0700, -89.4100)
+
+
+def _points(n, lat=43.0720):
+    return [(lat, -89.4100 + i * 0.0004) for i in range(n)]
+
+
+def test_misses_are_fetched_in_shared_blocks_and_then_served_from_cache():
+    client = FakeDistanceMatrixClient()
+    cache = WalkingTimeCache(":memory:")
+    stops = _points(40)
+    pairs = [(ORIGIN, stop) for stop in stops] + [(stop, ORIGIN) for stop in stops]
+
+    results = get_walking_distances(client, pairs, cache)
+    assert all(results[pair] is not None for pair in pairs)
+    # One origin against 40 stops and 40 stops against one destination take two requests each
+    assert client.requests == 4
+    assert client.elements == 80
+
+    again = get_walking_distances(client, pairs, cache)
+    assert client.requests == 4
+    assert again == results
+    assert cache.hit_rate() == 0.5
+
+
+def test_dense_grid_uses_full_blocks():
+    client = FakeDistanceMatrixClient()
+    origins, destinations = _points(10), _points(10, lat=43.0750)
+    get_walking_distances(client, [(o, d) for o in origins for d in destinations])
+    assert client.requests == 1
+    assert client.elements == 100
+
+
+def test_get_many_handles_more_keys_than_one_statement():
+    cache = WalkingTimeCache(":memory:")
+    pairs = [(ORIGIN, stop) for stop in _points(600)]
+    info = {"distance_text": "0.1 km", "distance_value": 100, "duration_text": "1 min", "duration_value": 77}
+    cache.put_many({cache.key(*pair): info for pair in pairs[:500]})
+    found = cache.get_many(pairs)
+    assert len(found) == 500
+    assert (cache.hits, cache.misses) == (500, 100)
+
+
+def test_expired_and_overflowing_entries_are_evicted():
+    cache = WalkingTimeCache(":memory:", ttl_seconds=3600, max_entries=5)
+    info = {"distance_text": "0.1 km", "distance_value": 100, "duration_text": "1 min", "duration_value": 77}
+    pairs = [(ORIGIN, stop) for stop in _points(8)]
+    cache.put_many({cache.key(*pair): info for pair in pairs})
+    assert len(cache) == 5
+
+    cache.connection.execute("UPDATE walks SET fetched_at = ?", (time.time() - 7200,))
+    assert cache.get_many(pairs) == {}
+    assert cache.evict() == 5
+
+
+def test_planner_walks_use_walking_times(gtfs_data):
+    client = FakeDistanceMatrixClient(detour_factor=1.5)
+    walking_times = WalkingTimes(client, WalkingTimeCache(":memory:"))
+    origin = {"lat": 43.0700, "long": -89.4095}
+    destination = {"lat": 43.0790, "long": -89.3985}
+
+    estimated = route_planner.plan_journeys(origin, destination, "monday", "10:00:00", gtfs_data)
+    options = route_planner.plan_journeys(origin, destination, "monday", "10:00:00", gtfs_data,
+                                          walking_times=walking_times)
+    assert client.requests > 0
+    assert options
+    # Street walks are longer than the straight-line estimate, so the best option leaves earlier
+    best = route_planner.select_best_bus_option(options)
+    assert best["departure_secs"] <= route_planner.select_best_bus_option(estimated)["departure_secs"]
+    first, last = best["legs"][0], best["legs"][-1]
+    assert first["type"] == "walk" and last["type"] == "walk"
+
+    requests = client.requests
+    assert route_planner.plan_journeys(origin, destination, "monday", "10:00:00", gtfs_data,
+                                       walking_times=walking_times) == options
+    assert client.requests == requests
+
+
+def test_pairs_sharing_a_cache_key_are_fetched_once():
+    client = FakeDistanceMatrixClient()
+    cache = WalkingTimeCache(":memory:")
+    stop = (43.0720, -89.4100)
+    # Both origins round to the same 4-decimal key
+    pairs = [(ORIGIN, stop), ((ORIGIN[0] + 0.00001, ORIGIN[1]), stop)]
+    results = get_walking_distances(client, pairs, cache)
+    assert client.elements == 1
+    assert results[pairs[0]] == results[pairs[1]] is not None
+    assert len(cache) == 1
+
+
+def test_locked_database_drops_the_write(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(walking_cache, "BUSY_TIMEOUT_SECONDS", 0.05)
+    path = str(tmp_path / "walks.sqlite")
+    cache = WalkingTimeCache(path)
+    assert cache.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    info = {"distance_text": "0.1 km", "distance_value": 100, "duration_text": "1 min", "duration_value": 77}
+    pairs = [(ORIGIN, stop) for stop in _points(3)]
+
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+    cache.put_many({cache.key(*pair): info for pair in pairs})
+    assert "Could not write walking time cache" in capsys.readouterr().out
+    # Reads still work while another process holds the write lock
+    assert cache.get_many(pairs) == {}
+    other.rollback()
+
+    cache.put_many({cache.key(*pair): info for pair in pairs})
+    assert len(cache.get_many(pairs)) == 3
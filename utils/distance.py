@@ -1,13 +1,24 @@
 import math
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
+import numpy as np
 import googlemaps
 import os
 from dotenv import load_dotenv
 
+from utils.walking_cache import DEFAULT_CACHE_PATH, WalkingTimeCache
+
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Conservative straight-line walking pace used when no Google walking time is available
+WALKING_SPEED_MPS = 1.3
+
+# Google Distance Matrix API per-request limits
+MAX_MATRIX_ORIGINS = 25
+MAX_MATRIX_DESTINATIONS = 25
+MAX_MATRIX_ELEMENTS = 100
+
 # CITE: Haversine Distance Calculation
 # Based on the Haversine formula (Wikipedia, https://en.wikipedia.org/wiki/Haversine_formula)
 # Implemented using a Python snippet from Stack Overflow
@@ -49,6 +60,102 @@ def haversine_distance_meters(lat1: float, lon1: float, lat2: float, lon2:float)
     """
     return haversine_distance(lat1, lon1, lat2, lon2) * 1000
 
+def _haversine_core(lat1, lon1, lat2, lon2, dtype) -> np.ndarray:
+    """
+    Broadcasting haversine shared by the batch functions below; inputs are already arrays of dtype.
+    :return: distance in km with the broadcast shape of the inputs
+    """
+    R = dtype(6371.0)  # Earth's radius in km
+
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    lat_diff = lat2_rad - lat1_rad
+    lon_diff = np.radians(lon2) - np.radians(lon1)
+
+    a = (np.sin(lat_diff / 2) ** 2 +
+         np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(lon_diff / 2) ** 2)
+    # Equivalent to 2 * atan2(sqrt(a), sqrt(1 - a)); clip guards against rounding just above 1
+    c = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    return R * c
+
+
+def haversine_distances(lat: float, lon: float, lats, lons, dtype=np.float64) -> np.ndarray:
+    """
+    Calculate straight-line distances in km from one point to many points in a single vectorized call.
+    :param lat: latitude of the reference point
+    :param lon: longitude of the reference point
+    :param lats: array-like of N latitudes
+    :param lons: array-like of N longitudes
+    :param dtype: np.float64 for full precision or np.float32 to halve memory
+    :return: array of N distances in km
+    """
+    lats = np.asarray(lats, dtype=dtype)
+    lons = np.asarray(lons, dtype=dtype)
+    return _haversine_core(dtype(lat), dtype(lon), lats, lons, dtype)
+
+
+def haversine_distances_meters(lat: float, lon: float, lats, lons, dtype=np.float64) -> np.ndarray:
+    """
+    Calculate straight-line distances in meters from one point to many points in a single vectorized call.
+    :param lat: latitude of the reference point
+    :param lon: longitude of the reference point
+    :param lats: array-like of N latitudes
+    :param lons: array-like of N longitudes
+    :param dtype: np.float64 for full precision or np.float32 to halve memory
+    :return: array of N distances in meters
+    """
+    return haversine_distances(lat, lon, lats, lons, dtype) * dtype(1000)
+
+
+def haversine_distance_matrix(lats1, lons1, lats2, lons2, dtype=np.float64) -> np.ndarray:
+    """
+    Calculate the full M x N matrix of straight-line distances in km between two sets of points,
+    e.g. every campus building against every bus stop.
+    :param lats1: array-like of M latitudes (rows)
+    :param lons1: array-like of M longitudes (rows)
+    :param lats2: array-like of N latitudes (columns)
+    :param lons2: array-like of N longitudes (columns)
+    :param dtype: np.float64 for full precision or np.float32 to halve memory
+    :return: M x N array of distances in km
+    """
+    lats1 = np.asarray(lats1, dtype=dtype)[:, np.newaxis]
+    lons1 = np.asarray(lons1, dtype=dtype)[:, np.newaxis]
+    lats2 = np.asarray(lats2, dtype=dtype)[np.newaxis, :]
+    lons2 = np.asarray(lons2, dtype=dtype)[np.newaxis, :]
+    return _haversine_core(lats1, lons1, lats2, lons2, dtype)
+
+
+def haversine_distance_matrix_meters(lats1, lons1, lats2, lons2, dtype=np.float64) -> np.ndarray:
+    """
+    Calculate the full M x N matrix of straight-line distances in meters between two sets of points.
+    :param lats1: array-like of M latitudes (rows)
+    :param lons1: array-like of M longitudes (rows)
+    :param lats2: array-like of N latitudes (columns)
+    :param lons2: array-like of N longitudes (columns)
+    :param dtype: np.float64 for full precision or np.float32 to halve memory
+    :return: M x N array of distances in meters
+    """
+    matrix = haversine_distance_matrix(lats1, lons1, lats2, lons2, dtype)
+    matrix *= dtype(1000)
+    return matrix
+
+def estimate_walking_seconds(distance_meters: float) -> int:
+    """
+    Estimate walking time for a straight-line distance without calling the Google API.
+    :param distance_meters: distance in meters
+    :return: walking time in whole seconds, rounded up
+    """
+    return int(math.ceil(distance_meters / WALKING_SPEED_MPS))
+
+def estimate_walking_seconds_array(distances_meters) -> np.ndarray:
+    """
+    Vectorized estimate_walking_seconds for arrays of distances, e.g. a building x stop matrix.
+    :param distances_meters: array-like of distances in meters
+    :return: int64 array of walking times in whole seconds, rounded up
+    """
+    return np.ceil(np.asarray(distances_meters) / WALKING_SPEED_MPS).astype(np.int64)
+
 def init_google_client(api_key: str):
     """
     Creates an instance of the Google Maps Distance Matrix API to be used to calculate walking times
@@ -57,7 +164,204 @@ def init_google_client(api_key: str):
     """
     return googlemaps.Client(key=api_key)
 
-def get_walking_distance(gmaps_client, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Dict[str, Any]:
+class FakeDistanceMatrixClient:
+    """
+    Offline stand-in for googlemaps.Client that answers distance_matrix calls from straight-line
+    distances, so walking lookups, batching and cache hit rates can be exercised without an API key.
+    Enforces the same per-request origin/destination/element limits as the real API.
+    """
+
+    def __init__(self, detour_factor: float = 1.25):
+        """
+        :param detour_factor: multiplier from straight-line to street distance
+        """
+        self.detour_factor = detour_factor
+        self.requests = 0
+        self.elements = 0
+
+    def distance_matrix(self, origins, destinations, mode: str = "walking", units: str = "metric"):
+        if len(origins) > MAX_MATRIX_ORIGINS or len(destinations) > MAX_MATRIX_DESTINATIONS:
+            raise ValueError("Too many origins or destinations in one distance_matrix request")
+        if len(origins) * len(destinations) > MAX_MATRIX_ELEMENTS:
+            raise ValueError("Too many elements in one distance_matrix request")
+
+        self.requests += 1
+        self.elements += len(origins) * len(destinations)
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                meters = round(haversine_distance_meters(origin[0], origin[1], destination[0], destination[1])
+                               * self.detour_factor)
+                seconds = estimate_walking_seconds(meters)
+                elements.append({
+                    "status": "OK",
+                    "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+                    "duration": {"text": f"{max(1, round(seconds / 60))} mins", "value": seconds}
+                })
+            rows.append({"elements": elements})
+        return {"status": "OK", "rows": rows}
+
+
+def _fill_block(anchor, block: list, partners: Dict[tuple, set], limit: int) -> list:
+    """
+    :return: anchor followed by up to limit - 1 other points with the most pending pairs into block
+    """
+    block_set = set(block)
+    counts = {point: len(others & block_set) for point, others in partners.items() if point != anchor}
+    ranked = sorted((point for point, count in counts.items() if count), key=lambda point: -counts[point])
+    return [anchor] + ranked[:limit - 1]
+
+
+def _matrix_batches(pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]]):
+    """
+    Packs origin/destination pairs into Distance Matrix requests that respect the API limits.
+    The point with the most pending pairs anchors each request: its counterparts fill one side, and
+    the other side is filled with the points needing the most of them within the element limit. Walks
+    from one origin to many stops, from many stops to one destination and dense grids all pack into
+    full requests, even when mixed in one call.
+    :return: generator of (origin block, destination block)
+    """
+    pending = set(pairs)
+    dests_of: Dict[tuple, set] = {}
+    origins_of: Dict[tuple, set] = {}
+    for origin, destination in pending:
+        dests_of.setdefault(origin, set()).add(destination)
+        origins_of.setdefault(destination, set()).add(origin)
+
+    while pending:
+        origin = max(dests_of, key=lambda point: len(dests_of[point]))
+        destination = max(origins_of, key=lambda point: len(origins_of[point]))
+        if len(dests_of[origin]) >= len(origins_of[destination]):
+            dest_block = sorted(dests_of[origin])[:MAX_MATRIX_DESTINATIONS]
+            limit = min(MAX_MATRIX_ORIGINS, MAX_MATRIX_ELEMENTS // len(dest_block))
+            origin_block = _fill_block(origin, dest_block, dests_of, limit)
+        else:
+            origin_block = sorted(origins_of[destination])[:MAX_MATRIX_ORIGINS]
+            limit = min(MAX_MATRIX_DESTINATIONS, MAX_MATRIX_ELEMENTS // len(origin_block))
+            dest_block = _fill_block(destination, origin_block, origins_of, limit)
+        yield origin_block, dest_block
+
+        for o in origin_block:
+            for d in dest_block:
+                if (o, d) in pending:
+                    pending.discard((o, d))
+                    dests_of[o].discard(d)
+                    origins_of[d].discard(o)
+            if not dests_of[o]:
+                del dests_of[o]
+        for d in dest_block:
+            if d in origins_of and not origins_of[d]:
+                del origins_of[d]
+
+
+def get_walking_distances(gmaps_client, pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]],
+                          cache: Optional[WalkingTimeCache] = None) -> Dict[tuple, Optional[Dict[str, Any]]]:
+    """
+    Get walking distance and time for many origin/destination pairs, serving what it can from the
+    cache and fetching the rest in as few batched Distance Matrix requests as the API limits allow.
+    Misses sharing an origin or a destination share a request, see _matrix_batches, and pairs that
+    round to the same cache key are only fetched once.
+    :param gmaps_client: Google Maps client object (or FakeDistanceMatrixClient)
+    :param pairs: list of ((origin_lat, origin_lng), (dest_lat, dest_lng))
+    :param cache: optional WalkingTimeCache to read from and fill
+    :return: dict of (origin, destination) -> walking info dict, or None where no route was found
+    """
+    results = {}
+    found = cache.get_many(pairs) if cache is not None else {}
+    key = cache.key if cache is not None else lambda origin, destination: (origin, destination)
+    # One pair per distinct key is fetched; the others with that key share its result
+    missing = []
+    waiting: Dict[tuple, list] = {}
+    for origin, destination in pairs:
+        pair_key = key(origin, destination)
+        info = found.get(pair_key)
+        if info is not None:
+            results[(origin, destination)] = info
+            continue
+        if pair_key not in waiting:
+            waiting[pair_key] = []
+            missing.append((origin, destination))
+        waiting[pair_key].append((origin, destination))
+
+    fetched = {}
+    for origin_block, dest_block in _matrix_batches(missing):
+        try:
+            response = gmaps_client.distance_matrix(
+                origins=origin_block,
+                destinations=dest_block,
+                mode="walking",
+                units="metric"
+            )
+        except Exception as e:
+            print(f"Error calculating walking distance: {e}")
+            continue
+        for origin, row in zip(origin_block, response.get("rows", [])):
+            for destination, info in zip(dest_block, row["elements"]):
+                if info["status"] == "OK":
+                    fetched[(origin, destination)] = {
+                        "distance_text": info["distance"]["text"],
+                        "distance_value": info["distance"]["value"],
+                        "duration_text": info["duration"]["text"],
+                        "duration_value": info["duration"]["value"]
+                    }
+
+    fetched_by_key = {key(origin, destination): info for (origin, destination), info in fetched.items()}
+    if cache is not None and fetched_by_key:
+        cache.put_many(fetched_by_key)
+    for pair_key, waiting_pairs in waiting.items():
+        for pair in waiting_pairs:
+            results[pair] = fetched_by_key.get(pair_key)
+    return results
+
+
+class WalkingTimes:
+    """
+    Walking seconds between points from the Distance Matrix API, read through a WalkingTimeCache.
+    Pairs the API has no route for, or that fail to fetch, fall back to estimate_walking_seconds
+    over the straight-line distance, so the planner always gets a time for every pair.
+    """
+
+    def __init__(self, gmaps_client, cache: Optional[WalkingTimeCache] = None):
+        """
+        :param gmaps_client: Google Maps client object (or FakeDistanceMatrixClient)
+        :param cache: optional WalkingTimeCache shared by every lookup
+        """
+        self.gmaps_client = gmaps_client
+        self.cache = cache
+
+    def seconds(self, pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]]) -> List[int]:
+        """
+        :param pairs: list of ((origin_lat, origin_lng), (dest_lat, dest_lng))
+        :return: walking seconds for each pair, in order
+        """
+        results = get_walking_distances(self.gmaps_client, pairs, self.cache)
+        seconds = []
+        for origin, destination in pairs:
+            info = results.get((origin, destination))
+            if info is not None:
+                seconds.append(int(info["duration_value"]))
+            else:
+                seconds.append(estimate_walking_seconds(
+                    haversine_distance_meters(origin[0], origin[1], destination[0], destination[1])))
+        return seconds
+
+
+def get_walking_times(api_key: Optional[str] = GOOGLE_API_KEY,
+                      cache_path: str = DEFAULT_CACHE_PATH) -> Optional[WalkingTimes]:
+    """
+    Creates the Google-backed walking times used by the planner when an API key is configured.
+    :param api_key: Google API key, from the GOOGLE_API_KEY environment variable by default
+    :param cache_path: SQLite file for the WalkingTimeCache
+    :return: WalkingTimes, or None without a key so callers keep the straight-line estimate
+    """
+    if not api_key:
+        return None
+    return WalkingTimes(init_google_client(api_key), WalkingTimeCache(cache_path))
+
+
+def get_walking_distance(gmaps_client, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float,
+                         cache: Optional[WalkingTimeCache] = None) -> Dict[str, Any]:
     """
     Use Google Maps API to get walking distance and time between two points.
     :param gmaps_client: Google Maps client object
@@ -65,25 +369,8 @@ def get_walking_distance(gmaps_client, origin_lat: float, origin_lng: float, des
     :param origin_lng: origin longitude
     :param dest_lat: destination latitude
     :param dest_lng: destination longitude
+    :param cache: optional WalkingTimeCache consulted before calling the API
     :return: dict with distance and duration info or None if error
     """
-    try:
-        result = gmaps_client.distance_matrix(
-            origins=[(origin_lat, origin_lng)],
-            destinations=[(dest_lat, dest_lng)],
-            mode="walking",
-            units="metric"
-        )
-        if result["rows"]:
-            info = result["rows"][0]["elements"][0]
-            if info["status"] == "OK":
-                return {
-                    "distance_text": info["distance"]["text"],
-                    "distance_value": info["distance"]["value"],
-                    "duration_text": info["duration"]["text"],
-                    "duration_value": info["duration"]["value"]
-                }
-        return None
-    except Exception as e:
-        print(f"Error calculating walking distance: {e}")
-        return None
+    pair = ((origin_lat, origin_lng), (dest_lat, dest_lng))
+    return get_walking_distances(gmaps_client, [pair], cache)[pair]
@@ -0,0 +1,50 @@
+import weakref
+from typing import Any, Callable, Dict, Tuple
+
+# (id(source), name) -> (weak reference to source, derived value)
+_derived_values: Dict[Tuple[int, str], Tuple[weakref.ref, Any]] = {}
+
+
+def cached_on(source: Any, name: str, builder: Callable[[Any], Any]) -> Any:
+    """
+    Returns a value derived from source, building it only the first time it is requested for that
+    exact object. Entries are dropped automatically once source is garbage collected, so derived
+    indexes live exactly as long as the DataFrame they were built from.
+    :param source: object the value is derived from, e.g. a GTFS DataFrame
+    :param name: name of the derived value, so one source can hold several
+    :param builder: function called with source to build the value on a miss
+    :return: the cached or newly built value
+    """
+    key = (id(source), name)
+    entry = _derived_values.get(key)
+    if entry is not None and entry[0]() is source:
+        return entry[1]
+
+    value = builder(source)
+    ref = weakref.ref(source, lambda _ref, key=key: _derived_values.pop(key, None))
+    _derived_values[key] = (ref, value)
+    return value
+
+
+def peek_cached(source: Any, name: str) -> Any:
+    """
+    Returns a value already derived from source without building it.
+    :param source: object the value is derived from
+    :param name: name of the derived value
+    :return: the cached value, or None if it was never built
+    """
+    entry = _derived_values.get((id(source), name))
+    if entry is not None and entry[0]() is source:
+        return entry[1]
+    return None
+
+
+def clear_cached(source: Any, name: str = None) -> None:
+    """
+    Drops derived values for source so they are rebuilt on next use, e.g. after source was modified in place.
+    :param source: object the values were derived from
+    :param name: name of a single derived value to drop, or None to drop all of them
+    """
+    for key in list(_derived_values):
+        if key[0] == id(source) and (name is None or key[1] == name):
+            del _derived_values[key]
@@ -1,4 +1,10 @@
-from datetime import time
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Marker for missing times in vectorized results (e.g. non-timepoint stop_times rows)
+MISSING_TIME = -1
 
 def time_to_seconds(time_str: str) -> int:
     """
@@ -37,19 +43,79 @@ def subtract_time(time_str: str, seconds: int) -> str:
 def is_time_before(time_str1: str, time_str2: str) -> bool:
     """
     Returns True if time_str1 is strictly before time_str2.
-    Both strings should be in HH:MM:SS format.
+    Both strings should be in HH:MM:SS format; hours past 24 (GTFS after-midnight times) are allowed.
 
     :param time_str1: First time string
     :param time_str2: Second time string
     :return: True if time_str1 < time_str2, else False
     """
-    parts1 = time_str1.split(":")
-    t1 = time(int(parts1[0]), int(parts1[1]), int(parts1[2]))
+    return time_to_seconds(time_str1) < time_to_seconds(time_str2)
 
-    parts2 = time_str2.split(":")
-    t2 = time(int(parts2[0]), int(parts2[1]), int(parts2[2]))
+def to_seconds(value: Union[str, int]) -> int:
+    """
+    Accepts either an HH:MM:SS string or a value already in seconds, so callers holding
+    pre-parsed integers never go back through string parsing.
+    :param value: time string or seconds
+    :return: total seconds as int
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return time_to_seconds(value)
 
-    return t1 < t2
+def clock_time_to_seconds(time_str: str) -> Optional[int]:
+    """
+    Strictly parses a wall-clock HH:MM:SS time (hour 0-23) as used in class schedules.
+    :param time_str: time string e.g. '10:30:00'
+    :return: total seconds, or None if the string is malformed or out of range
+    """
+    if not isinstance(time_str, str):
+        return None
+    parts = time_str.split(":")
+    if len(parts) != 3:
+        return None
+    try:
+        hour, minute, second = int(parts[0]), int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+    if not (0 <= hour <= 23 and 0 <= minute <= 59 and 0 <= second <= 59):
+        return None
+    return (hour * 3600) + (minute * 60) + second
+
+def clock_times_to_seconds(times) -> np.ndarray:
+    """
+    Vectorized clock_time_to_seconds for a whole column of class times. Each distinct string is
+    parsed once and broadcast back through its factorized codes, like gtfs_times_to_seconds.
+    :param times: Series or array-like of HH:MM:SS strings, possibly with missing values
+    :return: int32 array of seconds, MISSING_TIME where the value is missing, malformed or out of range
+    """
+    codes, uniques = pd.factorize(pd.Series(times, copy=False), use_na_sentinel=True)
+    unique_seconds = np.empty(len(uniques) + 1, dtype=np.int32)
+    for i, time_str in enumerate(uniques):
+        seconds = clock_time_to_seconds(time_str)
+        unique_seconds[i] = MISSING_TIME if seconds is None else seconds
+    # Code -1 (missing) indexes the last slot
+    unique_seconds[-1] = MISSING_TIME
+    return unique_seconds[codes]
+
+def gtfs_times_to_seconds(times) -> np.ndarray:
+    """
+    Converts a whole column of GTFS HH:MM:SS strings to seconds since the start of the service day.
+    Each distinct string is parsed once and broadcast back through its factorized codes, so a
+    stop_times column with millions of rows costs one pass plus a few thousand string parses.
+    Hours past 24 (trips running after midnight) are kept as-is, e.g. 25:10:00 -> 90600.
+    :param times: Series or array-like of time strings, possibly with missing values
+    :return: int32 array of seconds, MISSING_TIME where the value is missing or malformed
+    """
+    codes, uniques = pd.factorize(pd.Series(times, copy=False), use_na_sentinel=True)
+    unique_seconds = np.empty(len(uniques) + 1, dtype=np.int32)
+    for i, time_str in enumerate(uniques):
+        try:
+            unique_seconds[i] = time_to_seconds(str(time_str).strip())
+        except (ValueError, IndexError):
+            unique_seconds[i] = MISSING_TIME
+    # Code -1 (missing) indexes the last slot
+    unique_seconds[-1] = MISSING_TIME
+    return unique_seconds[codes]
 
 def time_difference(start_time: str, end_time: str) -> int:
     """
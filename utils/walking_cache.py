@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+Coordinate = Tuple[float, float]
+PairKey = Tuple[int, int, int, int]
+
+DEFAULT_CACHE_PATH = "data/cache/walking_times.sqlite"
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 200_000
+# 4 decimal places is roughly 10 m, well below the accuracy of a walking estimate
+DEFAULT_PRECISION = 4
+# How long a connection waits for another process's write lock before giving up
+BUSY_TIMEOUT_SECONDS = 10
+# Keys looked up per statement; 4 parameters each stays under the 999 parameter limit of older SQLite builds
+MAX_KEYS_PER_QUERY = 240
+
+
+class WalkingTimeCache:
+    """
+    Persistent SQLite cache of walking distance/duration results keyed by rounded coordinate pairs.
+
+    Entries older than ttl_seconds are treated as misses and purged by evict(), and when the
+    table grows past max_entries the least recently used rows are dropped first.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, precision: int = DEFAULT_PRECISION):
+        """
+        :param db_path: SQLite file path, or ":memory:" for a throwaway cache
+        :param ttl_seconds: how long a cached walk stays valid
+        :param max_entries: max rows kept after eviction
+        :param precision: decimal places coordinates are rounded to before lookup
+        """
+        if db_path != ":memory:" and os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.precision = precision
+        self._scale = 10 ** precision
+        self.hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS walks (
+                origin_lat INTEGER, origin_lng INTEGER, dest_lat INTEGER, dest_lng INTEGER,
+                distance_text TEXT, distance_value INTEGER, duration_text TEXT, duration_value INTEGER,
+                fetched_at REAL, last_used REAL,
+                PRIMARY KEY (origin_lat, origin_lng, dest_lat, dest_lng)
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS walks_last_used ON walks (last_used)")
+        self.connection.commit()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # SQLite connections must not cross a fork, so each worker process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+            if self.db_path != ":memory:":
+                # Readers in other workers no longer block on, or block, a writer
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def _write_failed(self, e: sqlite3.OperationalError) -> None:
+        # The cache only saves API calls, so a write that stays locked past the timeout is dropped
+        self.connection.rollback()
+        print(f"Could not write walking time cache {self.db_path}: {e}")
+
+    def key(self, origin: Coordinate, destination: Coordinate) -> PairKey:
+        """
+        :param origin: (lat, lng) of the origin
+        :param destination: (lat, lng) of the destination
+        :return: integer key of both points rounded to the cache precision
+        """
+        return (round(origin[0] * self._scale), round(origin[1] * self._scale),
+                round(destination[0] * self._scale), round(destination[1] * self._scale))
+
+    def get_many(self, pairs: Iterable[Tuple[Coordinate, Coordinate]]) -> Dict[PairKey, Dict[str, Any]]:
+        """
+        Looks up several origin/destination pairs at once and counts hits and misses.
+        :param pairs: iterable of (origin, destination) coordinate tuples
+        :return: dict of pair key -> walking info for the pairs found and not expired
+        """
+        keys = list(dict.fromkeys(self.key(origin, destination) for origin, destination in pairs))
+        now = time.time()
+        found = {}
+        for i in range(0, len(keys), MAX_KEYS_PER_QUERY):
+            chunk = keys[i:i + MAX_KEYS_PER_QUERY]
+            values = ", ".join(["(?, ?, ?, ?)"] * len(chunk))
+            params = [value for key in chunk for value in key]
+            rows = self.connection.execute(
+                "SELECT origin_lat, origin_lng, dest_lat, dest_lng, distance_text, distance_value, duration_text, "
+                f"duration_value FROM walks WHERE (origin_lat, origin_lng, dest_lat, dest_lng) IN (VALUES {values}) "
+                "AND fetched_at >= ?", (*params, now - self.ttl_seconds)).fetchall()
+            for row in rows:
+                found[tuple(row[:4])] = {
+                    "distance_text": row[4],
+                    "distance_value": row[5],
+                    "duration_text": row[6],
+                    "duration_value": row[7]
+                }
+            hit_keys = [key for key in chunk if key in found]
+            if hit_keys:
+                try:
+                    self.connection.execute(
+                        "UPDATE walks SET last_used = ? WHERE (origin_lat, origin_lng, dest_lat, dest_lng) IN "
+                        f"(VALUES {', '.join(['(?, ?, ?, ?)'] * len(hit_keys))})",
+                        (now, *[value for key in hit_keys for value in key]))
+                except sqlite3.OperationalError as e:
+                    self._write_failed(e)
+        if found:
+            self.connection.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, results: Dict[PairKey, Dict[str, Any]]) -> None:
+        """
+        Stores fetched walking results and evicts old rows if the cache is over its size bound.
+        Results are dropped with a message if the database stays locked by another process.
+        :param results: dict of pair key -> walking info as returned by get_walking_distance
+        """
+        now = time.time()
+        try:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO walks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*key, info["distance_text"], info["distance_value"], info["duration_text"], info["duration_value"],
+                  now, now) for key, info in results.items()])
+            self.connection.commit()
+            if len(self) > self.max_entries:
+                self.evict()
+        except sqlite3.OperationalError as e:
+            self._write_failed(e)
+
+    def evict(self) -> int:
+        """
+        Deletes expired rows, then the least recently used rows beyond max_entries.
+        :return: number of rows deleted
+        """
+        before = len(self)
+        self.connection.execute("DELETE FROM walks WHERE fetched_at < ?", (time.time() - self.ttl_seconds,))
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            self.connection.execute(
+                "DELETE FROM walks WHERE rowid IN (SELECT rowid FROM walks ORDER BY last_used LIMIT ?)", (overflow,))
+        self.connection.commit()
+        return before - len(self)
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM walks").fetchone()[0]
+
+    def hit_rate(self) -> Optional[float]:
+        """
+        :return: fraction of lookups served from the cache, or None before the first lookup
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def close(self) -> None:
+        self.connection.close()
+